@@ -1,12 +1,88 @@
 #!/usr/bin/env python3
 import os
+import re
+import time
 import requests
 import json
+import contextvars
+from collections import deque
+from contextlib import contextmanager
 from http.server import BaseHTTPRequestHandler
 
 # Configuration - points to your main PokeDaddy API
 POKEDADDY_SERVER_URL = os.environ.get("POKEDADDY_SERVER_URL", "https://poke-daddy.vercel.app")
 
+# Tracing - a W3C traceparent header is always sent to the API so its spans join ours.
+# MCP_TRACE_EXPORTER=memory keeps recent spans in RECENT_SPANS, =file appends them to MCP_TRACE_FILE.
+MCP_TRACE_EXPORTER = os.environ.get("MCP_TRACE_EXPORTER", "").lower()
+MCP_TRACE_FILE = os.environ.get("MCP_TRACE_FILE", "/tmp/pokedaddy-mcp-traces.jsonl")
+TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+RECENT_SPANS = deque(maxlen=1000)
+_current_span = contextvars.ContextVar("mcp_current_span", default=None)
+
+def _parse_traceparent(header):
+    match = TRACEPARENT_RE.match((header or "").strip().lower())
+    if not match or match.group(1) == "0" * 32 or match.group(2) == "0" * 16:
+        return None
+    return match.group(1), match.group(2)
+
+def _export_span(span: dict):
+    if MCP_TRACE_EXPORTER == "memory":
+        RECENT_SPANS.append(span)
+    elif MCP_TRACE_EXPORTER == "file":
+        try:
+            with open(MCP_TRACE_FILE, "a") as f:
+                f.write(json.dumps(span) + "\n")
+        except OSError as e:
+            print(f"[MCP] trace export error: {e}")
+
+@contextmanager
+def _span(name: str, kind: str = "internal", attributes: dict = None, parent: tuple = None):
+    """Open a span under `parent` (trace_id, span_id), the current span, or a new trace."""
+    if parent is None:
+        current = _current_span.get()
+        parent = (current["trace_id"], current["span_id"]) if current else (os.urandom(16).hex(), None)
+    span = {
+        "trace_id": parent[0],
+        "span_id": os.urandom(8).hex(),
+        "parent_id": parent[1],
+        "name": name,
+        "kind": kind,
+        "start": time.time(),
+        "end": None,
+        "duration_ms": None,
+        "status": "ok",
+        "attributes": dict(attributes or {}),
+    }
+    started = time.perf_counter()
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span["status"] = "error"
+        span["attributes"]["error"] = repr(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        elapsed = time.perf_counter() - started
+        span["end"] = span["start"] + elapsed
+        span["duration_ms"] = round(elapsed * 1000, 3)
+        _export_span(span)
+
+def _api_request(method: str, path: str, **kwargs):
+    """Call the PokeDaddy API inside a client span, propagating its traceparent.
+    Requests are marked `X-Actor: mcp` so the server's audit log attributes them to the bridge."""
+    url = f"{POKEDADDY_SERVER_URL}{path}"
+    with _span(f"{method} {path}", "client", {"http.method": method, "http.url": url}) as span:
+        headers = dict(kwargs.pop("headers", None) or {})
+        headers["traceparent"] = f"00-{span['trace_id']}-{span['span_id']}-01"
+        headers.setdefault("X-Actor", "mcp")
+        response = requests.request(method, url, headers=headers, **kwargs)
+        span["attributes"]["http.status_code"] = response.status_code
+        if response.status_code >= 500:
+            span["status"] = "error"
+        return response
+
 def health() -> dict:
     return {"status": "ok", "api_target": POKEDADDY_SERVER_URL}
 
@@ -32,8 +108,8 @@ def get_user_blocking_status(user_email: str = "", email: str = "") -> dict:
         if not user_email:
             return {"error": "No user email provided", "valid": False}
 
-        response = requests.get(f"{POKEDADDY_SERVER_URL}/admin/status-by-email",
-                              params={"email": user_email}, timeout=25)
+        response = _api_request("GET", "/admin/status-by-email",
+                                params={"email": user_email}, timeout=25)
         print(f"[MCP] GET {response.url} response: {response.status_code}")
         response.raise_for_status()
         return response.json()
@@ -48,8 +124,11 @@ def end_blocking_session(user_email: str = "", email: str = "", reason: str = ""
         if not user_email:
             return {"error": "No user email provided", "success": False}
 
-        response = requests.post(f"{POKEDADDY_SERVER_URL}/admin/end-blocking-by-email",
-                               params={"email": user_email}, timeout=25)
+        params = {"email": user_email}
+        if reason:
+            params["reason"] = reason
+        response = _api_request("POST", "/admin/end-blocking-by-email",
+                                params=params, timeout=25)
         print(f"[MCP] POST {response.url} response: {response.status_code}")
         response.raise_for_status()
         result = response.json()
@@ -71,8 +150,11 @@ def unblock_app(user_email: str = "", email: str = "", app_bundle_id: str = "",
         if not app_bundle_id:
             return {"error": "No app bundle ID provided", "success": False}
 
-        response = requests.post(f"{POKEDADDY_SERVER_URL}/admin/unblock-app-by-email",
-                               params={"email": user_email, "app_bundle_id": app_bundle_id}, timeout=25)
+        params = {"email": user_email, "app_bundle_id": app_bundle_id}
+        if reason:
+            params["reason"] = reason
+        response = _api_request("POST", "/admin/unblock-app-by-email",
+                                params=params, timeout=25)
         print(f"[MCP] POST {response.url} response: {response.status_code}")
         response.raise_for_status()
         result = response.json()
@@ -98,8 +180,8 @@ def start_blocking_session(user_email: str = "", email: str = "", profile_id: st
         if profile_name:
             params["profile_name"] = profile_name
 
-        response = requests.post(f"{POKEDADDY_SERVER_URL}/admin/start-blocking-by-email",
-                               params=params, timeout=25)
+        response = _api_request("POST", "/admin/start-blocking-by-email",
+                                params=params, timeout=25)
         print(f"[MCP] POST {response.url} response: {response.status_code}")
         response.raise_for_status()
         result = response.json()
@@ -199,6 +281,12 @@ class handler(BaseHTTPRequestHandler):
         self.end_headers()
 
     def do_POST(self):
+        incoming = _parse_traceparent(self.headers.get('traceparent'))
+        with _span("mcp POST", "server", {"http.method": "POST", "http.target": getattr(self, 'path', '')}, incoming):
+            self._handle_post()
+
+    def _handle_post(self):
+        span = _current_span.get()
         try:
             # Check Accept header to determine if client wants SSE format
             accept_header = self.headers.get('Accept', '')
@@ -231,6 +319,7 @@ class handler(BaseHTTPRequestHandler):
             body_json = json.loads(body)
 
             method = body_json.get('method', '')
+            span["name"] = f"mcp {method}"
 
             if method == 'initialize':
                 # MCP initialize handshake - return server capabilities
@@ -264,6 +353,7 @@ class handler(BaseHTTPRequestHandler):
             elif method == 'tools/call':
                 tool_name = body_json.get('params', {}).get('name', '')
                 args = body_json.get('params', {}).get('arguments', {})
+                span["attributes"]["mcp.tool"] = tool_name
 
                 if tool_name in TOOLS:
                     result = TOOLS[tool_name](**args)
@@ -310,6 +400,8 @@ class handler(BaseHTTPRequestHandler):
 
         except Exception as e:
             print(f"[MCP] Handler error: {e}")
+            span["status"] = "error"
+            span["attributes"]["error"] = repr(e)
             self.send_response(500)
             self.send_header('Content-type', 'application/json')
             self.send_header('Access-Control-Allow-Origin', '*')
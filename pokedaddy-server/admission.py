@@ -0,0 +1,162 @@
+"""
+Admission control: per-client rate limits and priority-aware concurrency limits.
+
+Every request is matched (by path, first match wins) to a RouteClass with a
+priority and a token bucket rate. Two checks run before the app sees it:
+
+1. Rate limit: each (route class, client) pair has a token bucket refilled at
+   `rate` tokens per second, holding at most `burst`. An empty bucket gets
+   429 with Retry-After set to when the next token arrives. The client is the
+   user of a verified bearer token on route classes keyed by user (so users
+   behind one NAT don't share a bucket), otherwise the peer address (or the
+   first X-Forwarded-For address from a trusted proxy). Unverified headers are
+   never used as keys, so rotating made-up tokens doesn't get fresh buckets.
+2. Concurrency: at most `max_concurrency` requests are in flight per worker, and
+   lower priorities may only use part of that budget (CRITICAL all of it, NORMAL
+   80%, LOW 50% by default). A request over its share is shed at once with 503
+   and Retry-After instead of queueing, so low-priority bursts can't take the
+   connections critical polls need and shed requests cost almost nothing.
+
+Limits are per worker process; with N workers the effective limits are N times
+higher.
+"""
+
+import json
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+CRITICAL, NORMAL, LOW = 0, 1, 2
+DEFAULT_SHARES = {CRITICAL: 1.0, NORMAL: 0.8, LOW: 0.5}
+
+
+class RouteClass:
+    """`by_user=False` keys the class's buckets by client address even for authenticated requests"""
+
+    def __init__(self, name: str, pattern: str, priority: int, rate: float, burst: float, by_user: bool = True):
+        self.name = name
+        self.regex = re.compile(pattern)
+        self.priority = priority
+        self.rate = rate
+        self.burst = burst
+        self.by_user = by_user
+
+
+def parse_rates(spec: str) -> Dict[str, Tuple[float, float]]:
+    """Parse "register=1/10,admin=5/20" into {name: (rate per second, burst)}; a missing burst equals the rate"""
+    rates = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, value = item.partition("=")
+        rate, _, burst = value.partition("/")
+        rates[name.strip()] = (float(rate), float(burst or rate))
+    return rates
+
+
+class TokenBuckets:
+    """Token buckets by key, keeping the `max_keys` most recently used (a forgotten bucket starts full)."""
+
+    def __init__(self, max_keys: int = 10000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, rate: float, burst: float) -> float:
+        """Take one token; returns 0 if there was one, else the seconds until there will be."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+async def _reject(send, status_code: int, detail: str, retry_after: int):
+    body = json.dumps({"detail": detail}).encode()
+    headers = [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode()),
+        (b"retry-after", str(retry_after).encode()),
+    ]
+    await send({"type": "http.response.start", "status": status_code, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionMiddleware:
+    """ASGI middleware that rate-limits per client and route class and sheds load by priority.
+    `authenticate(token)` returns the user id of a valid bearer token, else None; without it
+    every client is keyed by address.
+    """
+
+    def __init__(self, app, route_classes: List[RouteClass], max_concurrency: int,
+                 shares: Dict[int, float] = None, max_clients: int = 10000, trust_forwarded: bool = False,
+                 authenticate: Optional[Callable[[str], Optional[str]]] = None):
+        self.app = app
+        self.authenticate = authenticate
+        self.route_classes = route_classes
+        self.limits = {
+            priority: max(1, int(max_concurrency * share))
+            for priority, share in (shares or DEFAULT_SHARES).items()
+        }
+        self.trust_forwarded = trust_forwarded
+        self.buckets = TokenBuckets(max_clients)
+        self.in_flight = 0
+        self.throttled = {route.name: 0 for route in route_classes}
+        self.shed = {route.name: 0 for route in route_classes}
+        self._lock = threading.Lock()
+
+    def _client(self, scope, route: RouteClass) -> str:
+        authorization = forwarded = None
+        for name, value in scope.get("headers", ()):
+            if name == b"authorization":
+                authorization = value.decode("latin-1")
+            elif name == b"x-forwarded-for" and self.trust_forwarded:
+                forwarded = value.split(b",")[0].strip().decode("latin-1")
+        if route.by_user and self.authenticate is not None and authorization:
+            scheme, _, token = authorization.partition(" ")
+            user_id = self.authenticate(token.strip()) if scheme.lower() == "bearer" else None
+            if user_id:
+                return f"user:{user_id}"
+        if forwarded:
+            return forwarded
+        client = scope.get("client")
+        return client[0] if client else ""
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        route = next((r for r in self.route_classes if r.regex.search(scope["path"])), None)
+        if route is None:
+            await self.app(scope, receive, send)
+            return
+
+        if route.rate > 0:
+            wait = self.buckets.take((route.name, self._client(scope, route)), route.rate, route.burst)
+            if wait:
+                self.throttled[route.name] += 1
+                await _reject(send, 429, "Too many requests", math.ceil(wait))
+                return
+
+        with self._lock:
+            admitted = self.in_flight < self.limits[route.priority]
+            if admitted:
+                self.in_flight += 1
+        if not admitted:
+            self.shed[route.name] += 1
+            await _reject(send, 503, "Server is busy", 1)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
@@ -0,0 +1,99 @@
+"""
+Append-only audit log with batched inserts.
+
+AuditLog.record only appends the event to an in-memory buffer, so the request path
+pays for a list append instead of a database round trip. A background thread writes
+the buffer with one multi-row INSERT every `flush_interval` seconds, or sooner once
+`max_batch` events are waiting. Timestamps are taken when the event is recorded,
+not when it is written.
+
+If a flush fails, its events go back to the front of the buffer and are retried on
+the next flush. While the database stays down the buffer is capped at `max_buffer`
+events; beyond that the oldest are dropped and counted in `dropped`. Events still
+buffered when the process dies hard are lost. flush() runs at exit and can be
+called directly, e.g. by tests or before reading the log back.
+"""
+
+import atexit
+import logging
+import os
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Optional
+
+logger = logging.getLogger("pokedaddy.audit")
+
+AUDIT_FIELDS = ("created_at", "actor", "action", "user_id", "profile_id", "target", "reason", "details")
+
+
+class AuditLog:
+    def __init__(self, bind, table, max_batch: int = 500, flush_interval: float = 1.0, max_buffer: int = 100000):
+        self.bind = bind
+        self.table = table
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.flushes = 0
+        self.dropped = 0
+        self._buffer = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pid = None
+        atexit.register(self.flush)
+
+    def record(self, action: str, actor: str, user_id: Optional[str] = None, profile_id: Optional[str] = None,
+               target: Optional[str] = None, reason: Optional[str] = None, details: Optional[str] = None):
+        """Buffer one event; it is written by the next flush."""
+        event = {
+            "created_at": datetime.utcnow(), "actor": actor, "action": action, "user_id": user_id,
+            "profile_id": profile_id, "target": target, "reason": reason or None, "details": details,
+        }
+        with self._lock:
+            self._ensure_worker()
+            self._buffer.append(event)
+            self._trim()
+            if len(self._buffer) >= self.max_batch:
+                self._wake.set()
+
+    def flush(self) -> int:
+        """Write everything buffered so far; returns the number of events written."""
+        with self._flush_lock:
+            written = 0
+            while True:
+                with self._lock:
+                    batch = [self._buffer.popleft() for _ in range(min(self.max_batch, len(self._buffer)))]
+                if not batch:
+                    return written
+                try:
+                    with self.bind.begin() as conn:
+                        conn.execute(self.table.insert(), batch)
+                except Exception:
+                    logger.exception("audit flush of %d events failed", len(batch))
+                    with self._lock:
+                        self._buffer.extendleft(reversed(batch))
+                        self._trim()
+                    return written
+                self.flushes += 1
+                written += len(batch)
+
+    def _trim(self):
+        while len(self._buffer) > self.max_buffer:
+            self._buffer.popleft()
+            self.dropped += 1
+
+    def _ensure_worker(self):
+        # Started lazily and per process. A forked worker drops what it inherited from the
+        # parent (the parent writes those) and gets its own flusher thread.
+        if self._pid != os.getpid():
+            if self._pid is not None:
+                self._buffer.clear()
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name="pokedaddy-audit", daemon=True).start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
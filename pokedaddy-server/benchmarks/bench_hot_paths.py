@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the server's hot paths, timed in isolation:
+- verify_token (JWT decode)
+- get_current_user (user lookup by id)
+- ProfileResponse construction with a large restricted_apps list
+- json.loads of the profile JSON columns
+- admin_status_by_email resolution
+- MCP handler.do_POST dispatch (tools/list and a local tools/call)
+
+Results are written as JSON and compared against a stored baseline; the run
+fails when any benchmark's median regresses by more than --max-regression percent,
+and when there is no baseline to compare with unless --save-baseline creates it.
+
+Run:  python benchmarks/bench_hot_paths.py
+      python benchmarks/bench_hot_paths.py --save-baseline
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import io
+import json
+import os
+import pathlib
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+HERE = pathlib.Path(__file__).resolve().parent
+SERVER_DIR = HERE.parent
+MCP_PATH = SERVER_DIR.parent / "pokedaddy-mcp-vercel" / "api" / "mcp.py"
+
+DEFAULT_OUTPUT = HERE / "results.json"
+DEFAULT_BASELINE = HERE / "baseline.json"
+LARGE_APP_COUNT = 2000
+
+
+def time_callable(fn, number, repeat):
+    """Return per-call timings in microseconds for `repeat` rounds of `number` calls."""
+    fn()  # warm up caches, lazy imports and compiled statements
+    rounds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        rounds.append((time.perf_counter() - start) / number * 1e6)
+    return {
+        "median_us": statistics.median(rounds),
+        "min_us": min(rounds),
+        "number": number,
+        "repeat": repeat,
+    }
+
+
+def load_mcp_module():
+    spec = importlib.util.spec_from_file_location("pokedaddy_mcp", MCP_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_mcp_dispatch(mcp, payload):
+    """Build a callable that runs handler.do_POST against in-memory streams."""
+    body = json.dumps(payload).encode()
+
+    class QuietHandler(mcp.handler):
+        def log_message(self, format, *args):
+            pass
+
+    def dispatch():
+        h = QuietHandler.__new__(QuietHandler)
+        h.rfile = io.BytesIO(body)
+        h.wfile = io.BytesIO()
+        h.headers = {"Content-Length": str(len(body)), "Accept": "application/json"}
+        h.request_version = "HTTP/1.1"
+        h.requestline = "POST /mcp HTTP/1.1"
+        h.path = "/mcp"
+        h.command = "POST"
+        h.client_address = ("127.0.0.1", 0)
+        h.do_POST()
+        return h.wfile.getvalue()
+
+    return dispatch
+
+
+def build_benchmarks(main, mcp):
+    from fastapi.security import HTTPAuthorizationCredentials
+    from ids import new_id
+
+    db = main.SessionLocal()
+    suffix = str(int(time.time() * 1000))
+    email = f"bench-{suffix}@example.com"
+
+    token_response = asyncio.run(main.register_user(
+        main.UserCreate(apple_user_id=f"bench-{suffix}", email=email, name="Bench"), db
+    ))
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token_response["access_token"])
+    user_id = main.verify_token(credentials)
+
+    apps = [f"com.example.app{i}" for i in range(LARGE_APP_COUNT)]
+    categories = [f"category{i}" for i in range(50)]
+    profile = db.query(main.UserProfile).filter(main.UserProfile.user_id == user_id).first()
+    profile.restricted_apps = json.dumps(apps)
+    profile.restricted_categories = json.dumps(categories)
+    db.add(main.BlockingSession(id=new_id(), user_id=user_id, profile_id=profile.id, is_active=True))
+    db.commit()
+    db.refresh(profile)
+
+    def profile_response():
+        return main.ProfileResponse(
+            id=profile.id,
+            name=profile.name,
+            icon=profile.icon,
+            restricted_apps=apps,
+            restricted_categories=categories,
+            is_default=profile.is_default,
+            created_at=profile.created_at,
+            updated_at=profile.updated_at,
+            version=profile.version,
+        )
+
+    def status_by_email():
+        db.expire_all()
+        return main.status_by_email(db, email)
+
+    def current_user():
+        db.expire_all()
+        return main.get_current_user(db, user_id)
+
+    apps_column = profile.restricted_apps
+    categories_column = profile.restricted_categories
+
+    benchmarks = {
+        "verify_token": (lambda: main.verify_token(credentials), 2000),
+        "get_current_user": (current_user, 500),
+        "profile_response_large": (profile_response, 200),
+        "json_loads_profile_columns": (lambda: (json.loads(apps_column), json.loads(categories_column)), 500),
+        "admin_status_by_email": (status_by_email, 200),
+        "mcp_do_post_tools_list": (make_mcp_dispatch(mcp, {"jsonrpc": "2.0", "id": 1, "method": "tools/list"}), 2000),
+        "mcp_do_post_tools_call_health": (make_mcp_dispatch(mcp, {
+            "jsonrpc": "2.0", "id": 2, "method": "tools/call", "params": {"name": "health", "arguments": {}}
+        }), 2000),
+    }
+
+    def cleanup():
+        db.close()
+
+    return benchmarks, cleanup
+
+
+def compare(results, baseline, max_regression):
+    """Return a list of (name, baseline_us, current_us, pct) for regressions over the threshold."""
+    regressions = []
+    for name, current in results["benchmarks"].items():
+        previous = baseline.get("benchmarks", {}).get(name)
+        if not previous:
+            continue
+        base_us = previous["median_us"]
+        pct = (current["median_us"] - base_us) / base_us * 100 if base_us else 0.0
+        current["change_pct"] = round(pct, 2)
+        if pct > max_regression:
+            regressions.append((name, base_us, current["median_us"], pct))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time PokeDaddy hot paths and compare with a baseline")
+    parser.add_argument("--output", default=str(DEFAULT_OUTPUT), help="where to write results JSON")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE), help="baseline JSON to compare against")
+    parser.add_argument("--max-regression", type=float,
+                        default=float(os.environ.get("BENCH_MAX_REGRESSION", "25")),
+                        help="fail when a median is this many percent slower than baseline")
+    parser.add_argument("--repeat", type=int, default=5, help="timing rounds per benchmark")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply iterations per round")
+    parser.add_argument("--only", action="append", help="run only the named benchmark (repeatable)")
+    parser.add_argument("--save-baseline", action="store_true", help="write results to the baseline file too (required when it doesn't exist yet)")
+    args = parser.parse_args()
+
+    # Never benchmark against a real database: bind main.py to a throwaway SQLite file.
+    tmpdir = tempfile.mkdtemp(prefix="pokedaddy-bench-")
+    os.environ["POSTGRES_URL"] = f"sqlite:///{tmpdir}/bench.db"
+    os.environ.setdefault("SECRET_KEY", "bench-secret")
+    sys.path.insert(0, str(SERVER_DIR))
+    import main as server
+
+    benchmarks, cleanup = build_benchmarks(server, load_mcp_module())
+    results = {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "benchmarks": {},
+    }
+    try:
+        for name, (fn, number) in benchmarks.items():
+            if args.only and name not in args.only:
+                continue
+            stats = time_callable(fn, max(1, int(number * args.scale)), args.repeat)
+            results["benchmarks"][name] = stats
+            print(f"{name:<32} median {stats['median_us']:>10.2f} us   min {stats['min_us']:>10.2f} us")
+    finally:
+        cleanup()
+
+    regressions = []
+    baseline_path = pathlib.Path(args.baseline)
+    missing_baseline = not baseline_path.exists()
+    if not missing_baseline:
+        regressions = compare(results, json.loads(baseline_path.read_text()), args.max_regression)
+
+    pathlib.Path(args.output).write_text(json.dumps(results, indent=2))
+    print(f"[bench] results written to {args.output}")
+    if args.save_baseline:
+        baseline_path.write_text(json.dumps(results, indent=2))
+        print(f"[bench] baseline saved to {baseline_path}")
+
+    if missing_baseline and not args.save_baseline:
+        # Nothing was compared, so don't let the run pass as "no regressions"
+        print(f"[bench] no baseline at {baseline_path}; run with --save-baseline to create one")
+        sys.exit(1)
+    if regressions:
+        for name, base_us, current_us, pct in regressions:
+            print(f"[bench] REGRESSION {name}: {base_us:.2f} us -> {current_us:.2f} us (+{pct:.1f}%)")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Insert throughput and index size for random (UUIDv4) vs time-ordered (UUIDv7) keys.
+
+Each variant gets a scratch table shaped like blocking_sessions (id primary key,
+indexed user_id, started_at). The benchmark inserts --rows rows in --batch-row
+transactions, then reports rows per second and the on-disk size of the primary key
+and user_id indexes.
+
+- Postgres: varchar vs native uuid columns, each with v4 and v7 ids
+  ("varchar/uuid4" is the old schema, "uuid/uuid7" the new one)
+- SQLite: text columns with v4 and v7 ids (sizes from the dbstat table)
+
+The scratch tables are dropped afterwards unless --keep is given.
+
+Run:  POSTGRES_URL=postgresql://... python benchmarks/bench_ids.py --rows 200000
+      python benchmarks/bench_ids.py   # throwaway SQLite file
+"""
+
+import argparse
+import json
+import os
+import pathlib
+import random
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Index, MetaData, String, Table, create_engine, text
+
+HERE = pathlib.Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent))
+
+from ids import GUID, new_id  # noqa: E402
+
+GENERATORS = {"uuid4": lambda: str(uuid.uuid4()), "uuid7": new_id}
+
+
+def variants(dialect: str):
+    column_types = [("varchar", String), ("uuid", GUID)] if dialect == "postgresql" else [("text", String)]
+    return [(f"{name}/{gen}", column_type, GENERATORS[gen]) for name, column_type in column_types for gen in GENERATORS]
+
+
+def index_sizes(conn, table: Table) -> dict:
+    if conn.dialect.name == "postgresql":
+        size = lambda relation: conn.execute(text("SELECT pg_relation_size(:r)"), {"r": relation}).scalar()
+        return {"pk_bytes": size(f"{table.name}_pkey"), "user_id_index_bytes": size(f"ix_{table.name}_user_id")}
+    size = lambda name: conn.execute(text("SELECT SUM(pgsize) FROM dbstat WHERE name = :n"), {"n": name}).scalar()
+    return {"pk_bytes": size(f"sqlite_autoindex_{table.name}_1"), "user_id_index_bytes": size(f"ix_{table.name}_user_id")}
+
+
+def run_variant(engine, label: str, column_type, generate, rows: int, batch: int, keep: bool) -> dict:
+    metadata = MetaData()
+    name = "bench_ids_" + label.replace("/", "_")
+    table = Table(
+        name, metadata,
+        Column("id", column_type, primary_key=True),
+        Column("user_id", column_type, nullable=False),
+        Column("started_at", DateTime, nullable=False),
+        Index(f"ix_{name}_user_id", "user_id"),
+    )
+    metadata.drop_all(engine)
+    metadata.create_all(engine)
+    users = [generate() for _ in range(max(1, rows // 50))]
+    now = datetime.utcnow()
+
+    started = time.perf_counter()
+    for offset in range(0, rows, batch):
+        values = [{"id": generate(), "user_id": random.choice(users), "started_at": now}
+                  for _ in range(min(batch, rows - offset))]
+        with engine.begin() as conn:
+            conn.execute(table.insert(), values)
+    elapsed = time.perf_counter() - started
+
+    with engine.connect() as conn:
+        if conn.dialect.name == "postgresql":
+            conn.execute(text(f"ANALYZE {name}"))
+        result = {"rows_per_second": round(rows / elapsed), "seconds": round(elapsed, 3), **index_sizes(conn, table)}
+    if not keep:
+        metadata.drop_all(engine)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark random vs time-ordered primary keys")
+    parser.add_argument("--url", default=os.environ.get("POSTGRES_URL"), help="database URL (default: throwaway SQLite)")
+    parser.add_argument("--rows", type=int, default=100000, help="rows inserted per variant")
+    parser.add_argument("--batch", type=int, default=1000, help="rows per transaction")
+    parser.add_argument("--output", help="also write the results as JSON here")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch tables for inspection")
+    args = parser.parse_args()
+
+    url = args.url or f"sqlite:///{tempfile.mkdtemp(prefix='pokedaddy-bench-')}/ids.db"
+    if url.startswith("postgres://"):
+        url = url.replace("postgres://", "postgresql://", 1)
+    engine = create_engine(url)
+
+    results = {}
+    print(f"{'variant':<16} {'rows/s':>10} {'pk index':>12} {'user_id index':>14}")
+    for label, column_type, generate in variants(engine.dialect.name):
+        result = results[label] = run_variant(engine, label, column_type, generate, args.rows, args.batch, args.keep)
+        print(f"{label:<16} {result['rows_per_second']:>10} {result['pk_bytes'] / 1e6:>10.2f}MB "
+              f"{result['user_id_index_bytes'] / 1e6:>12.2f}MB")
+    if args.output:
+        pathlib.Path(args.output).write_text(json.dumps({"rows": args.rows, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
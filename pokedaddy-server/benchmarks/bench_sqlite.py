@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Mixed read/write throughput on SQLite: default settings vs embedded mode.
+
+Each variant opens a fresh database file with a scratch table shaped like
+blocking_sessions and runs --writers writer threads and --readers reader threads
+for --seconds. A write is one transaction: read a user's active session and insert
+a new one. A read looks up the newest session for a random user, like the
+/blocking/status query.
+
+- default: create_engine("sqlite:///...") as main.py opens it without SQLITE_EMBEDDED
+  (rollback journal, synchronous=FULL, a shared pool for reads and writes)
+- wal: the same engine with embedded_sqlite.DEFAULT_PRAGMAS applied on connect
+- embedded: EmbeddedDatabase (pragmas, one writer connection, query_only readers)
+
+The benchmark reports operations per second, p50/p99 latency, and errors ("database is
+locked" or pool timeouts) per variant.
+
+Run:  python benchmarks/bench_sqlite.py --seconds 10 --writers 4 --readers 8
+"""
+
+import argparse
+import json
+import pathlib
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from sqlalchemy import Boolean, Column, DateTime, Index, MetaData, String, Table, create_engine, event, select
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeoutError
+
+HERE = pathlib.Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent))
+
+from embedded_sqlite import DEFAULT_PRAGMAS, EmbeddedDatabase  # noqa: E402
+
+metadata = MetaData()
+sessions = Table(
+    "bench_sessions", metadata,
+    Column("id", String(36), primary_key=True),
+    Column("user_id", String(36), nullable=False),
+    Column("is_active", Boolean, nullable=False),
+    Column("started_at", DateTime, nullable=False),
+    Index("ix_bench_sessions_user_started", "user_id", "started_at"),
+)
+
+
+def open_default(path: str):
+    engine = create_engine(f"sqlite:///{path}")
+    return engine, engine, engine.dispose
+
+
+def open_wal(path: str):
+    engine = create_engine(f"sqlite:///{path}")
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        for name, value in DEFAULT_PRAGMAS.items():
+            dbapi_connection.execute(f"PRAGMA {name}={value}")
+    return engine, engine, engine.dispose
+
+
+def open_embedded(path: str):
+    database = EmbeddedDatabase(f"sqlite:///{path}")
+    return database.writer, database.reader, database.dispose
+
+
+VARIANTS = {"default": open_default, "wal": open_wal, "embedded": open_embedded}
+
+
+def percentile(values, fraction: float) -> float:
+    return round(sorted(values)[int(fraction * (len(values) - 1))] * 1000, 2) if values else 0.0
+
+
+def run_variant(opener, path: str, args) -> dict:
+    writer, reader, dispose = opener(path)
+    metadata.create_all(writer)
+    users = [str(uuid.uuid4()) for _ in range(args.users)]
+    with writer.begin() as conn:
+        conn.execute(sessions.insert(), [
+            {"id": str(uuid.uuid4()), "user_id": user, "is_active": False, "started_at": datetime.utcnow()}
+            for user in users
+        ])
+
+    latencies = {"write": [], "read": []}
+    errors = {"write": 0, "read": 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.seconds
+
+    def write(conn, user):
+        with conn.begin():
+            conn.execute(select(sessions.c.id).where(sessions.c.user_id == user, sessions.c.is_active == True))
+            conn.execute(sessions.insert(), {"id": str(uuid.uuid4()), "user_id": user, "is_active": True,
+                                             "started_at": datetime.utcnow()})
+
+    def read(conn, user):
+        conn.execute(select(sessions).where(sessions.c.user_id == user)
+                     .order_by(sessions.c.started_at.desc()).limit(1)).first()
+        conn.rollback()
+
+    def worker(kind, bind, op):
+        done, failed = [], 0
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                with bind.connect() as conn:
+                    op(conn, random.choice(users))
+                done.append(time.perf_counter() - started)
+            except (OperationalError, PoolTimeoutError):
+                failed += 1
+        with lock:
+            latencies[kind].extend(done)
+            errors[kind] += failed
+
+    threads = [threading.Thread(target=worker, args=("write", writer, write)) for _ in range(args.writers)]
+    threads += [threading.Thread(target=worker, args=("read", reader, read)) for _ in range(args.readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    dispose()
+
+    return {
+        kind: {"ops_per_second": round(len(latencies[kind]) / args.seconds),
+               "p50_ms": percentile(latencies[kind], 0.5), "p99_ms": percentile(latencies[kind], 0.99),
+               "errors": errors[kind]}
+        for kind in ("write", "read")
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark default vs embedded SQLite settings")
+    parser.add_argument("--seconds", type=float, default=5, help="run time per variant")
+    parser.add_argument("--writers", type=int, default=4, help="writer threads")
+    parser.add_argument("--readers", type=int, default=8, help="reader threads")
+    parser.add_argument("--users", type=int, default=1000, help="distinct user_ids")
+    parser.add_argument("--variants", default=",".join(VARIANTS), help="comma-separated subset of " + ", ".join(VARIANTS))
+    parser.add_argument("--output", help="also write the results as JSON here")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="pokedaddy-bench-")
+    results = {}
+    print(f"{'variant':<10} {'writes/s':>9} {'p50':>8} {'p99':>8} {'errors':>7} {'reads/s':>9} {'p50':>8} {'p99':>8} {'errors':>7}")
+    for label in args.variants.split(","):
+        result = results[label] = run_variant(VARIANTS[label], f"{directory}/{label}.db", args)
+        w, r = result["write"], result["read"]
+        print(f"{label:<10} {w['ops_per_second']:>9} {w['p50_ms']:>6}ms {w['p99_ms']:>6}ms {w['errors']:>7} "
+              f"{r['ops_per_second']:>9} {r['p50_ms']:>6}ms {r['p99_ms']:>6}ms {r['errors']:>7}")
+    if args.output:
+        pathlib.Path(args.output).write_text(json.dumps({"args": vars(args), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
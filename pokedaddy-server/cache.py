@@ -0,0 +1,341 @@
+"""
+Cache backends for hot per-user state (users, blocking status, effective block lists).
+
+Values are JSON documents stored under string keys with a TTL. Every backend has the
+same get/set/delete interface:
+
+- MemoryCache: per-process LRU. Fine for a single worker; with several workers each
+  one only sees its own invalidations, so entries can be stale for up to the TTL.
+- RedisCache: shared across workers and instances. Talks the Redis protocol (RESP)
+  over a plain socket, so it works with Redis, Valkey, KeyDB or any RESP stand-in
+  without a client library.
+
+Entries that mirror database rows use generation-checked reads instead of plain
+get/set, so a read can't put back data that a commit has just invalidated:
+
+- invalidate(key) bumps the key's generation (kept in "gen:<key>") and drops its value.
+- get_current(key) returns the value together with the current generation, in one
+  round trip. A value stored under an older generation reads as a miss.
+- set_current(key, value, generation) stores a value loaded from the database, tagged
+  with the generation get_current returned before the load. If a commit invalidated
+  the key during the load, the value is already outdated when it lands and is never served.
+
+Cache failures never fail a request: a failed get is a miss, and failures are logged
+(to the "pokedaddy.cache" logger, at most once per FAILURE_LOG_INTERVAL seconds). The
+TTL bounds how long anything can stay stale.
+"""
+
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+from urllib.parse import unquote, urlparse
+
+
+logger = logging.getLogger("pokedaddy.cache")
+
+# While the cache server is down every request fails over to the database: report
+# failures at most this often (seconds), with a count of the ones in between
+FAILURE_LOG_INTERVAL = 10.0
+
+GENERATION_PREFIX = "gen:"
+# Generations outlive the values tagged with them, so an expired generation can't make
+# an old value current again
+GENERATION_TTL_FACTOR = 4
+
+
+class Cache:
+    """Interface for cache backends: key -> JSON-serializable value."""
+
+    def get(self, key: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    def get_many(self, *keys: str) -> List:
+        return [self.get(key) for key in keys]
+
+    def set(self, key: str, value, ttl: float):
+        raise NotImplementedError
+
+    def delete(self, *keys: str):
+        raise NotImplementedError
+
+    def get_current(self, key: str) -> Tuple[Optional[object], int]:
+        """(value, generation): the value is None unless it was stored under the current generation"""
+        entry, generation = self.get_many(key, GENERATION_PREFIX + key)
+        generation = generation or 0
+        if isinstance(entry, dict) and entry.get("generation") == generation:
+            return entry["value"], generation
+        return None, generation
+
+    def set_current(self, key: str, value, generation: int, ttl: float):
+        self.set(key, {"generation": generation, "value": value}, ttl)
+
+    def invalidate(self, *keys: str, ttl: float):
+        """Make the values under `keys` stale for every reader, including loads already under way.
+        `ttl` is the longest TTL those values are set with.
+        """
+        raise NotImplementedError
+
+
+class MemoryCache(Cache):
+    """Per-process LRU; values are stored serialized so callers never share objects."""
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, raw = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        return json.loads(raw)
+
+    def set(self, key: str, value, ttl: float):
+        raw = json.dumps(value, default=str)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, raw)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, *keys: str):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def set_current(self, key: str, value, generation: int, ttl: float):
+        super().set_current(key, value, generation, ttl)
+        with self._lock:
+            # Keep the generation younger than the value, so the LRU never evicts it first
+            if GENERATION_PREFIX + key in self._entries:
+                self._entries.move_to_end(GENERATION_PREFIX + key)
+
+    def invalidate(self, *keys: str, ttl: float):
+        expires_at = time.monotonic() + ttl * GENERATION_TTL_FACTOR
+        with self._lock:
+            for key in keys:
+                entry = self._entries.pop(GENERATION_PREFIX + key, None)
+                generation = json.loads(entry[1]) if entry and entry[0] > time.monotonic() else 0
+                self._entries[GENERATION_PREFIX + key] = (expires_at, json.dumps(generation + 1))
+                self._entries.pop(key, None)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisError(Exception):
+    pass
+
+
+class _RespConnection:
+    def __init__(self, host: str, port: int, timeout: float):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile("rb")
+
+    @staticmethod
+    def _encode(args) -> bytes:
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(parts)
+
+    def command(self, *args):
+        self.sock.sendall(self._encode(args))
+        return self._read_reply()
+
+    def pipeline(self, *commands) -> list:
+        """Send several commands in one write; error replies are returned in place, not raised"""
+        self.sock.sendall(b"".join(self._encode(args) for args in commands))
+        replies = []
+        for _ in commands:
+            try:
+                replies.append(self._read_reply())
+            except RedisError as e:
+                replies.append(e)
+        return replies
+
+    def _read_reply(self):
+        line = self.reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("connection closed by cache server")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload
+        if kind == b"-":
+            raise RedisError(payload.decode(errors="replace"))
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = self.reader.read(length + 2)
+            if len(data) != length + 2:
+                raise ConnectionError("connection closed by cache server")
+            return data[:-2]
+        if kind == b"*":
+            length = int(payload)
+            return None if length < 0 else [self._read_reply() for _ in range(length)]
+        raise RedisError(f"unexpected reply {line!r}")
+
+    def close(self):
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class RedisCache(Cache):
+    """Shared cache over the Redis protocol, e.g. RedisCache("redis://:password@host:6379/0").
+
+    Keeps a small pool of connections so concurrent requests don't queue on one socket.
+    """
+
+    def __init__(self, url: str, prefix: str = "pokedaddy:", timeout: float = 0.5, max_idle: int = 8):
+        parsed = urlparse(url)
+        if parsed.scheme != "redis":
+            raise ValueError("RedisCache needs a redis:// URL")
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.prefix = prefix
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._failure_logged_at = None
+        self._failures_unlogged = 0
+
+    def _log_failure(self, operation: str, keys, error: Exception):
+        now = time.monotonic()
+        with self._lock:
+            if self._failure_logged_at is not None and now - self._failure_logged_at < FAILURE_LOG_INTERVAL:
+                self._failures_unlogged += 1
+                return
+            unlogged, self._failures_unlogged, self._failure_logged_at = self._failures_unlogged, 0, now
+        logger.warning("cache %s %s failed: %s%s", operation, ", ".join(keys), error,
+                       f" ({unlogged} more failures since the last report)" if unlogged else "")
+
+    def _acquire(self) -> _RespConnection:
+        with self._lock:
+            if self._pid != os.getpid():
+                # A forked worker must not talk over the parent's sockets
+                self._idle, self._pid = [], os.getpid()
+            if self._idle:
+                return self._idle.pop()
+        conn = _RespConnection(self.host, self.port, self.timeout)
+        try:
+            if self.password:
+                conn.command("AUTH", self.password)
+            if self.db:
+                conn.command("SELECT", self.db)
+        except Exception:
+            conn.close()
+            raise
+        return conn
+
+    def _release(self, conn: _RespConnection):
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def execute(self, *args):
+        conn = self._acquire()
+        try:
+            reply = conn.command(*args)
+        except RedisError:
+            self._release(conn)
+            raise
+        except Exception:
+            conn.close()  # the stream may be out of sync; never reuse it
+            raise
+        self._release(conn)
+        return reply
+
+    def execute_many(self, *commands) -> list:
+        conn = self._acquire()
+        try:
+            replies = conn.pipeline(*commands)
+        except Exception:
+            conn.close()
+            raise
+        self._release(conn)
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+        return replies
+
+    def get(self, key: str):
+        try:
+            raw = self.execute("GET", self.prefix + key)
+        except (OSError, RedisError) as e:
+            self._log_failure("get", [key], e)
+            return None
+        return None if raw is None else json.loads(raw)
+
+    def get_many(self, *keys: str):
+        try:
+            values = self.execute("MGET", *(self.prefix + key for key in keys))
+        except (OSError, RedisError) as e:
+            self._log_failure("get", keys, e)
+            return [None] * len(keys)
+        return [None if raw is None else json.loads(raw) for raw in values]
+
+    def set(self, key: str, value, ttl: float):
+        try:
+            self.execute("SET", self.prefix + key, json.dumps(value, default=str), "PX", max(1, int(ttl * 1000)))
+        except (OSError, RedisError) as e:
+            self._log_failure("set", [key], e)
+
+    def delete(self, *keys: str):
+        if not keys:
+            return
+        try:
+            self.execute("DEL", *(self.prefix + key for key in keys))
+        except (OSError, RedisError) as e:
+            self._log_failure("delete", keys, e)
+
+    def invalidate(self, *keys: str, ttl: float):
+        if not keys:
+            return
+        generation_ms = max(1, int(ttl * GENERATION_TTL_FACTOR * 1000))
+        commands = []
+        for key in keys:
+            commands.append(("INCR", self.prefix + GENERATION_PREFIX + key))
+            commands.append(("PEXPIRE", self.prefix + GENERATION_PREFIX + key, generation_ms))
+        commands.append(("DEL", *(self.prefix + key for key in keys)))
+        try:
+            self.execute_many(*commands)
+        except (OSError, RedisError) as e:
+            self._log_failure("invalidate", keys, e)
+
+
+def cache_from_url(url: Optional[str], max_entries: int = 10000) -> Optional[Cache]:
+    """None/"" disables caching, "memory://" is a per-process LRU, "redis://..." is shared."""
+    if not url:
+        return None
+    if url.startswith("memory://"):
+        return MemoryCache(max_entries)
+    if url.startswith("redis://"):
+        return RedisCache(url)
+    raise ValueError(f"Unsupported CACHE_URL scheme: {url}")
@@ -0,0 +1,10 @@
+import os
+import pathlib
+
+# main.py binds its engine when it is first imported. Test modules that import it
+# without their own setup_module get a fresh throwaway SQLite DB.
+_db_path = pathlib.Path("test_pokedaddy.db")
+if _db_path.exists():
+    _db_path.unlink()
+os.environ.setdefault("POSTGRES_URL", f"sqlite:///./{_db_path.name}")
+os.environ.setdefault("SECRET_KEY", "test-secret")
@@ -0,0 +1,211 @@
+"""
+Embedded SQLite mode for single-node deployments (SQLITE_EMBEDDED=1).
+
+EmbeddedDatabase opens two engines on one database file:
+
+- writer: a pool of exactly one connection. Writes from this process queue for it in
+  the pool (for up to the busy timeout) instead of racing each other for the file
+  lock and failing with SQLITE_BUSY. Its transactions start with BEGIN IMMEDIATE, so
+  a writer in another process (another uvicorn worker) is waited for when the
+  transaction begins rather than failing halfway through it.
+- reader: a pool of connections opened with query_only, so a write sent there fails
+  instead of taking the lock. Reads run without an explicit transaction. Each statement
+  sees the latest commit, as under Postgres' READ COMMITTED, and no long-lived read
+  snapshot holds back checkpoints.
+
+Every connection gets PRAGMAs on connect (DEFAULT_PRAGMAS, overridable):
+
+- journal_mode=wal: readers and the writer do not block each other
+- synchronous=normal: commits survive an application crash. A power loss can undo the
+  last few commits but never corrupts the file.
+- cache_size=-65536 (64 MiB of page cache per connection)
+- mmap_size=268435456 (256 MiB of memory-mapped reads)
+- temp_store=memory
+- busy_timeout: how long to wait for another process' lock
+
+ReadWriteSession sends statements to the reader until the transaction first writes (a
+flush, or an INSERT/UPDATE/DELETE statement). From then on every statement, reads
+included, goes to the writer until the transaction ends, so a transaction always sees
+its own writes.
+
+WalCheckpointer takes checkpoints off the commit path. The writer's automatic
+checkpoint is disabled, and a background thread runs PRAGMA wal_checkpoint(PASSIVE)
+every `interval` seconds. Once the -wal file grows past `truncate_bytes`, it runs
+TRUNCATE instead, which waits for readers and resets the file.
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+from typing import Dict, Optional
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.elements import TextClause
+
+logger = logging.getLogger("pokedaddy.sqlite")
+
+DEFAULT_PRAGMAS = {
+    "journal_mode": "wal",
+    "synchronous": "normal",
+    "cache_size": "-65536",
+    "mmap_size": "268435456",
+    "temp_store": "memory",
+}
+
+_WRITE_SQL = re.compile(r"\s*(INSERT|UPDATE|DELETE|REPLACE|WITH)\b", re.IGNORECASE)
+
+
+def parse_pragmas(spec: str) -> Dict[str, str]:
+    """Parse "synchronous=full, cache_size=-20000" into {name: value}"""
+    pragmas = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, separator, value = (part.strip() for part in item.partition("="))
+        # Both end up in PRAGMA statements, so only plain words and numbers are accepted
+        if not separator or not re.fullmatch(r"\w+", name) or not re.fullmatch(r"-?[\w.]+", value):
+            raise ValueError(f"pragmas look like name=value, got {item!r}")
+        pragmas[name.lower()] = value
+    return pragmas
+
+
+def is_busy_error(exc: BaseException) -> bool:
+    """True for errors that mean "the database is busy, try again": SQLite's lock timeout,
+    or no pooled connection freeing up in time.
+    """
+    if isinstance(exc, PoolTimeoutError):
+        return True
+    return isinstance(exc, OperationalError) and "database is locked" in str(exc.orig)
+
+
+def _configure(engine, pragmas: Dict[str, str], begin: Optional[str], query_only: bool = False):
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        # Transactions are begun by the "begin" hook below, not by pysqlite
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+            if query_only:
+                cursor.execute("PRAGMA query_only=1")
+        finally:
+            cursor.close()
+
+    if begin:
+        @event.listens_for(engine, "begin")
+        def on_begin(conn):
+            conn.exec_driver_sql(begin)
+
+
+class WalCheckpointer:
+    """Checkpoints the WAL from a background thread, started by the first writer checkout in
+    each process. `checkpoints`, `truncations` and `incomplete` count what it has done.
+    """
+
+    def __init__(self, engine, wal_path: str, interval: float = 30.0, truncate_bytes: int = 64 << 20):
+        self.engine = engine
+        self.wal_path = wal_path
+        self.interval = interval
+        self.truncate_bytes = truncate_bytes
+        self.checkpoints = 0
+        self.truncations = 0
+        self.incomplete = 0
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def checkpoint(self) -> dict:
+        """Checkpoint once now; TRUNCATE if the WAL is over the size limit, else PASSIVE"""
+        try:
+            wal_bytes = os.path.getsize(self.wal_path)
+        except OSError:
+            wal_bytes = 0
+        mode = "TRUNCATE" if wal_bytes > self.truncate_bytes else "PASSIVE"
+        raw = self.engine.raw_connection()
+        try:
+            busy, wal_frames, checkpointed = raw.driver_connection.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+        finally:
+            raw.close()
+        with self._lock:
+            self.checkpoints += 1
+            self.truncations += mode == "TRUNCATE"
+            self.incomplete += bool(busy)
+        return {"mode": mode, "wal_bytes": wal_bytes, "busy": bool(busy),
+                "wal_frames": wal_frames, "checkpointed_frames": checkpointed}
+
+    def ensure_running(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                threading.Thread(target=self._run, name="pokedaddy-wal-checkpoint", daemon=True).start()
+
+    def _run(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            time.sleep(self.interval)
+            try:
+                self.checkpoint()
+            except Exception as e:
+                logger.warning("sqlite WAL checkpoint failed: %s", e)
+
+
+class EmbeddedDatabase:
+    """The writer and reader engines for one SQLite file (see module docstring).
+    `checkpointer` is None when checkpoint_interval is 0 (SQLite's own autocheckpoint stays on).
+    """
+
+    def __init__(self, url, pragmas: Optional[Dict[str, str]] = None, readers: int = 4,
+                 busy_timeout: float = 5.0, checkpoint_interval: float = 30.0, truncate_bytes: int = 64 << 20):
+        url = make_url(url)
+        if url.get_backend_name() != "sqlite" or url.database in (None, "", ":memory:"):
+            raise ValueError(f"embedded SQLite needs a sqlite:/// database file, got {url!r}")
+        pragmas = {**DEFAULT_PRAGMAS, **(pragmas or {}), "busy_timeout": str(int(busy_timeout * 1000))}
+
+        self.writer = create_engine(url, pool_size=1, max_overflow=0, pool_timeout=busy_timeout)
+        self.reader = create_engine(url, pool_size=readers, max_overflow=readers, pool_timeout=busy_timeout)
+        self.checkpointer = None
+        if checkpoint_interval > 0:
+            self.checkpointer = WalCheckpointer(self.reader, url.database + "-wal", checkpoint_interval, truncate_bytes)
+            event.listen(self.writer, "checkout", lambda *args: self.checkpointer.ensure_running())
+            _configure(self.writer, {**pragmas, "wal_autocheckpoint": "0"}, begin="BEGIN IMMEDIATE")
+        else:
+            _configure(self.writer, pragmas, begin="BEGIN IMMEDIATE")
+        _configure(self.reader, pragmas, begin=None, query_only=True)
+
+    def dispose(self):
+        self.writer.dispose()
+        self.reader.dispose()
+
+
+def _writes(clause) -> bool:
+    if isinstance(clause, TextClause):
+        return bool(_WRITE_SQL.match(clause.text))
+    return bool(getattr(clause, "is_dml", False))
+
+
+class ReadWriteSession(Session):
+    """Reads go to `session.info["reader"]` until the transaction writes, then everything goes to
+    the session's bind (the writer) until it ends. Without a reader it is a plain Session.
+    """
+
+    _writing = False
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        reader = self.info.get("reader")
+        if reader is None or reader is self.bind:
+            return super().get_bind(mapper, clause=clause, **kw)
+        if not (self._writing or self._flushing or _writes(clause)):
+            return reader
+        self._writing = True
+        return super().get_bind(mapper, clause=clause, **kw)
+
+
+@event.listens_for(ReadWriteSession, "after_transaction_end")
+def _transaction_ended(session, transaction):
+    if transaction.parent is None:
+        session._writing = False
@@ -0,0 +1,90 @@
+"""
+Group commit for bursty session writes.
+
+Instead of one transaction (and one fsync) per request, writers hand a function to
+GroupCommitter.submit and wait. A background thread collects submissions until it
+has `max_items` or the oldest one has waited `max_delay` seconds, runs them all in
+a single transaction and commits once. Each caller's future resolves only after
+that commit, so a returned result is durable.
+
+If the shared transaction fails, it is rolled back and every write is retried in
+its own transaction. A bad write then fails only its own caller. Write functions
+take a Session, must not commit, and must be safe to run again after a rollback.
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable
+
+
+class GroupCommitter:
+    def __init__(self, session_factory, max_items: int = 100, max_delay: float = 0.005):
+        self.session_factory = session_factory
+        self.max_items = max_items
+        self.max_delay = max_delay
+        self.batches = 0
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+
+    def submit(self, fn: Callable) -> Future:
+        """Queue `fn(session)`; the future gets its return value once the batch is committed."""
+        future = Future()
+        self._ensure_worker().put((fn, future))
+        return future
+
+    def _ensure_worker(self) -> queue.Queue:
+        # Started lazily and per process, so forked workers each get their own flusher thread
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._queue = queue.Queue()
+                threading.Thread(target=self._run, args=(self._queue,), name="pokedaddy-group-commit",
+                                 daemon=True).start()
+            return self._queue
+
+    def _run(self, pending: queue.Queue):
+        while True:
+            batch = [pending.get()]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_items:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(pending.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self._flush(batch)
+
+    def _flush(self, batch):
+        self.batches += 1
+        session = self.session_factory()
+        try:
+            results = [fn(session) for fn, _ in batch]
+            session.commit()
+        except Exception:
+            session.rollback()
+            session.close()
+            for item in batch:
+                self._flush_one(*item)
+            return
+        session.close()
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def _flush_one(self, fn, future: Future):
+        session = self.session_factory()
+        try:
+            result = fn(session)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        finally:
+            session.close()
@@ -0,0 +1,191 @@
+"""
+Idempotency-Key support for mutating requests.
+
+A POST/PUT/PATCH/DELETE that carries an `Idempotency-Key` header has its
+response stored under that key (scoped to the caller's Authorization and
+X-Admin-Key headers, method and path). Retries with the same key get the stored response back without
+reaching the handlers or the database. Reusing a key for a different request
+body or query string is rejected with 422.
+
+The request body is buffered in memory to fingerprint it, so routes that stream
+large bodies (e.g. /admin/provision) are listed in `exclude_paths` and pass through
+without idempotency.
+
+Stores only need get/set. MemoryIdempotencyStore is a bounded, TTL-evicted
+per-worker store; CacheIdempotencyStore shares keys across workers through a
+cache backend (see cache.py).
+"""
+
+import base64
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+IDEMPOTENCY_HEADER = b"idempotency-key"
+PRINCIPAL_HEADERS = (b"authorization", b"x-admin-key")
+MUTATING_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyStore:
+    """Interface for idempotency backends: key -> stored response dict."""
+
+    def get(self, key: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: dict):
+        raise NotImplementedError
+
+
+class MemoryIdempotencyStore(IdempotencyStore):
+    """Per-process LRU store; entries expire after `ttl` seconds."""
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 86400):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: dict):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class CacheIdempotencyStore(IdempotencyStore):
+    """Stores responses in a cache backend (e.g. RedisCache) shared by all workers."""
+
+    def __init__(self, cache, ttl: float = 86400, prefix: str = "idempotency:"):
+        self.cache = cache
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[dict]:
+        return self.cache.get(self.prefix + key)
+
+    def set(self, key: str, value: dict):
+        self.cache.set(self.prefix + key, value, self.ttl)
+
+
+async def _send_json(send, status_code: int, payload: dict, extra_headers=()):
+    body = json.dumps(payload).encode()
+    headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    await send({"type": "http.response.start", "status": status_code, "headers": headers + list(extra_headers)})
+    await send({"type": "http.response.body", "body": body})
+
+
+class IdempotencyMiddleware:
+    """ASGI middleware that replays stored responses for repeated Idempotency-Keys."""
+
+    def __init__(self, app, store: IdempotencyStore, exclude_paths=()):
+        self.app = app
+        self.store = store
+        self.exclude_paths = frozenset(exclude_paths)
+        self._in_flight = set()
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] != "http" or scope["method"] not in MUTATING_METHODS
+                or scope["path"] in self.exclude_paths):
+            await self.app(scope, receive, send)
+            return
+
+        idempotency_key = None
+        credentials = dict.fromkeys(PRINCIPAL_HEADERS, b"")
+        for name, value in scope.get("headers", ()):
+            if name == IDEMPOTENCY_HEADER:
+                idempotency_key = value
+            elif name in credentials:
+                credentials[name] = value
+        if idempotency_key is None:
+            await self.app(scope, receive, send)
+            return
+        if not idempotency_key or len(idempotency_key) > MAX_KEY_LENGTH:
+            await _send_json(send, 400, {"detail": "Invalid Idempotency-Key header"})
+            return
+
+        # Buffer the body so it can be fingerprinted and then replayed to the app
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        body = b"".join(chunks)
+
+        principal = hashlib.sha256(b"\0".join(credentials.values())).hexdigest()[:16]
+        key = f"{principal}:{scope['method']}:{scope['path']}:{idempotency_key.decode('latin-1')}"
+        fingerprint = hashlib.sha256(scope.get("query_string", b"") + b"\0" + body).hexdigest()
+
+        stored = self.store.get(key)
+        if stored is not None:
+            if stored["fingerprint"] != fingerprint:
+                await _send_json(send, 422, {"detail": "Idempotency-Key was already used for a different request"})
+                return
+            headers = [(k.encode("latin-1"), v.encode("latin-1")) for k, v in stored["headers"]]
+            headers.append((b"idempotent-replayed", b"true"))
+            await send({"type": "http.response.start", "status": stored["status"], "headers": headers})
+            await send({"type": "http.response.body", "body": base64.b64decode(stored["body"])})
+            return
+
+        if key in self._in_flight:
+            await _send_json(send, 409, {"detail": "A request with this Idempotency-Key is in progress"},
+                             [(b"retry-after", b"1")])
+            return
+
+        body_sent = False
+
+        async def replay_receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        response = {"status": None, "headers": [], "body": []}
+
+        async def capture_send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = [
+                    (k.decode("latin-1"), v.decode("latin-1")) for k, v in message.get("headers", [])
+                ]
+            elif message["type"] == "http.response.body":
+                response["body"].append(message.get("body", b""))
+            await send(message)
+
+        self._in_flight.add(key)
+        try:
+            await self.app(scope, replay_receive, capture_send)
+        finally:
+            self._in_flight.discard(key)
+
+        # Server errors are not stored so the client can retry them
+        if response["status"] is not None and response["status"] < 500:
+            self.store.set(key, {
+                "fingerprint": fingerprint,
+                "status": response["status"],
+                "headers": response["headers"],
+                "body": base64.b64encode(b"".join(response["body"])).decode("ascii"),
+            })
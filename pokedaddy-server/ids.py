@@ -0,0 +1,93 @@
+"""
+Time-ordered ids and the column type that stores them.
+
+new_id() returns a UUIDv7 (RFC 9562) string: a 48-bit Unix millisecond timestamp,
+then a 12-bit counter that keeps ids from one process strictly increasing within a
+millisecond, then 62 random bits. New rows therefore land at the right-hand edge
+of the primary key B-tree instead of on a random page. Ids created at the same
+time stay close together in indexes and cache.
+
+GUID stores ids as a native 16-byte `uuid` on Postgres and as 36-character text
+elsewhere. Values are plain strings in Python either way. Binds are sent without a
+`::uuid` cast, so the same statements also work against varchar id columns that
+haven't been migrated yet (scripts/migrate_uuid_columns.py). On Postgres a value that
+isn't a UUID binds as NULL, so a malformed id in a URL matches no rows (404) rather
+than failing the statement.
+
+Postgres won't compare a uuid column with a varchar one, or copy one into the other,
+without an explicit cast. use_text_ids(dialect) therefore makes GUID create varchar
+columns on a database whose existing id columns are still varchar, so tables added
+later match them until the migration converts them all.
+"""
+
+import secrets
+import threading
+import time
+import uuid
+
+from sqlalchemy import String
+from sqlalchemy.types import TypeDecorator, UserDefinedType
+
+_lock = threading.Lock()
+_last_ms = 0
+_counter = 0
+
+
+def uuid7() -> uuid.UUID:
+    global _last_ms, _counter
+    with _lock:
+        ms = time.time_ns() // 1_000_000
+        if ms > _last_ms:
+            # Start each millisecond at a random counter with headroom below 0xFFF
+            _last_ms, _counter = ms, secrets.randbits(11)
+        else:
+            # Same millisecond (or the clock went back): count up, borrowing the next
+            # millisecond if the counter runs out
+            _counter += 1
+            if _counter > 0xFFF:
+                _last_ms, _counter = _last_ms + 1, 0
+        ms, counter = _last_ms, _counter
+    return uuid.UUID(int=(ms << 80) | (0x7 << 76) | (counter << 64) | (0b10 << 62) | secrets.randbits(62))
+
+
+def new_id() -> str:
+    return str(uuid7())
+
+
+class _PostgresUUID(UserDefinedType):
+    """Native uuid DDL without SQLAlchemy's bind casts (see module docstring)."""
+
+    cache_ok = True
+
+    def get_col_spec(self, **kw):
+        return "UUID"
+
+
+def use_text_ids(dialect):
+    """Store GUIDs as text on this engine's dialect. Call it before the engine runs any statement:
+    each dialect caches the column types it has resolved.
+    """
+    dialect.text_ids = True
+
+
+class GUID(TypeDecorator):
+    """UUID ids: native `uuid` on Postgres, String(36) elsewhere; always str in Python."""
+
+    impl = String(36)
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "postgresql" and not getattr(dialect, "text_ids", False):
+            return dialect.type_descriptor(_PostgresUUID())
+        return dialect.type_descriptor(String(36))
+
+    def process_bind_param(self, value, dialect):
+        if value is None or dialect.name != "postgresql":
+            return value
+        try:
+            return str(uuid.UUID(str(value)))
+        except ValueError:
+            return None
+
+    def process_result_value(self, value, dialect):
+        return value if value is None or isinstance(value, str) else str(value)
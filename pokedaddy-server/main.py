@@ -1,62 +1,129 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Header, Request, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import create_engine, Column, String, Text, DateTime, Boolean
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from sqlalchemy import bindparam, create_engine, event, func, inspect, literal, select, text, tuple_, update, Column, String, Text, Date, DateTime, Boolean, Integer, Index
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeoutError
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
-from pydantic import BaseModel
-from typing import List, Optional
-from datetime import datetime, timedelta
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy.pool import QueuePool
+from pydantic import BaseModel, ValidationError
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from datetime import date, datetime, timedelta, timezone
+import asyncio
+import base64
+import binascii
+import contextlib
+import csv
+import email.utils
+import hashlib
+import heapq
+import hmac
+import io
+import itertools
 import json
+import logging
 import os
+import random
+import threading
+import time
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from dotenv import load_dotenv
+from admission import CRITICAL, LOW, NORMAL, AdmissionMiddleware, RouteClass, parse_rates
+from audit import AUDIT_FIELDS, AuditLog
+from cache import RedisCache, cache_from_url
+from embedded_sqlite import EmbeddedDatabase, ReadWriteSession, is_busy_error, parse_pragmas
+from group_commit import GroupCommitter
+from ids import GUID, new_id, use_text_ids
+from idempotency import CacheIdempotencyStore, IdempotencyMiddleware, MemoryIdempotencyStore
+from profiling import ProfilingMiddleware
+from sharding import ShardMap, parse_shard_urls
+from single_flight import SingleFlight
+from tracing import FileExporter, InMemoryExporter, Tracer, TracingMiddleware, instrument_engine
+from worker_health import MASTER_FILE, read_heartbeats, read_state
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger("pokedaddy")
+
 # Database setup
 POSTGRES_URL = os.getenv("POSTGRES_URL")
 if not POSTGRES_URL:
     raise ValueError("POSTGRES_URL environment variable is required")
 
-# Convert postgres:// to postgresql:// for SQLAlchemy 2.0 compatibility
-if POSTGRES_URL.startswith("postgres://"):
-    POSTGRES_URL = POSTGRES_URL.replace("postgres://", "postgresql://", 1)
-
-# Remove invalid Vercel-specific parameters that psycopg2 doesn't recognize
-import urllib.parse
-parsed_url = urllib.parse.urlparse(POSTGRES_URL)
-query_params = urllib.parse.parse_qs(parsed_url.query)
-
-# Remove the 'supa' parameter that Vercel adds but psycopg2 doesn't support
-if 'supa' in query_params:
-    del query_params['supa']
-
-# Rebuild the URL without the invalid parameter
-clean_query = urllib.parse.urlencode(query_params, doseq=True)
-clean_url = urllib.parse.urlunparse((
-    parsed_url.scheme,
-    parsed_url.netloc,
-    parsed_url.path,
-    parsed_url.params,
-    clean_query,
-    parsed_url.fragment
-))
-
-engine = create_engine(clean_url)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def database_url(url: str):
+    # Convert postgres:// to postgresql:// for SQLAlchemy 2.0 compatibility
+    if url.startswith("postgres://"):
+        url = url.replace("postgres://", "postgresql://", 1)
+    # Remove the 'supa' parameter that Vercel adds but psycopg2 doesn't support.
+    # make_url keeps sqlite:/// paths intact (urlunparse would drop the empty netloc).
+    return make_url(url).difference_update_query(["supa"])
+
+clean_url = database_url(POSTGRES_URL)
+
+# Embedded SQLite for single-node installs: SQLITE_EMBEDDED=1 opens sqlite:/// databases in WAL
+# mode with tuned pragmas (override with e.g. SQLITE_PRAGMAS="synchronous=full"), one writer
+# connection and up to 2 * SQLITE_READERS pooled read-only connections, and checkpoints the WAL
+# every SQLITE_CHECKPOINT_SECONDS in the background (see embedded_sqlite.py)
+SQLITE_EMBEDDED = os.getenv("SQLITE_EMBEDDED", "").lower() in ("1", "true")
+
+def open_database(url):
+    """(writer, reader) engines for `url`; one engine serves both unless it is an embedded SQLite file"""
+    if SQLITE_EMBEDDED and url.get_backend_name() == "sqlite":
+        database = EmbeddedDatabase(
+            url,
+            pragmas=parse_pragmas(os.getenv("SQLITE_PRAGMAS", "")),
+            readers=int(os.getenv("SQLITE_READERS", "4")),
+            busy_timeout=float(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")) / 1000,
+            checkpoint_interval=float(os.getenv("SQLITE_CHECKPOINT_SECONDS", "30")),
+            truncate_bytes=int(float(os.getenv("SQLITE_WAL_TRUNCATE_MB", "64")) * (1 << 20)),
+        )
+        return database.writer, database.reader
+    engine = create_engine(url)
+    return engine, engine
+
+engine, read_engine = open_database(clean_url)
+# Sessions read through read_engine until their transaction writes
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine,
+                            class_=ReadWriteSession, info={"reader": read_engine})
+
+# Hash sharding: SHARD_URLS="s0=postgresql://...,s1=postgresql://..." spreads each user's rows
+# over several databases by user_id (see sharding.py). POSTGRES_URL then only holds the user
+# directory, revoked refresh tokens and audit events; it may also be listed as a shard.
+# Unset, POSTGRES_URL is the only shard.
+shard_databases = {
+    name: (engine, read_engine) if database_url(url) == clean_url else open_database(database_url(url))
+    for name, url in parse_shard_urls(os.getenv("SHARD_URLS", "")).items()
+} or {"main": (engine, read_engine)}
+shard_engines = {name: writer for name, (writer, _) in shard_databases.items()}
+shard_readers = {name: reader for name, (_, reader) in shard_databases.items()}
 Base = declarative_base()
 
 # Security
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 
+def access_token_subject(token: str) -> Optional[str]:
+    """User id of a valid, unexpired access token; None for anything else (including refresh tokens)"""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    if payload.get("typ") == "refresh":
+        return None
+    return payload.get("sub")
+
 app = FastAPI(title="PokeDaddy Server", version="1.0.0")
 
 # CORS middleware
@@ -68,42 +135,512 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Hot-state cache for users, blocking status and effective block lists:
+# CACHE_URL=memory:// (per worker) or redis://host:6379/0 (shared); unset disables it
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "60"))
+cache = cache_from_url(os.getenv("CACHE_URL"), int(os.getenv("CACHE_MAX_KEYS", "10000")))
+
+# Idempotency-Key replay for retried mutating requests (shared through Redis when configured)
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+if isinstance(cache, RedisCache):
+    idempotency_store = CacheIdempotencyStore(cache, ttl=IDEMPOTENCY_TTL_SECONDS)
+else:
+    idempotency_store = MemoryIdempotencyStore(
+        max_entries=int(os.getenv("IDEMPOTENCY_MAX_KEYS", "10000")),
+        ttl=IDEMPOTENCY_TTL_SECONDS,
+    )
+# /admin/provision streams its body, which the middleware would buffer whole
+app.add_middleware(IdempotencyMiddleware, store=idempotency_store, exclude_paths={"/admin/provision"})
+
+# On-demand profiling: requests with `X-Profile: <ADMIN_API_KEY>` or a PROFILE_SAMPLE_RATE hit
+ADMIN_API_KEY = os.getenv("ADMIN_API_KEY")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+if ADMIN_API_KEY or PROFILE_SAMPLE_RATE > 0:
+    app.add_middleware(
+        ProfilingMiddleware,
+        profile_dir=os.getenv("PROFILE_DIR", "profiles"),
+        sample_rate=PROFILE_SAMPLE_RATE,
+        admin_key=ADMIN_API_KEY,
+        max_profiles=int(os.getenv("PROFILE_MAX_FILES", "20")),
+        interval=float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000,
+    )
+
+# Request tracing: TRACE_EXPORTER=memory keeps recent spans for /admin/traces,
+# TRACE_EXPORTER=file appends them to TRACE_FILE as JSON lines
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "").lower()
+tracer = None
+if TRACE_EXPORTER in ("memory", "file"):
+    if TRACE_EXPORTER == "memory":
+        tracer = Tracer(InMemoryExporter(int(os.getenv("TRACE_MAX_SPANS", "10000"))))
+    else:
+        tracer = Tracer(FileExporter(os.getenv("TRACE_FILE", "traces.jsonl")))
+    app.add_middleware(TracingMiddleware, tracer=tracer)
+    for bind in dict.fromkeys([engine, read_engine, *shard_engines.values(), *shard_readers.values()]):
+        instrument_engine(bind, tracer)
+
+# Group commit: with GROUP_COMMIT_MS > 0, session starts/ends wait up to that long (or for
+# GROUP_COMMIT_MAX_ITEMS writes) and commit together in one transaction. One committer per
+# shard, created by configure_shards.
+GROUP_COMMIT_MS = float(os.getenv("GROUP_COMMIT_MS", "0"))
+GROUP_COMMIT_MAX_ITEMS = int(os.getenv("GROUP_COMMIT_MAX_ITEMS", "100"))
+group_committers = {}
+
+# Single flight: concurrent identical status reads (same route and user/email) share one lookup;
+# each request waits at most SINGLE_FLIGHT_TIMEOUT_MS for it before getting a 503
+single_flight = SingleFlight(
+    timeout=float(os.getenv("SINGLE_FLIGHT_TIMEOUT_MS", "5000")) / 1000,
+    max_workers=int(os.getenv("SINGLE_FLIGHT_MAX_WORKERS", "8")),
+)
+
+# Admission control: ADMISSION_MAX_CONCURRENCY > 0 caps in-flight requests per worker (keep it at or
+# below the DB pool size) and enables per-client token buckets, tunable with e.g.
+# ADMISSION_RATES="register=1/10,admin=10/50" (requests per second / burst)
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "0"))
+if ADMISSION_MAX_CONCURRENCY > 0:
+    rates = {"status": (10, 30), "register": (1, 10), "admin": (10, 50), "default": (20, 40)}
+    rates.update(parse_rates(os.getenv("ADMISSION_RATES", "")))
+    app.add_middleware(
+        AdmissionMiddleware,
+        route_classes=[
+            RouteClass("status", r"^/(blocking/status|profiles/[^/]+/restricted-apps)$", CRITICAL, *rates["status"]),
+            # Unauthenticated routes: always keyed by client address
+            RouteClass("register", r"^/auth/register$", LOW, *rates["register"], by_user=False),
+            RouteClass("admin", r"^/admin/", LOW, *rates["admin"], by_user=False),
+            RouteClass("default", r"", NORMAL, *rates["default"]),
+        ],
+        max_concurrency=ADMISSION_MAX_CONCURRENCY,
+        trust_forwarded=os.getenv("ADMISSION_TRUST_PROXY", "").lower() in ("1", "true"),
+        authenticate=access_token_subject,
+    )
+
+# A busy database (SQLite's lock wait or a pool checkout timing out) answers 503 so clients retry
+@app.exception_handler(OperationalError)
+@app.exception_handler(PoolTimeoutError)
+async def database_busy(request: Request, exc: Exception):
+    if not is_busy_error(exc):
+        raise exc
+    return JSONResponse({"detail": "Database is busy, retry shortly"}, status_code=503, headers={"Retry-After": "1"})
+
 # Database Models
 class User(Base):
     __tablename__ = "users"
     
-    id = Column(String, primary_key=True, index=True)
+    id = Column(GUID, primary_key=True, index=True)
     email = Column(String, unique=True, index=True)
     name = Column(String)
     apple_user_id = Column(String, unique=True, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_active = Column(Boolean, default=True)
 
 class UserProfile(Base):
     __tablename__ = "user_profiles"
     
-    id = Column(String, primary_key=True, index=True)
-    user_id = Column(String, index=True)
+    id = Column(GUID, primary_key=True, index=True)
+    user_id = Column(GUID, index=True)
     name = Column(String)
     icon = Column(String)
     restricted_apps = Column(Text)  # JSON string of app identifiers
     restricted_categories = Column(Text)  # JSON string of category identifiers
     is_default = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    version = Column(Integer, nullable=False, default=1)  # optimistic concurrency counter
+
+    __mapper_args__ = {"version_id_col": version}
 
 class BlockingSession(Base):
     __tablename__ = "blocking_sessions"
     
-    id = Column(String, primary_key=True, index=True)
-    user_id = Column(String, index=True)
-    profile_id = Column(String, index=True)
+    id = Column(GUID, primary_key=True, index=True)
+    user_id = Column(GUID, index=True)
+    profile_id = Column(GUID, index=True)
     is_active = Column(Boolean, default=True)
     started_at = Column(DateTime, default=datetime.utcnow)
     ended_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+# At most one active session per (user, profile); see insert_active_session
+ACTIVE_SESSION_INDEX = Index(
+    "uq_blocking_sessions_active",
+    BlockingSession.user_id, BlockingSession.profile_id,
+    unique=True,
+    postgresql_where=BlockingSession.is_active,
+    sqlite_where=BlockingSession.is_active,
+)
+
+class BlockingRollup(Base):
+    """Blocked seconds per user, profile and UTC day, maintained as sessions end"""
+    __tablename__ = "blocking_rollups"
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+    user_id = Column(GUID, primary_key=True)
+    profile_id = Column(GUID, primary_key=True)
+    day = Column(Date, primary_key=True)
+    seconds = Column(Integer, nullable=False, default=0)
+    sessions = Column(Integer, nullable=False, default=0)  # sessions that started on this day
+
+class EffectiveBlocklist(Base):
+    """The /restricted-apps response per (user, profile), materialized when a session starts
+    and rewritten by the unblock endpoints; `version` goes up on every change
+    """
+    __tablename__ = "effective_blocklists"
+
+    user_id = Column(GUID, primary_key=True)
+    profile_id = Column(GUID, primary_key=True)
+    session_id = Column(GUID, nullable=True, index=True)  # active session enforcing it, None when not blocking
+    version = Column(Integer, nullable=False, default=1)
+    payload = Column(Text, nullable=False)  # JSON body served as-is
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class AppCatalogEntry(Base):
+    """Every bundle ID seen in a profile, interned as a small integer"""
+    __tablename__ = "app_catalog"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    bundle_id = Column(String, unique=True, nullable=False)
+
+class ProfileApp(Base):
+    """restricted_apps as (app id, profile) pairs, kept in sync with the JSON column by
+    sync_profile_apps; keyed app-first for "who restricts app X" lookups
+    """
+    __tablename__ = "profile_apps"
+
+    app_id = Column(Integer, primary_key=True)
+    profile_id = Column(GUID, primary_key=True, index=True)
+
+EMPTY_BLOCKLIST_PAYLOAD = '{"restricted_apps": [], "restricted_categories": []}'
+
+def blocklist_payload(profiles):
+    """SQL expression that builds the restricted-apps JSON from a user_profiles row; the
+    columns already hold JSON arrays, so this is plain string concatenation
+    """
+    return (literal('{"restricted_apps": ') + func.coalesce(profiles.c.restricted_apps, "[]")
+            + literal(', "restricted_categories": ') + func.coalesce(profiles.c.restricted_categories, "[]")
+            + literal("}"))
+
+class UserDirectory(Base):
+    """Global lookups by apple_user_id and email, resolving to the user_id that picks the shard.
+    Lives in the primary database and enforces uniqueness across shards.
+    """
+    __tablename__ = "user_directory"
+
+    user_id = Column(GUID, primary_key=True)
+    apple_user_id = Column(String, unique=True, nullable=False)
+    email = Column(String, unique=True, index=True)
+
+class RevokedToken(Base):
+    """Used refresh-token ids and revoked token families ("fam:<id>"), kept until the tokens expire"""
+    __tablename__ = "revoked_tokens"
+
+    jti = Column(String, primary_key=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+class AuditEvent(Base):
+    """Append-only record of state changes: who (actor) did what (action) to whose state, and why"""
+    __tablename__ = "audit_events"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    created_at = Column(DateTime, nullable=False, index=True)
+    actor = Column(String, nullable=False)  # "user:<id>", "admin" or "admin:<X-Actor>" (e.g. "admin:mcp")
+    action = Column(String, nullable=False)
+    user_id = Column(String, index=True)
+    profile_id = Column(String)
+    target = Column(String)  # app bundle id, session id(s), ...
+    reason = Column(Text)
+    details = Column(Text)  # JSON
+
+class SchemaFill(Base):
+    """Derived tables whose initial fill has committed, in every database (see create_schema)"""
+    __tablename__ = "schema_fills"
+
+    name = Column(String, primary_key=True)
+    filled_at = Column(DateTime, nullable=False)
+
+# Audit events are buffered per worker and bulk-inserted every AUDIT_FLUSH_MS (default 1000),
+# or as soon as AUDIT_BATCH_SIZE (default 500) are waiting
+audit_log = AuditLog(
+    engine,
+    AuditEvent.__table__,
+    max_batch=int(os.getenv("AUDIT_BATCH_SIZE", "500")),
+    flush_interval=float(os.getenv("AUDIT_FLUSH_MS", "1000")) / 1000,
+    max_buffer=int(os.getenv("AUDIT_MAX_BUFFER", "100000")),
+)
+# Also flush on server shutdown: workers stopped by serve.py exit without running atexit handlers
+app.router.on_shutdown.append(audit_log.flush)
+
+# Keyset pagination: (user_id, created_at, id) for profiles, (user_id, started_at, id) for session history
+PROFILE_PAGE_INDEX = Index("ix_user_profiles_user_created", UserProfile.user_id, UserProfile.created_at, UserProfile.id)
+SESSION_PAGE_INDEX = Index("ix_blocking_sessions_user_started",
+                           BlockingSession.user_id, BlockingSession.started_at, BlockingSession.id)
+# Bulk export filters and orders each table on (updated_at, id)
+USER_CHANGED_INDEX = Index("ix_users_updated", User.updated_at, User.id)
+PROFILE_CHANGED_INDEX = Index("ix_user_profiles_updated", UserProfile.updated_at, UserProfile.id)
+SESSION_CHANGED_INDEX = Index("ix_blocking_sessions_updated", BlockingSession.updated_at, BlockingSession.id)
+
+def materialize_active_blocklists(conn):
+    """Fill effective_blocklists for sessions that were already active when the table was created"""
+    sessions, profiles, table = BlockingSession.__table__, UserProfile.__table__, EffectiveBlocklist.__table__
+    dialect_insert = postgresql.insert if conn.dialect.name == "postgresql" else sqlite.insert
+    conn.execute(dialect_insert(table).from_select(
+        ["user_id", "profile_id", "session_id", "version", "payload", "updated_at"],
+        select(sessions.c.user_id, sessions.c.profile_id, sessions.c.id, literal(1),
+               blocklist_payload(profiles), literal(datetime.utcnow()))
+        .join(profiles, (profiles.c.id == sessions.c.profile_id) & (profiles.c.user_id == sessions.c.user_id))
+        .where(sessions.c.is_active == True)
+    ).on_conflict_do_nothing())
+
+# profile_apps sync: intern new bundle IDs, then drop and add (app_id, profile_id) pairs so
+# they match each profile's restricted_apps. Profiles that no longer exist lose all pairs.
+PG_PROFILE_APPS_SQL = """
+    WITH desired AS (
+        SELECT DISTINCT p.id AS profile_id, a.app AS bundle_id
+        FROM user_profiles p
+        CROSS JOIN json_array_elements_text(COALESCE(p.restricted_apps, '[]')::json) AS a(app)
+        WHERE {profiles}
+    )
+"""
+SQLITE_PROFILE_APPS_SQL = """
+    WITH desired AS (
+        SELECT DISTINCT p.id AS profile_id, a.value AS bundle_id
+        FROM user_profiles p, json_each(COALESCE(p.restricted_apps, '[]')) AS a
+        WHERE {profiles}
+    )
+"""
+PROFILE_APPS_STATEMENTS = [
+    # NOT EXISTS first so known IDs don't burn sequence values; ON CONFLICT covers concurrent inserts
+    """INSERT INTO app_catalog (bundle_id)
+       SELECT DISTINCT bundle_id FROM desired
+       WHERE NOT EXISTS (SELECT 1 FROM app_catalog c WHERE c.bundle_id = desired.bundle_id)
+       ON CONFLICT (bundle_id) DO NOTHING""",
+    """DELETE FROM profile_apps
+       WHERE {pairs} AND NOT EXISTS (
+           SELECT 1 FROM desired JOIN app_catalog c ON c.bundle_id = desired.bundle_id
+           WHERE desired.profile_id = profile_apps.profile_id AND c.id = profile_apps.app_id
+       )""",
+    """INSERT INTO profile_apps (app_id, profile_id)
+       SELECT c.id, desired.profile_id FROM desired JOIN app_catalog c ON c.bundle_id = desired.bundle_id
+       WHERE true
+       ON CONFLICT (app_id, profile_id) DO NOTHING""",
+]
+PROFILE_APPS_CHUNK = 1000
+
+def sync_profile_apps(conn, profile_ids: Optional[List[str]] = None):
+    """Bring profile_apps in line with restricted_apps for the given profiles (all when None).
+    From a Session, flush first and pass db.connection().
+    """
+    prefix = PG_PROFILE_APPS_SQL if conn.dialect.name == "postgresql" else SQLITE_PROFILE_APPS_SQL
+    if profile_ids is None:
+        chunks, profiles, pairs = [None], "true", "true"
+    else:
+        chunks = [profile_ids[i:i + PROFILE_APPS_CHUNK] for i in range(0, len(profile_ids), PROFILE_APPS_CHUNK)]
+        profiles, pairs = "p.id IN :profile_ids", "profile_apps.profile_id IN :profile_ids"
+    for chunk in chunks:
+        for statement in PROFILE_APPS_STATEMENTS:
+            sql = text(prefix.format(profiles=profiles) + statement.format(pairs=pairs))
+            if chunk is None:
+                conn.execute(sql)
+            else:
+                conn.execute(sql.bindparams(bindparam("profile_ids", expanding=True, type_=GUID)),
+                             {"profile_ids": chunk})
+
+def fill_user_directory(conn, batch_size: int = 5000):
+    """Register every user that existed before user_directory did, reading each shard's users"""
+    users = User.__table__
+    query = select(users.c.id, users.c.apple_user_id, users.c.email).where(users.c.apple_user_id.isnot(None))
+    for bind in dict.fromkeys(shards.engines.values()):
+        source = conn if bind is conn.engine else bind.connect()
+        try:
+            if not inspect(source).has_table(users.name):
+                continue
+            result = source.execute(query.execution_options(stream_results=True, yield_per=batch_size))
+            dialect_insert = postgresql.insert if conn.dialect.name == "postgresql" else sqlite.insert
+            for rows in result.partitions():
+                # Users registered by an earlier, interrupted fill are kept
+                conn.execute(dialect_insert(UserDirectory.__table__).on_conflict_do_nothing(), [
+                    {"user_id": row.id, "apple_user_id": row.apple_user_id, "email": row.email} for row in rows
+                ])
+        finally:
+            if source is not conn:
+                source.close()
+
+# Tables derived from existing rows, filled once when they are first created. Fills must be safe to
+# re-run: one is repeated at the next startup until its schema_fills row has committed.
+DERIVED_TABLES = [
+    (EffectiveBlocklist.__table__, materialize_active_blocklists),
+    (ProfileApp.__table__, sync_profile_apps),
+    (UserDirectory.__table__, fill_user_directory),
+]
+
+# Tables kept in the primary database; every other table holds per-user rows on the user's shard
+# (schema_fills is in both)
+PRIMARY_TABLES = [UserDirectory.__table__, RevokedToken.__table__, AuditEvent.__table__, SchemaFill.__table__]
+SHARDED_TABLES = [t for t in Base.metadata.sorted_tables if t not in PRIMARY_TABLES or t is SchemaFill.__table__]
+
+# Columns added after tables were first created; create_all never alters existing tables
+SCHEMA_UPGRADES = [
+    ("user_profiles", "version", "INTEGER NOT NULL DEFAULT 1"),
+    ("users", "updated_at", "TIMESTAMP"),
+    ("blocking_sessions", "updated_at", "TIMESTAMP"),
+]
+
+def end_duplicate_active_sessions(conn):
+    """End every active session except the oldest one per (user, profile)"""
+    conn.execute(text("""
+        UPDATE blocking_sessions SET is_active = :inactive, ended_at = :now, updated_at = :now
+        WHERE is_active = :active AND EXISTS (
+            SELECT 1 FROM blocking_sessions other
+            WHERE other.user_id = blocking_sessions.user_id
+              AND other.profile_id = blocking_sessions.profile_id
+              AND other.is_active = :active
+              AND (other.started_at < blocking_sessions.started_at
+                   OR (other.started_at = blocking_sessions.started_at AND other.id < blocking_sessions.id))
+        )
+    """), {"active": True, "inactive": False, "now": datetime.utcnow()})
+
+def backfill_updated_at(*fallbacks):
+    """Give rows written before updated_at existed their creation/end time, then make the column
+    NOT NULL. SQLite can't add the constraint to an existing column; new rows always get a value.
+    """
+    def prepare(conn):
+        table = fallbacks[0].table
+        conn.execute(table.update().where(table.c.updated_at.is_(None)).values(
+            updated_at=func.coalesce(*fallbacks, literal(datetime.utcnow()))
+        ))
+        if conn.dialect.name == "postgresql":
+            conn.execute(text(f"ALTER TABLE {table.name} ALTER COLUMN updated_at SET NOT NULL"))
+    return prepare
+
+# Indexes added after tables were first created, with an optional step that makes existing rows fit
+SCHEMA_INDEXES = [
+    (ACTIVE_SESSION_INDEX, end_duplicate_active_sessions),
+    (PROFILE_PAGE_INDEX, None),
+    (SESSION_PAGE_INDEX, None),
+    (USER_CHANGED_INDEX, backfill_updated_at(User.__table__.c.created_at)),
+    (PROFILE_CHANGED_INDEX, backfill_updated_at(UserProfile.__table__.c.created_at)),
+    (SESSION_CHANGED_INDEX, backfill_updated_at(BlockingSession.__table__.c.ended_at,
+                                                BlockingSession.__table__.c.started_at)),
+]
+
+def upgrade_schema(bind):
+    # Inspect through the connection doing the upgrade: a second checkout would wait forever
+    # on a one-connection pool (embedded SQLite's writer)
+    columns = {}
+    with bind.begin() as conn:
+        inspector = inspect(conn)
+        for table, column, ddl in SCHEMA_UPGRADES:
+            if table not in columns:
+                if not inspector.has_table(table):
+                    continue
+                columns[table] = {c["name"] for c in inspector.get_columns(table)}
+            if column not in columns[table]:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+                columns[table].add(column)
+
+    for index, prepare in SCHEMA_INDEXES:
+        with bind.begin() as conn:
+            inspector = inspect(conn)
+            if not inspector.has_table(index.table.name):
+                continue
+            if index.name in {i["name"] for i in inspector.get_indexes(index.table.name)}:
+                continue
+            existing = {c["name"] for c in inspector.get_columns(index.table.name)}
+            if not {c.name for c in index.columns} <= existing:
+                continue
+            if prepare is not None:
+                prepare(conn)
+            index.create(conn)
+
+def text_guid_columns(inspector) -> Dict[str, List[str]]:
+    """GUID columns of existing tables that are still varchar on Postgres, by table"""
+    pending = {}
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        types = {c["name"]: c["type"] for c in inspector.get_columns(table.name)}
+        columns = [c.name for c in table.columns
+                   if isinstance(c.type, GUID) and c.name in types and not isinstance(types[c.name], postgresql.UUID)]
+        if columns:
+            pending[table.name] = columns
+    return pending
+
+def create_schema(bind, tables):
+    """Create missing tables, apply schema upgrades and fill derived tables not filled yet"""
+    if bind.dialect.name == "postgresql" and text_guid_columns(inspect(bind)):
+        # Ids from before native uuid (migrate_guid_columns converts them): new tables get varchar
+        # ids too, because the fills and joins between them and the old tables need matching types
+        use_text_ids(bind.dialect)
+    Base.metadata.create_all(bind=bind, tables=tables)
+    upgrade_schema(bind)
+    fills = SchemaFill.__table__
+    for table, fill in DERIVED_TABLES:
+        if table not in tables:
+            continue
+        # The fill and its marker commit together, so a fill that failed runs again next time
+        with bind.begin() as conn:
+            if conn.execute(select(fills.c.name).where(fills.c.name == table.name)).first() is None:
+                fill(conn)
+                conn.execute(fills.insert().values(name=table.name, filled_at=datetime.utcnow()))
+
+def configure_shards(engines: Dict[str, object], readers: Optional[Dict[str, object]] = None) -> ShardMap:
+    """Route users to `engines` (by shard name), creating the per-user tables where they are missing.
+    `readers` optionally gives each shard a separate read-only engine.
+    """
+    global shards, group_committers
+    for bind in dict.fromkeys(engines.values()):
+        create_schema(bind, SHARDED_TABLES)
+    shards = ShardMap(engines, readers=readers, session_class=ReadWriteSession)
+    group_committers = {
+        name: GroupCommitter(factory, max_items=GROUP_COMMIT_MAX_ITEMS, max_delay=GROUP_COMMIT_MS / 1000)
+        for name, factory in shards.sessionmakers.items()
+    } if GROUP_COMMIT_MS > 0 else {}
+    return shards
+
+# Shards first: the user directory is filled from their users tables
+configure_shards(shard_engines, shard_readers)
+create_schema(engine, PRIMARY_TABLES)
+
+def database_engines() -> Dict[str, object]:
+    """Every engine the app holds connections on, by name: primary and shards, writers and readers"""
+    named = {"primary": engine, "primary:reader": read_engine}
+    for name in shards.names:
+        named[f"shard:{name}"] = shards.engines[name]
+        named[f"shard:{name}:reader"] = shards.readers[name]
+    engines = {}
+    for name, bind in named.items():
+        if bind not in engines.values():
+            engines[name] = bind
+    return engines
+
+# A forked worker (serve.py, gunicorn --preload) must not share pooled connections with its
+# parent: forget the inherited ones without closing them, so the parent's stay usable
+os.register_at_fork(after_in_child=lambda: [bind.dispose(close=False) for bind in database_engines().values()])
+
+UUID_PATTERN = "^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$"
+
+def migrate_guid_columns(bind=None, dry_run: bool = False) -> dict:
+    """Convert id columns that predate GUID from varchar to native uuid on Postgres, in place.
+    Rows keep their ids (tokens, clients and exports refer to them); new rows get UUIDv7s.
+    Rewrites each table once under an exclusive lock, so run it in a maintenance window
+    (scripts/migrate_uuid_columns.py). Other databases already store ids as text: nothing to do.
+    """
+    bind = bind or engine
+    if bind.dialect.name != "postgresql":
+        return {"converted": {}}
+    pending = text_guid_columns(inspect(bind))
+    with bind.begin() as conn:
+        for table, columns in pending.items():
+            for column in columns:
+                malformed = conn.execute(text(
+                    f"SELECT count(*) FROM {table} WHERE {column} IS NOT NULL AND {column} !~ :pattern"
+                ), {"pattern": UUID_PATTERN}).scalar()
+                if malformed:
+                    raise ValueError(f"{table}.{column} has {malformed} values that are not UUIDs")
+        if not dry_run:
+            for table, columns in pending.items():
+                conn.execute(text(f"ALTER TABLE {table} " + ", ".join(
+                    f"ALTER COLUMN {column} TYPE uuid USING {column}::uuid" for column in columns
+                )))
+    return {"converted": pending}
 
 # Pydantic models
 class UserCreate(BaseModel):
@@ -130,6 +667,18 @@ class ProfileUpdate(BaseModel):
     icon: Optional[str] = None
     restricted_apps: Optional[List[str]] = None
     restricted_categories: Optional[List[str]] = None
+    version: Optional[int] = None  # if set, reject the update when the profile has changed since
+
+class ProfilePatch(BaseModel):
+    add_apps: List[str] = []
+    remove_apps: List[str] = []
+    add_categories: List[str] = []
+    remove_categories: List[str] = []
+    version: Optional[int] = None  # if set, reject the patch when the profile has changed since
+
+class ProfileVersion(BaseModel):
+    id: str
+    version: int
 
 class ProfileResponse(BaseModel):
     id: str
@@ -140,6 +689,11 @@ class ProfileResponse(BaseModel):
     is_default: bool
     created_at: datetime
     updated_at: datetime
+    version: int
+
+class ProfilePage(BaseModel):
+    items: List[ProfileResponse]
+    next_cursor: Optional[str]
 
 class BlockingToggleRequest(BaseModel):
     profile_id: str
@@ -156,11 +710,45 @@ class BlockingStatusResponse(BaseModel):
     session_id: Optional[str]
     started_at: Optional[datetime]
 
+class BlockingStatsBucket(BaseModel):
+    start: date
+    seconds: int
+    sessions: int
+    profiles: Dict[str, int]  # seconds per profile
+
+class BlockingStats(BaseModel):
+    period: str
+    since: date
+    until: date
+    total_seconds: int
+    buckets: List[BlockingStatsBucket]
+
+class SessionResponse(BaseModel):
+    id: str
+    profile_id: str
+    is_active: bool
+    started_at: datetime
+    ended_at: Optional[datetime]
+
+class SessionPage(BaseModel):
+    items: List[SessionResponse]
+    next_cursor: Optional[str]
+
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
 
-# Dependency to get database session
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+class ProvisionUser(BaseModel):
+    apple_user_id: str
+    email: Optional[str] = None
+    name: Optional[str] = None
+    profiles: List[ProfileCreate] = []
+
+# Dependency to get database session (the primary database: directory, tokens, audit)
 def get_db():
     db = SessionLocal()
     try:
@@ -168,6 +756,97 @@ def get_db():
     finally:
         db.close()
 
+def get_shard_db(user_id: str):
+    """Session on the shard that holds `user_id`'s rows (admin routes taking a user_id parameter)"""
+    db = shards.session_for(user_id)
+    try:
+        yield db
+    finally:
+        db.close()
+
+# Hot-state cache
+# Keys: user:{id} (UserResponse fields), email:{email} (user id) and state:{user_id}
+# (active sessions plus the block lists of the profiles they enforce). Any commit that
+# touches a user's rows invalidates that user's keys; Core statements that bypass the ORM
+# call mark_user_stale themselves. The hooks are on Session itself, so they cover every shard.
+# Reads go through get_current/set_current (see cache.py): a load that raced a commit
+# can't put the old state back.
+USER_CACHE_FIELDS = ("id", "email", "name", "apple_user_id", "is_active")
+
+def mark_user_stale(db: Session, user_id: str):
+    db.info.setdefault("stale_cache_keys", set()).update((f"user:{user_id}", f"state:{user_id}"))
+
+@event.listens_for(Session, "before_flush")
+def _collect_stale_users(session, flush_context, instances):
+    for obj in itertools.chain(session.new, session.dirty, session.deleted):
+        user_id = obj.id if isinstance(obj, User) else getattr(obj, "user_id", None)
+        if user_id:
+            mark_user_stale(session, user_id)
+        if isinstance(obj, UserDirectory) and obj not in session.new:
+            # The email it was looked up by, before this change
+            emails = [obj.email, *inspect(obj).attrs.email.history.deleted]
+            session.info.setdefault("stale_cache_keys", set()).update(f"email:{e}" for e in emails if e)
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_stale_users(session):
+    stale = session.info.pop("stale_cache_keys", None)
+    if stale and cache is not None:
+        cache.invalidate(*sorted(stale), ttl=CACHE_TTL_SECONDS)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_stale_users(session):
+    session.info.pop("stale_cache_keys", None)
+
+def load_user(db: Session, user_id: str) -> Optional[User]:
+    """User by id; cache hits return a detached User carrying USER_CACHE_FIELDS only"""
+    if cache is not None:
+        fields, generation = cache.get_current(f"user:{user_id}")
+        if fields is not None:
+            return User(**fields)
+    user = db.query(User).filter(User.id == user_id).first()
+    if user is not None and cache is not None:
+        cache.set_current(f"user:{user_id}", {f: getattr(user, f) for f in USER_CACHE_FIELDS},
+                          generation, CACHE_TTL_SECONDS)
+    return user
+
+def user_id_for_email(db: Session, email: str) -> Optional[str]:
+    user_id = generation = None
+    if cache is not None:
+        user_id, generation = cache.get_current(f"email:{email}")
+    if user_id is None:
+        user_id = db.query(UserDirectory.user_id).filter(UserDirectory.email == email).scalar()
+        if user_id is not None and cache is not None:
+            cache.set_current(f"email:{email}", user_id, generation, CACHE_TTL_SECONDS)
+    return user_id
+
+def blocking_state(db: Session, user_id: str) -> dict:
+    """Active sessions (oldest first) and the user's effective blocklists as [version, payload, updated_at]"""
+    state = generation = None
+    if cache is not None:
+        state, generation = cache.get_current(f"state:{user_id}")
+    if state is None:
+        sessions = db.query(BlockingSession).filter(
+            BlockingSession.user_id == user_id,
+            BlockingSession.is_active == True
+        ).order_by(BlockingSession.started_at, BlockingSession.id).all()
+        blocklists = db.query(EffectiveBlocklist).filter(EffectiveBlocklist.user_id == user_id).all()
+        state = {
+            "sessions": [
+                {"id": s.id, "profile_id": s.profile_id, "started_at": s.started_at.isoformat() if s.started_at else None}
+                for s in sessions
+            ],
+            "blocklists": {
+                b.profile_id: [b.version, b.payload, b.updated_at.isoformat() if b.updated_at else None]
+                for b in blocklists
+            },
+        }
+        if cache is not None:
+            cache.set_current(f"state:{user_id}", state, generation, CACHE_TTL_SECONDS)
+    for session in state["sessions"]:
+        if session["started_at"]:
+            session["started_at"] = datetime.fromisoformat(session["started_at"])
+    return state
+
 # Authentication functions
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -175,123 +854,1045 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "typ": "access"})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
+# Refresh tokens rotate: each one is good for a single /auth/refresh and all tokens issued
+# from one login share a family id. Presenting a used token again revokes the whole family.
+REVOKED_TOKEN_PRUNE_RATE = 0.01
+
+def create_refresh_token(user_id: str, family: Optional[str] = None) -> str:
+    jti = os.urandom(16).hex()
+    return jwt.encode({
+        "sub": user_id,
+        "typ": "refresh",
+        "jti": jti,
+        "fam": family or jti,
+        "exp": datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+    }, SECRET_KEY, algorithm=ALGORITHM)
+
+def issue_tokens(user_id: str, family: Optional[str] = None) -> dict:
+    access_token = create_access_token(
+        data={"sub": user_id}, expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+    return {"access_token": access_token, "token_type": "bearer",
+            "refresh_token": create_refresh_token(user_id, family)}
+
+def decode_refresh_token(token: str) -> dict:
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Could not validate credentials",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-        return user_id
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
     except JWTError:
+        payload = {}
+    if payload.get("typ") != "refresh" or not payload.get("sub") or not payload.get("jti") or not payload.get("fam"):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+    return payload
+
+def revoke_token_ids(db: Session, jtis: List[str], expires_at: datetime) -> List[str]:
+    """Record token ids as revoked; returns the ones that were not revoked before"""
+    table = RevokedToken.__table__
+    dialect_insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+    rows = db.execute(
+        dialect_insert(table).values([{"jti": jti, "expires_at": expires_at} for jti in jtis])
+        .on_conflict_do_nothing(index_elements=[table.c.jti])
+        .returning(table.c.jti)
+    ).scalars().all()
+    if random.random() < REVOKED_TOKEN_PRUNE_RATE:
+        db.execute(table.delete().where(table.c.expires_at < datetime.utcnow()))
+    return rows
+
+def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    user_id = access_token_subject(credentials.credentials)
+    if user_id is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    return user_id
 
-def get_current_user(db: Session = Depends(get_db), user_id: str = Depends(verify_token)):
-    user = db.query(User).filter(User.id == user_id).first()
+def require_admin_key(x_admin_key: Optional[str] = Header(None)):
+    """When ADMIN_API_KEY is set, admin-only routes require a matching X-Admin-Key header"""
+    if ADMIN_API_KEY and not hmac.compare_digest(x_admin_key or "", ADMIN_API_KEY):
+        raise HTTPException(status_code=403, detail="Invalid admin key")
+
+def require_configured_admin_key(x_admin_key: Optional[str] = Header(None)):
+    """Bulk data routes fail closed: they are refused outright until ADMIN_API_KEY is set"""
+    if not ADMIN_API_KEY:
+        raise HTTPException(status_code=403, detail="ADMIN_API_KEY is not configured")
+    require_admin_key(x_admin_key)
+
+def admin_actor(x_actor: Optional[str] = Header(None)) -> str:
+    """Audit actor for admin/server calls; callers such as the MCP bridge name themselves with X-Actor"""
+    return f"admin:{x_actor}" if x_actor else "admin"
+
+def get_user_db(user_id: str = Depends(verify_token)):
+    """Session on the authenticated user's shard"""
+    yield from get_shard_db(user_id)
+
+def email_user_id(email: str) -> str:
+    """User id for the `email` parameter (404 if there is none). The directory session is closed
+    right away so the request doesn't hold a primary connection while it works on the shard.
+    """
+    with SessionLocal() as db:
+        user_id = user_id_for_email(db, email)
+    if user_id is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user_id
+
+def get_email_user_db(user_id: str = Depends(email_user_id)):
+    """Session on the shard of the user named by the `email` parameter (404 if there is none)"""
+    yield from get_shard_db(user_id)
+
+def get_current_user(db: Session = Depends(get_user_db), user_id: str = Depends(verify_token)):
+    user = load_user(db, user_id)
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
+def profile_to_response(profile: UserProfile) -> ProfileResponse:
+    return ProfileResponse(
+        id=profile.id,
+        name=profile.name,
+        icon=profile.icon,
+        restricted_apps=json.loads(profile.restricted_apps),
+        restricted_categories=json.loads(profile.restricted_categories),
+        is_default=profile.is_default,
+        created_at=profile.created_at,
+        updated_at=profile.updated_at,
+        version=profile.version
+    )
+
+def session_to_response(session: BlockingSession) -> SessionResponse:
+    return SessionResponse(
+        id=session.id,
+        profile_id=session.profile_id,
+        is_active=session.is_active,
+        started_at=session.started_at,
+        ended_at=session.ended_at
+    )
+
+# HTTP conditional requests: clients poll these reads, so answer 304 when nothing changed.
+# no-cache lets the device keep a private copy but revalidate it on every poll.
+CONDITIONAL_CACHE_CONTROL = "private, no-cache"
+
+def validator_headers(etag: str, last_modified: Optional[datetime]) -> dict:
+    headers = {"ETag": etag, "Cache-Control": CONDITIONAL_CACHE_CONTROL}
+    if last_modified is not None:
+        headers["Last-Modified"] = email.utils.format_datetime(last_modified.replace(tzinfo=timezone.utc), usegmt=True)
+    return headers
+
+def is_not_modified(etag: str, last_modified: Optional[datetime],
+                    if_none_match: Optional[str], if_modified_since: Optional[str]) -> bool:
+    """RFC 9110 evaluation: If-None-Match (weak comparison) wins over If-Modified-Since"""
+    if if_none_match is not None:
+        candidates = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in candidates or etag.removeprefix("W/") in {tag.removeprefix("W/") for tag in candidates}
+    if if_modified_since is not None and last_modified is not None:
+        try:
+            since = email.utils.parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return last_modified.replace(tzinfo=timezone.utc, microsecond=0) <= since
+    return False
+
+def not_modified_response(headers: dict) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+# Keyset pagination helpers
+PAGE_LIMIT_MAX = 200
+
+def encode_cursor(timestamp: datetime, row_id: str) -> str:
+    raw = json.dumps([timestamp.isoformat(), row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        timestamp, row_id = json.loads(raw)
+        return datetime.fromisoformat(timestamp), str(row_id)
+    except (ValueError, TypeError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def keyset_page(query, sort_column, id_column, cursor: Optional[str], limit: int, descending: bool = False):
+    """Fetch one page ordered by (sort_column, id_column) after `cursor`.
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    limit = max(1, min(limit, PAGE_LIMIT_MAX))
+    if cursor:
+        position = tuple_(sort_column, id_column)
+        after = tuple_(*decode_cursor(cursor))
+        query = query.filter(position < after if descending else position > after)
+    if descending:
+        query = query.order_by(sort_column.desc(), id_column.desc())
+    else:
+        query = query.order_by(sort_column, id_column)
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    last = rows[limit - 1]
+    return rows[:limit], encode_cursor(getattr(last, sort_column.key), getattr(last, id_column.key))
+
+# Profile list helpers. Ids in raw SQL are bound as GUID, so a malformed one matches nothing on Postgres
+ID_BINDPARAMS = (bindparam("profile_id", type_=GUID), bindparam("user_id", type_=GUID))
+
+def remove_restricted_app(db: Session, profile_id: str, user_id: str, app_bundle_id: str) -> Optional[List[str]]:
+    """Remove an app from a profile's restricted_apps in a single UPDATE ... RETURNING.
+    Returns the remaining apps, or None if the profile doesn't exist or doesn't restrict the app.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        statement = text("""
+            UPDATE user_profiles
+            SET restricted_apps = COALESCE((
+                    SELECT json_agg(app ORDER BY position)::text
+                    FROM json_array_elements_text(user_profiles.restricted_apps::json) WITH ORDINALITY AS t(app, position)
+                    WHERE app <> :app_bundle_id
+                ), '[]'),
+                version = version + 1,
+                updated_at = :now
+            WHERE id = :profile_id AND user_id = :user_id
+              AND user_profiles.restricted_apps::jsonb ? :app_bundle_id
+            RETURNING restricted_apps
+        """)
+    else:
+        statement = text("""
+            UPDATE user_profiles
+            SET restricted_apps = (
+                    SELECT json_group_array(value)
+                    FROM json_each(user_profiles.restricted_apps)
+                    WHERE value <> :app_bundle_id
+                ),
+                version = version + 1,
+                updated_at = :now
+            WHERE id = :profile_id AND user_id = :user_id
+              AND EXISTS (SELECT 1 FROM json_each(user_profiles.restricted_apps) WHERE value = :app_bundle_id)
+            RETURNING restricted_apps
+        """)
+    row = db.execute(statement.bindparams(*ID_BINDPARAMS), {
+        "profile_id": profile_id,
+        "user_id": user_id,
+        "app_bundle_id": app_bundle_id,
+        "now": datetime.utcnow(),
+    }).first()
+    if not row:
+        return None
+    sync_profile_apps(db.connection(), [profile_id])
+    refresh_blocklist(db, user_id, profile_id)
+    mark_user_stale(db, user_id)
+    return json.loads(row[0])
+
+# Effective blocklist helpers
+def materialize_blocklist(db: Session, user_id: str, profile_id: str, session_id: str):
+    """Write the profile's current block list as the effective blocklist for a new session"""
+    profiles, table = UserProfile.__table__, EffectiveBlocklist.__table__
+    dialect_insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+    statement = dialect_insert(table).from_select(
+        ["user_id", "profile_id", "session_id", "version", "payload", "updated_at"],
+        select(profiles.c.user_id, profiles.c.id, literal(session_id), literal(1),
+               blocklist_payload(profiles), literal(datetime.utcnow()))
+        .where(profiles.c.id == profile_id, profiles.c.user_id == user_id)
+    )
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.profile_id],
+        set_={
+            "session_id": statement.excluded.session_id,
+            "version": table.c.version + 1,
+            "payload": statement.excluded.payload,
+            "updated_at": statement.excluded.updated_at,
+        }
+    ))
+
+def refresh_blocklist(db: Session, user_id: str, profile_id: str):
+    """Rebuild an active effective blocklist after the profile's lists changed"""
+    profiles, table = UserProfile.__table__, EffectiveBlocklist.__table__
+    db.execute(
+        update(table)
+        .where(table.c.user_id == user_id, table.c.profile_id == profile_id, table.c.session_id.isnot(None))
+        .values(
+            payload=select(blocklist_payload(profiles))
+            .where(profiles.c.id == table.c.profile_id, profiles.c.user_id == table.c.user_id)
+            .scalar_subquery(),
+            version=table.c.version + 1,
+            updated_at=datetime.utcnow()
+        )
+    )
+
+def clear_blocklists(db: Session, session_ids: List[str]):
+    """Ended sessions enforce nothing: their effective blocklists become empty"""
+    table = EffectiveBlocklist.__table__
+    db.execute(
+        update(table)
+        .where(table.c.session_id.in_(session_ids))
+        .values(session_id=None, payload=EMPTY_BLOCKLIST_PAYLOAD, version=table.c.version + 1,
+                updated_at=datetime.utcnow())
+    )
+
+def effective_blocklist(db: Session, user_id: str, profile_id: str) -> Tuple[int, str, Optional[datetime]]:
+    """(version, payload, updated_at) for the restricted-apps endpoint; (0, empty, None) if never blocked"""
+    if cache is not None:
+        entry = blocking_state(db, user_id)["blocklists"].get(profile_id)
+        if entry:
+            version, payload, updated_at = entry
+            return version, payload, datetime.fromisoformat(updated_at) if updated_at else None
+    else:
+        entry = db.query(EffectiveBlocklist.version, EffectiveBlocklist.payload, EffectiveBlocklist.updated_at).filter(
+            EffectiveBlocklist.user_id == user_id,
+            EffectiveBlocklist.profile_id == profile_id
+        ).first()
+        if entry:
+            return tuple(entry)
+    return 0, EMPTY_BLOCKLIST_PAYLOAD, None
+
+# Profile list deltas: new list = existing items (in order) + added items not yet present,
+# minus removed items; computed inside the UPDATE so only the delta crosses the wire
+PG_LIST_DELTA_SQL = """COALESCE((
+        SELECT json_agg(item ORDER BY ord)::text FROM (
+            SELECT item, min(ord) AS ord FROM (
+                SELECT item, ord FROM json_array_elements_text(COALESCE(user_profiles.{column}, '[]')::json)
+                    WITH ORDINALITY AS existing(item, ord)
+                UNION ALL
+                SELECT item, ord + 1000000000 FROM json_array_elements_text(CAST(:add_{column} AS json))
+                    WITH ORDINALITY AS added(item, ord)
+            ) AS combined
+            WHERE item NOT IN (SELECT item FROM json_array_elements_text(CAST(:remove_{column} AS json)) AS removed(item))
+            GROUP BY item
+        ) AS deduped
+    ), '[]')"""
+SQLITE_LIST_DELTA_SQL = """(
+        SELECT json_group_array(item) FROM (
+            SELECT item, min(ord) AS ord FROM (
+                SELECT value AS item, key AS ord FROM json_each(COALESCE(user_profiles.{column}, '[]'))
+                UNION ALL
+                SELECT value, key + 1000000000 FROM json_each(:add_{column})
+            )
+            WHERE item NOT IN (SELECT value FROM json_each(:remove_{column}))
+            GROUP BY item
+            ORDER BY ord
+        )
+    )"""
+
+def patch_profile_lists(db: Session, profile_id: str, user_id: str, patch: ProfilePatch) -> Optional[int]:
+    """Apply add/remove operations to restricted_apps/restricted_categories in one UPDATE ... RETURNING.
+    Returns the new version, or None if the profile doesn't exist or patch.version is stale.
+    """
+    template = PG_LIST_DELTA_SQL if db.get_bind().dialect.name == "postgresql" else SQLITE_LIST_DELTA_SQL
+    params = {"profile_id": profile_id, "user_id": user_id, "now": datetime.utcnow()}
+    assignments = ["version = version + 1", "updated_at = :now"]
+    for column, added, removed in (
+        ("restricted_apps", patch.add_apps, patch.remove_apps),
+        ("restricted_categories", patch.add_categories, patch.remove_categories),
+    ):
+        if added or removed:
+            assignments.append(f"{column} = {template.format(column=column)}")
+            params[f"add_{column}"] = json.dumps(added)
+            params[f"remove_{column}"] = json.dumps(removed)
+    condition = "id = :profile_id AND user_id = :user_id"
+    if patch.version is not None:
+        condition += " AND version = :version"
+        params["version"] = patch.version
+
+    row = db.execute(text(
+        f"UPDATE user_profiles SET {', '.join(assignments)} WHERE {condition} RETURNING version"
+    ).bindparams(*ID_BINDPARAMS), params).first()
+    if not row:
+        return None
+    if patch.add_apps or patch.remove_apps:
+        sync_profile_apps(db.connection(), [profile_id])
+    refresh_blocklist(db, user_id, profile_id)
+    mark_user_stale(db, user_id)
+    return row[0]
+
+# App catalog: bundle ID <-> integer translation. Catalog ids never change once assigned,
+# so every process can keep its own copy without invalidation. Each shard interns bundle IDs
+# on its own, so the copy is kept per shard (db.info["shard"]).
+class AppCatalog:
+    def __init__(self, max_entries: int = 100000):
+        self.max_entries = max_entries
+        self._ids = {}
+        self._bundle_ids = {}
+        self._lock = threading.Lock()
+
+    def _maps(self, db: Session) -> Tuple[dict, dict]:
+        shard = db.info.get("shard")
+        with self._lock:
+            return self._ids.setdefault(shard, {}), self._bundle_ids.setdefault(shard, {})
+
+    def _remember(self, db: Session, rows):
+        ids, bundle_ids = self._maps(db)
+        with self._lock:
+            if len(ids) + len(rows) > self.max_entries:
+                ids.clear()
+                bundle_ids.clear()
+            for app_id, bundle_id in rows:
+                ids[bundle_id] = app_id
+                bundle_ids[app_id] = bundle_id
+
+    def ids(self, db: Session, bundle_ids: List[str]) -> Dict[str, int]:
+        """Catalog ids for the known bundle IDs; unknown ones are left out"""
+        ids, _ = self._maps(db)
+        missing = [b for b in bundle_ids if b not in ids]
+        if missing:
+            self._remember(db, db.query(AppCatalogEntry.id, AppCatalogEntry.bundle_id).filter(
+                AppCatalogEntry.bundle_id.in_(missing)
+            ).all())
+        return {b: ids[b] for b in bundle_ids if b in ids}
+
+    def bundle_ids(self, db: Session, app_ids: List[int]) -> Dict[int, str]:
+        _, bundle_ids = self._maps(db)
+        missing = [i for i in app_ids if i not in bundle_ids]
+        if missing:
+            self._remember(db, db.query(AppCatalogEntry.id, AppCatalogEntry.bundle_id).filter(
+                AppCatalogEntry.id.in_(missing)
+            ).all())
+        return {i: bundle_ids[i] for i in app_ids if i in bundle_ids}
+
+app_catalog = AppCatalog(int(os.getenv("APP_CATALOG_CACHE_SIZE", "100000")))
+
+# Blocking session helpers
+def insert_active_session(db: Session, user_id: str, profile_id: str) -> Tuple[str, bool]:
+    """Start a blocking session with one INSERT ... ON CONFLICT DO NOTHING RETURNING.
+    The partial unique index makes concurrent starts race-free. Returns (session_id, created).
+    """
+    dialect_insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+    table = BlockingSession.__table__
+    statement = dialect_insert(table).values(
+        id=new_id(),
+        user_id=user_id,
+        profile_id=profile_id,
+        is_active=True,
+        started_at=datetime.utcnow()
+    ).on_conflict_do_nothing(
+        index_elements=[table.c.user_id, table.c.profile_id],
+        index_where=table.c.is_active
+    ).returning(table.c.id)
+    row = db.execute(statement).first()
+    if row:
+        materialize_blocklist(db, user_id, profile_id, row[0])
+        mark_user_stale(db, user_id)
+        return row[0], True
+
+    # Lost the race (or already blocking): report the session that holds the slot
+    existing_id = db.query(BlockingSession.id).filter(
+        BlockingSession.user_id == user_id,
+        BlockingSession.profile_id == profile_id,
+        BlockingSession.is_active == True
+    ).scalar()
+    return existing_id, False
+
+# Blocking-time rollups
+# Every path that ends a session goes through end_sessions, which flips is_active in one
+# UPDATE ... RETURNING and adds the ended sessions to blocking_rollups in the same
+# transaction, so a session is counted exactly once even if two requests race to end it.
+def rollup_buckets(rows) -> Dict[Tuple[str, str, date], List[int]]:
+    """Split ended sessions into per-UTC-day [seconds, sessions] buckets"""
+    buckets = {}
+    for row in rows:
+        if row.started_at is None or row.ended_at is None:
+            continue
+        first = buckets.setdefault((row.user_id, row.profile_id, row.started_at.date()), [0, 0])
+        first[1] += 1
+        cursor = row.started_at
+        while cursor < row.ended_at:
+            chunk_end = min(datetime.combine(cursor.date() + timedelta(days=1), datetime.min.time()), row.ended_at)
+            bucket = buckets.setdefault((row.user_id, row.profile_id, cursor.date()), [0, 0])
+            bucket[0] += round((chunk_end - cursor).total_seconds())
+            cursor = chunk_end
+    return buckets
+
+def add_rollups(conn, rows):
+    """Add ended sessions to blocking_rollups with a single upsert"""
+    buckets = rollup_buckets(rows)
+    if not buckets:
+        return
+    table = BlockingRollup.__table__
+    dialect_insert = postgresql.insert if conn.dialect.name == "postgresql" else sqlite.insert
+    statement = dialect_insert(table).values([
+        {"user_id": user_id, "profile_id": profile_id, "day": day, "seconds": seconds, "sessions": sessions}
+        for (user_id, profile_id, day), (seconds, sessions) in buckets.items()
+    ])
+    conn.execute(statement.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.profile_id, table.c.day],
+        set_={
+            "seconds": table.c.seconds + statement.excluded.seconds,
+            "sessions": table.c.sessions + statement.excluded.sessions,
+        }
+    ))
+
+def end_sessions(db: Session, *criteria) -> list:
+    """End the active sessions matching `criteria` and roll them up. Returns the ended rows"""
+    table = BlockingSession.__table__
+    now = datetime.utcnow()
+    rows = db.execute(
+        update(table)
+        .where(table.c.is_active == True, *criteria)
+        .values(is_active=False, ended_at=now, updated_at=now)
+        .returning(table.c.id, table.c.user_id, table.c.profile_id, table.c.started_at, table.c.ended_at)
+    ).all()
+    add_rollups(db.connection(), rows)
+    if rows:
+        clear_blocklists(db, [row.id for row in rows])
+    for row in rows:
+        mark_user_stale(db, row.user_id)
+    return rows
+
+async def commit_write(db: Session, write):
+    """Run write(session) and commit it: directly on `db`, or batched with other requests'
+    writes to the same shard when group commit is on. Returns write's result once it is durable.
+    """
+    group_committer = group_committers.get(db.info.get("shard"))
+    if group_committer is None:
+        result = write(db)
+        db.commit()
+        return result
+    return await asyncio.wrap_future(group_committer.submit(write))
+
+async def coalesced_read(key: tuple, read, session_factory=None):
+    """Run `read(session)` once for all concurrent requests with the same key, in its own session
+    from `session_factory` (default: the primary database). The call can outlive a request that
+    timed out. Errors it raises reach every waiter.
+    """
+    def run():
+        db = (session_factory or SessionLocal)()
+        try:
+            return read(db)
+        finally:
+            db.close()
+    try:
+        return await single_flight.do(key, run)
+    except asyncio.TimeoutError:  # what wait_for raises; only an alias of TimeoutError from 3.11
+        raise HTTPException(status_code=503, detail="Timed out waiting for a status lookup", headers={"Retry-After": "1"})
+
+def rebuild_rollups(batch_size: int = 5000, bind=None) -> dict:
+    """Recompute blocking_rollups from every ended session in one transaction per shard (backfill),
+    on all shards in parallel unless `bind` names one database.
+    Safe to re-run; sessions are streamed and added batch_size at a time.
+    """
+    if bind is None:
+        results = shards.scatter(lambda name, shard: rebuild_rollups(batch_size, shard))
+        return {"sessions_rolled_up": sum(r["sessions_rolled_up"] for r in results.values())}
+    table = BlockingSession.__table__
+    sessions = 0
+    with bind.begin() as conn:
+        conn.execute(BlockingRollup.__table__.delete())
+        result = conn.execute(
+            select(table.c.user_id, table.c.profile_id, table.c.started_at, table.c.ended_at)
+            .where(table.c.is_active == False, table.c.ended_at.isnot(None))
+            .execution_options(stream_results=True, yield_per=batch_size)
+        )
+        for rows in result.partitions():
+            add_rollups(conn, rows)
+            sessions += len(rows)
+    return {"sessions_rolled_up": sessions}
+
+def blocking_stats(db: Session, user_id: str, period: str, since: Optional[date], until: Optional[date],
+                   profile_id: Optional[str] = None) -> BlockingStats:
+    """Blocked time per day or ISO week (Monday start) between since and until inclusive,
+    read from blocking_rollups only
+    """
+    if period not in ("day", "week"):
+        raise HTTPException(status_code=400, detail="period must be 'day' or 'week'")
+    until = until or datetime.utcnow().date()
+    since = since or until - timedelta(days=29)
+    if since > until:
+        raise HTTPException(status_code=400, detail="since must not be after until")
+
+    query = db.query(BlockingRollup).filter(
+        BlockingRollup.user_id == user_id,
+        BlockingRollup.day >= since,
+        BlockingRollup.day <= until
+    )
+    if profile_id:
+        query = query.filter(BlockingRollup.profile_id == profile_id)
+
+    buckets = {}
+    for rollup in query:
+        start = rollup.day - timedelta(days=rollup.day.weekday()) if period == "week" else rollup.day
+        bucket = buckets.setdefault(start, BlockingStatsBucket(start=start, seconds=0, sessions=0, profiles={}))
+        bucket.seconds += rollup.seconds
+        bucket.sessions += rollup.sessions
+        bucket.profiles[rollup.profile_id] = bucket.profiles.get(rollup.profile_id, 0) + rollup.seconds
+
+    ordered = [buckets[start] for start in sorted(buckets)]
+    return BlockingStats(period=period, since=since, until=until,
+                         total_seconds=sum(b.seconds for b in ordered), buckets=ordered)
+
+# Bulk export, by updated_at (indexed with id, and backfilled for older rows by upgrade_schema)
+EXPORT_TABLES = {
+    "users": ("user", User.__table__),
+    "profiles": ("profile", UserProfile.__table__),
+    "sessions": ("session", BlockingSession.__table__),
+}
+EXPORT_JSON_COLUMNS = {"restricted_apps", "restricted_categories"}
+
+def export_row(record_type: str, row) -> str:
+    record = {"type": record_type}
+    for key, value in row.items():
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        elif key in EXPORT_JSON_COLUMNS and value is not None:
+            value = json.loads(value)
+        record[key] = value
+    return json.dumps(record) + "\n"
+
+def iter_export_ndjson(
+    tables: List[str],
+    updated_since: Optional[datetime] = None,
+    updated_until: Optional[datetime] = None,
+    batch_size: int = 1000,
+    bind=None,
+) -> Iterator[str]:
+    """Yield one NDJSON line per row, streaming each table through a server-side cursor
+    so memory stays flat regardless of table size. Without `bind`, every shard is read at
+    once and the streams are merged, so rows still come out ordered by change time.
+    """
+    binds = [bind] if bind is not None else list(dict.fromkeys(shards.readers.values()))
+    with contextlib.ExitStack() as stack:
+        connections = [
+            stack.enter_context(b.connect()).execution_options(stream_results=True, yield_per=batch_size)
+            for b in binds
+        ]
+        for name in tables:
+            record_type, table = EXPORT_TABLES[name]
+            changed_at = table.c.updated_at
+            query = select(table)
+            if updated_since is not None:
+                query = query.where(changed_at >= updated_since)
+            if updated_until is not None:
+                query = query.where(changed_at < updated_until)
+            query = query.order_by(changed_at, table.c.id)
+            streams = [conn.execute(query).mappings() for conn in connections]
+            for row in heapq.merge(*streams, key=lambda row: (row["updated_at"], row["id"])):
+                yield export_row(record_type, row)
+
+# Bulk provisioning
+# NDJSON input has one ProvisionUser object per line. CSV input has one row per
+# (user, profile) with PROVISION_CSV_COLUMNS as header; a user's rows must be
+# contiguous, list columns are ';'-separated, and an empty profile_name adds only the user.
+PROVISION_CSV_COLUMNS = [
+    "apple_user_id", "email", "name",
+    "profile_name", "profile_icon", "restricted_apps", "restricted_categories", "is_default",
+]
+
+class ProvisionParser:
+    """Turns NDJSON or CSV lines into validated ProvisionUser records, one line at a time,
+    collecting counts and per-line errors as it goes
+    """
+
+    def __init__(self, format: str = "ndjson"):
+        if format not in ("ndjson", "csv"):
+            raise ValueError("format must be 'ndjson' or 'csv'")
+        self.format = format
+        self.counts = {"users_created": 0, "profiles_created": 0, "users_skipped": 0, "errors": 0}
+        self.errors = []
+        self._line_number = 0
+        self._header = None
+        self._current = None
+        self._current_line = 0
+
+    def feed(self, line: Union[str, bytes]) -> List[ProvisionUser]:
+        """Parse one line; bytes are decoded as UTF-8 here so a bad byte is a per-line error"""
+        self._line_number += 1
+        if not line.strip():
+            return []
+        try:
+            if isinstance(line, bytes):
+                line = line.decode("utf-8")
+            if self.format == "ndjson":
+                return self._validate(self._line_number, json.loads(line))
+            row = next(csv.reader([line]))
+            if self._header is None:
+                self._header = row
+                return []
+            return self._add_csv_row(dict(zip(self._header, row)))
+        except (ValueError, csv.Error) as e:
+            self._add_error(self._line_number, str(e))
+            return []
+
+    def finish(self) -> List[ProvisionUser]:
+        if self._current is None:
+            return []
+        line_number, record = self._current_line, self._current
+        self._current = None
+        return self._validate(line_number, record)
+
+    def add_batch(self, counts: dict):
+        for key, value in counts.items():
+            self.counts[key] += value
+
+    def result(self) -> dict:
+        return {**self.counts, "error_details": self.errors}
+
+    def _add_csv_row(self, row: dict) -> List[ProvisionUser]:
+        completed = []
+        if self._current is None or row.get("apple_user_id") != self._current["apple_user_id"]:
+            completed = self.finish()
+            self._current = {
+                "apple_user_id": row.get("apple_user_id"),
+                "email": row.get("email") or None,
+                "name": row.get("name") or None,
+                "profiles": [],
+            }
+            self._current_line = self._line_number
+        if row.get("profile_name"):
+            self._current["profiles"].append({
+                "name": row["profile_name"],
+                "icon": row.get("profile_icon") or "bell.slash",
+                "restricted_apps": [a for a in (row.get("restricted_apps") or "").split(";") if a],
+                "restricted_categories": [c for c in (row.get("restricted_categories") or "").split(";") if c],
+                "is_default": (row.get("is_default") or "").strip().lower() in ("1", "true", "yes"),
+            })
+        return completed
+
+    def _validate(self, line_number: int, record) -> List[ProvisionUser]:
+        try:
+            return [ProvisionUser(**record)]
+        except (ValidationError, TypeError) as e:
+            self._add_error(line_number, str(e))
+            return []
+
+    def _add_error(self, line_number: int, error: str):
+        self.counts["errors"] += 1
+        if len(self.errors) < 100:
+            self.errors.append({"line": line_number, "error": error})
+
+def _copy_field(value) -> str:
+    # NULL is an unquoted \N and every other value is quoted, so neither an empty string
+    # nor a literal "\N" can be read back as NULL
+    if value is None:
+        return "\\N"
+    return '"' + str(value).replace('"', '""') + '"'
+
+def _copy_rows(conn, table, rows: List[dict]):
+    """Load rows with COPY ... FROM STDIN (Postgres only)"""
+    columns = [c.name for c in table.columns]
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write(",".join(_copy_field(row.get(c)) for c in columns) + "\n")
+    buffer.seek(0)
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buffer
+        )
+    finally:
+        cursor.close()
+
+def provision_batch(users: List[ProvisionUser]) -> dict:
+    """Insert a batch of users and their profiles, skipping users whose apple_user_id or email
+    already exists. Every user gets a default profile, as in register_user. The batch is claimed
+    in the user directory first, then each shard loads its users in one transaction. If a shard
+    fails, its users stay claimed and get their user row and default profile on first register.
+    """
+    now = datetime.utcnow()
+    directory = UserDirectory.__table__
+    user_rows, profile_rows = [], []
+    with engine.begin() as conn:
+        apple_ids = [u.apple_user_id for u in users]
+        emails = [u.email for u in users if u.email]
+        taken_apple_ids = set(conn.execute(
+            select(directory.c.apple_user_id).where(directory.c.apple_user_id.in_(apple_ids))
+        ).scalars())
+        taken_emails = set(conn.execute(
+            select(directory.c.email).where(directory.c.email.in_(emails))
+        ).scalars()) if emails else set()
+
+        for user in users:
+            if user.apple_user_id in taken_apple_ids or (user.email and user.email in taken_emails):
+                continue
+            taken_apple_ids.add(user.apple_user_id)
+            if user.email:
+                taken_emails.add(user.email)
+            user_id = new_id()
+            user_rows.append({
+                "id": user_id, "email": user.email, "name": user.name, "apple_user_id": user.apple_user_id,
+                "created_at": now, "updated_at": now, "is_active": True,
+            })
+            profiles = list(user.profiles)
+            if not any(p.is_default for p in profiles):
+                profiles.insert(0, ProfileCreate(name="Default", is_default=True))
+            for profile in profiles:
+                profile_rows.append({
+                    "id": new_id(), "user_id": user_id, "name": profile.name, "icon": profile.icon,
+                    "restricted_apps": json.dumps(profile.restricted_apps),
+                    "restricted_categories": json.dumps(profile.restricted_categories),
+                    "is_default": profile.is_default, "created_at": now, "updated_at": now, "version": 1,
+                })
+        if user_rows:
+            conn.execute(directory.insert(), [
+                {"user_id": row["id"], "apple_user_id": row["apple_user_id"], "email": row["email"]}
+                for row in user_rows
+            ])
+
+    by_shard = {}
+    for row in user_rows:
+        by_shard.setdefault(shards.name_for(row["id"]), ([], []))[0].append(row)
+    for row in profile_rows:
+        by_shard[shards.name_for(row["user_id"])][1].append(row)
+
+    def load(name, bind):
+        shard_users, shard_profiles = by_shard[name]
+        with bind.begin() as conn:
+            if conn.dialect.name == "postgresql":
+                _copy_rows(conn, User.__table__, shard_users)
+                _copy_rows(conn, UserProfile.__table__, shard_profiles)
+            else:
+                conn.execute(User.__table__.insert(), shard_users)
+                conn.execute(UserProfile.__table__.insert(), shard_profiles)
+            sync_profile_apps(conn, [row["id"] for row in shard_profiles if row["restricted_apps"] != "[]"])
+
+    shards.scatter(load, list(by_shard))
+    return {"users_created": len(user_rows), "profiles_created": len(profile_rows),
+            "users_skipped": len(users) - len(user_rows)}
+
+def provision_lines(lines: Iterable[Union[str, bytes]], format: str = "ndjson", batch_size: int = 5000) -> dict:
+    """Provision users from NDJSON/CSV lines in batches of batch_size"""
+    parser = ProvisionParser(format)
+    batch = []
+    for line in lines:
+        batch.extend(parser.feed(line))
+        if len(batch) >= batch_size:
+            parser.add_batch(provision_batch(batch))
+            batch = []
+    batch.extend(parser.finish())
+    if batch:
+        parser.add_batch(provision_batch(batch))
+    return parser.result()
+
 # API Endpoints
 @app.get("/")
 async def root():
     return {"message": "PokeDaddy Server API", "version": "1.0.0", "status": "running"}
 
+# Warmup: before a worker accepts requests (and again from /ready until it succeeds), open up to
+# WARMUP_CONNECTIONS pooled connections per database and run the hot reads (user lookup, blocking
+# status, restricted apps, email lookup) once, so their SQL is compiled and cached. The first
+# real requests then find open connections and cached statements.
+WARMUP_CONNECTIONS = int(os.getenv("WARMUP_CONNECTIONS", "5"))
+READY_TIMEOUT_SECONDS = float(os.getenv("READY_TIMEOUT_MS", "2000")) / 1000
+# Startup waits at most this long: a worker must start (and heartbeat, under serve.py) even with a stalled database
+WARMUP_TIMEOUT_SECONDS = float(os.getenv("WARMUP_TIMEOUT_MS", "5000")) / 1000
+WARMUP_ID = "00000000-0000-0000-0000-000000000000"
+warmup_state = {"done": False, "seconds": None, "connections": 0, "error": None}
+warmup_lock = threading.Lock()
+
+def open_pool_connections(bind, count: int) -> int:
+    """Check out `count` connections at once (at most the pool size) and return them, so the pool keeps them open"""
+    count = min(count, bind.pool.size()) if isinstance(bind.pool, QueuePool) else min(count, 1)
+    with contextlib.ExitStack() as stack:
+        for _ in range(count):
+            stack.enter_context(bind.connect()).execute(text("SELECT 1"))
+    return count
+
+def warm_up():
+    """Open pool connections and compile the hot statements; a no-op once it has succeeded"""
+    if warmup_state["done"] or not warmup_lock.acquire(blocking=False):
+        return
+    try:
+        started = time.perf_counter()
+        connections = sum(open_pool_connections(bind, WARMUP_CONNECTIONS) for bind in database_engines().values())
+        # The ids match no rows; the statements are what gets cached
+        for factory in shards.sessionmakers.values():
+            with factory() as db:
+                load_user(db, WARMUP_ID)
+                blocking_status(db, WARMUP_ID)
+                effective_blocklist(db, WARMUP_ID, WARMUP_ID)
+        with SessionLocal() as db:
+            user_id_for_email(db, "warmup@invalid")
+        warmup_state.update(done=True, seconds=round(time.perf_counter() - started, 3), connections=connections, error=None)
+    except Exception as e:
+        warmup_state["error"] = type(e).__name__
+        logger.warning("warmup failed, /ready will retry: %s", e)
+    finally:
+        warmup_lock.release()
+
+async def warm_up_on_startup():
+    """Start warming up, but only wait WARMUP_TIMEOUT_MS for it. A warmup still running then
+    finishes in the background; one that failed is retried by /ready.
+    """
+    try:
+        await asyncio.wait_for(run_in_threadpool(warm_up), WARMUP_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        logger.warning("warmup still running after %.1fs, starting without it", WARMUP_TIMEOUT_SECONDS)
+
+app.router.on_startup.append(warm_up_on_startup)
+
+def ping_database(bind) -> float:
+    started = time.perf_counter()
+    with bind.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    return round((time.perf_counter() - started) * 1000, 2)
+
+def pool_status(bind) -> dict:
+    pool = bind.pool
+    if not isinstance(pool, QueuePool):
+        return {"status": pool.status()}
+    return {"size": pool.size(), "open": pool.size() + pool.overflow(), "idle": pool.checkedin(),
+            "checked_out": pool.checkedout(), "overflow": max(pool.overflow(), 0)}
+
+@app.get("/ready")
+async def ready():
+    """Readiness for load balancers: 200 once this worker has warmed up and every database
+    answers within READY_TIMEOUT_MS, else 503. Reports each database's latency and pool usage.
+    """
+    async def check(bind) -> dict:
+        try:
+            latency = await asyncio.wait_for(run_in_threadpool(ping_database, bind), READY_TIMEOUT_SECONDS)
+            return {"reachable": True, "latency_ms": latency, "pool": pool_status(bind)}
+        except asyncio.TimeoutError:
+            return {"reachable": False, "error": "timed out", "pool": pool_status(bind)}
+        except Exception as e:
+            return {"reachable": False, "error": type(e).__name__, "pool": pool_status(bind)}
+
+    if not warmup_state["done"]:
+        with contextlib.suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(run_in_threadpool(warm_up), READY_TIMEOUT_SECONDS)
+    engines = database_engines()
+    databases = dict(zip(engines, await asyncio.gather(*(check(bind) for bind in engines.values()))))
+    is_ready = warmup_state["done"] and all(d["reachable"] for d in databases.values())
+    return JSONResponse(
+        {"ready": is_ready, "worker": os.getpid(), "warmup": warmup_state, "databases": databases},
+        status_code=200 if is_ready else 503,
+    )
+
 @app.post("/auth/register", response_model=Token)
 async def register_user(user_data: UserCreate, db: Session = Depends(get_db)):
-    # Check if user already exists
-    existing_user = db.query(User).filter(User.apple_user_id == user_data.apple_user_id).first()
-    if existing_user:
-        # If new profile info is provided, update missing fields (email/name may be absent on later Apple sign-ins)
-        updated = False
-        if user_data.email and (existing_user.email is None or existing_user.email == ""):
-            existing_user.email = user_data.email
-            updated = True
-        if user_data.name and (existing_user.name is None or existing_user.name == ""):
-            existing_user.name = user_data.name
-            updated = True
-        if updated:
-            db.add(existing_user)
-            db.commit()
-
-        # User exists, return token
-        access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-        access_token = create_access_token(
-            data={"sub": existing_user.id}, expires_delta=access_token_expires
+    # Check if user already exists; the directory knows every apple_user_id across shards
+    entry = db.query(UserDirectory).filter(UserDirectory.apple_user_id == user_data.apple_user_id).first()
+    user_id = entry.user_id if entry else new_id()
+    # One session (and transaction) when the user's shard is the primary database
+    user_db = db if shards.engine_for(user_id) is db.bind else shards.session_for(user_id)
+    try:
+        if entry is None:
+            # Claim the apple_user_id (and email) before writing to the user's shard
+            entry = UserDirectory(user_id=user_id, apple_user_id=user_data.apple_user_id, email=user_data.email)
+            db.add(entry)
+            if user_db is not db:
+                db.commit()
+
+        existing_user = user_db.query(User).filter(User.id == user_id).first()
+        if existing_user:
+            # If new profile info is provided, update missing fields (email/name may be absent on later Apple sign-ins)
+            updated = False
+            if user_data.email and (existing_user.email is None or existing_user.email == ""):
+                entry.email = user_data.email
+                existing_user.email = user_data.email
+                updated = True
+            if user_data.name and (existing_user.name is None or existing_user.name == ""):
+                existing_user.name = user_data.name
+                updated = True
+            if updated:
+                if user_db is not db:
+                    db.commit()
+                user_db.add(existing_user)
+                user_db.commit()
+
+            # User exists, return tokens
+            return issue_tokens(user_id)
+
+        # Create new user (or finish one whose shard write failed after the directory claim)
+        db_user = User(
+            id=user_id,
+            apple_user_id=user_data.apple_user_id,
+            email=entry.email,
+            name=user_data.name
         )
-        return {"access_token": access_token, "token_type": "bearer"}
-    
-    # Create new user
-    import uuid
-    user_id = str(uuid.uuid4())
-    db_user = User(
-        id=user_id,
-        apple_user_id=user_data.apple_user_id,
-        email=user_data.email,
-        name=user_data.name
-    )
-    db.add(db_user)
-    
-    # Create default profile
-    profile_id = str(uuid.uuid4())
-    default_profile = UserProfile(
-        id=profile_id,
-        user_id=user_id,
-        name="Default",
-        icon="bell.slash",
-        restricted_apps="[]",
-        restricted_categories="[]",
-        is_default=True
-    )
-    db.add(default_profile)
+        user_db.add(db_user)
+
+        # Create default profile
+        profile_id = new_id()
+        default_profile = UserProfile(
+            id=profile_id,
+            user_id=user_id,
+            name="Default",
+            icon="bell.slash",
+            restricted_apps="[]",
+            restricted_categories="[]",
+            is_default=True
+        )
+        user_db.add(default_profile)
+        user_db.commit()
+    finally:
+        if user_db is not db:
+            user_db.close()
+    audit_log.record("user.register", f"user:{user_id}", user_id=user_id)
+
+    return issue_tokens(user_id)
+
+@app.post("/auth/refresh", response_model=Token)
+async def refresh_tokens(request: RefreshRequest, db: Session = Depends(get_db)):
+    """Exchange a refresh token for a new access/refresh pair without touching the users table"""
+    payload = decode_refresh_token(request.refresh_token)
+    family_key = f"fam:{payload['fam']}"
+    if db.query(RevokedToken.jti).filter(RevokedToken.jti == family_key).first():
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Refresh token revoked")
+
+    expires_at = datetime.utcfromtimestamp(payload["exp"])
+    if not revoke_token_ids(db, [payload["jti"]], expires_at):
+        # Already used: someone else may hold a copy, so end every session of this login
+        revoke_token_ids(db, [family_key], datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS))
+        db.commit()
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Refresh token reuse detected")
     db.commit()
-    
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user_id}, expires_delta=access_token_expires
-    )
-    return {"access_token": access_token, "token_type": "bearer"}
+    return issue_tokens(payload["sub"], payload["fam"])
+
+@app.post("/auth/logout")
+async def logout(request: RefreshRequest, db: Session = Depends(get_db)):
+    """Revoke every refresh token issued from the same login"""
+    payload = decode_refresh_token(request.refresh_token)
+    revoke_token_ids(db, [f"fam:{payload['fam']}"], datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS))
+    db.commit()
+    return {"message": "Logged out"}
 
 @app.get("/users/me", response_model=UserResponse)
 async def read_users_me(current_user: User = Depends(get_current_user)):
     return current_user
 
 @app.get("/profiles", response_model=List[ProfileResponse])
-async def get_user_profiles(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def get_user_profiles(
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    if_modified_since: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_user_db)
+):
+    # The ETag comes from a narrow (id, version) read; full rows only load on a change. There is no
+    # Last-Modified: the newest remaining updated_at moves backwards when a profile is deleted.
+    versions = db.query(UserProfile.id, UserProfile.version).filter(
+        UserProfile.user_id == current_user.id
+    ).order_by(UserProfile.id).all()
+    digest = hashlib.sha1(";".join(f"{row.id}:{row.version}" for row in versions).encode()).hexdigest()
+    headers = validator_headers(f'"{digest}"', None)
+    if is_not_modified(headers["ETag"], None, if_none_match, if_modified_since):
+        return not_modified_response(headers)
+    response.headers.update(headers)
+
     profiles = db.query(UserProfile).filter(UserProfile.user_id == current_user.id).all()
     result = []
     for profile in profiles:
-        result.append(ProfileResponse(
-            id=profile.id,
-            name=profile.name,
-            icon=profile.icon,
-            restricted_apps=json.loads(profile.restricted_apps),
-            restricted_categories=json.loads(profile.restricted_categories),
-            is_default=profile.is_default,
-            created_at=profile.created_at,
-            updated_at=profile.updated_at
-        ))
+        result.append(profile_to_response(profile))
     return result
 
+@app.get("/profiles/page", response_model=ProfilePage)
+async def get_user_profiles_page(
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_user_db)
+):
+    """Keyset-paginated profiles, oldest first; pass next_cursor back as cursor for the next page"""
+    query = db.query(UserProfile).filter(UserProfile.user_id == current_user.id)
+    profiles, next_cursor = keyset_page(query, UserProfile.created_at, UserProfile.id, cursor, limit)
+    return ProfilePage(items=[profile_to_response(p) for p in profiles], next_cursor=next_cursor)
+
 @app.post("/profiles", response_model=ProfileResponse)
 async def create_profile(
     profile_data: ProfileCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_user_db)
 ):
-    import uuid
-    profile_id = str(uuid.uuid4())
+    profile_id = new_id()
     
     db_profile = UserProfile(
         id=profile_id,
@@ -303,26 +1904,20 @@ async def create_profile(
         is_default=profile_data.is_default
     )
     db.add(db_profile)
+    db.flush()
+    sync_profile_apps(db.connection(), [profile_id])
     db.commit()
     db.refresh(db_profile)
+    audit_log.record("profile.create", f"user:{current_user.id}", user_id=current_user.id, profile_id=profile_id)
     
-    return ProfileResponse(
-        id=db_profile.id,
-        name=db_profile.name,
-        icon=db_profile.icon,
-        restricted_apps=json.loads(db_profile.restricted_apps),
-        restricted_categories=json.loads(db_profile.restricted_categories),
-        is_default=db_profile.is_default,
-        created_at=db_profile.created_at,
-        updated_at=db_profile.updated_at
-    )
+    return profile_to_response(db_profile)
 
 @app.put("/profiles/{profile_id}", response_model=ProfileResponse)
 async def update_profile(
     profile_id: str,
     profile_data: ProfileUpdate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_user_db)
 ):
     profile = db.query(UserProfile).filter(
         UserProfile.id == profile_id,
@@ -332,6 +1927,9 @@ async def update_profile(
     if not profile:
         raise HTTPException(status_code=404, detail="Profile not found")
     
+    if profile_data.version is not None and profile_data.version != profile.version:
+        raise HTTPException(status_code=409, detail="Profile was modified by another request")
+    
     if profile_data.name is not None:
         profile.name = profile_data.name
     if profile_data.icon is not None:
@@ -342,25 +1940,54 @@ async def update_profile(
         profile.restricted_categories = json.dumps(profile_data.restricted_categories)
     
     profile.updated_at = datetime.utcnow()
-    db.commit()
+    try:
+        db.flush()
+        if profile_data.restricted_apps is not None:
+            sync_profile_apps(db.connection(), [profile_id])
+        if profile_data.restricted_apps is not None or profile_data.restricted_categories is not None:
+            refresh_blocklist(db, current_user.id, profile_id)
+        db.commit()
+    except StaleDataError:
+        # Another request changed the profile between our read and this write
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Profile was modified by another request")
     db.refresh(profile)
+    audit_log.record("profile.update", f"user:{current_user.id}", user_id=current_user.id, profile_id=profile_id,
+                     details=json.dumps(profile_data.model_dump(exclude_none=True)))
     
-    return ProfileResponse(
-        id=profile.id,
-        name=profile.name,
-        icon=profile.icon,
-        restricted_apps=json.loads(profile.restricted_apps),
-        restricted_categories=json.loads(profile.restricted_categories),
-        is_default=profile.is_default,
-        created_at=profile.created_at,
-        updated_at=profile.updated_at
-    )
+    return profile_to_response(profile)
+
+@app.patch("/profiles/{profile_id}", response_model=ProfileVersion)
+async def patch_profile(
+    profile_id: str,
+    patch: ProfilePatch,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_user_db)
+):
+    """Add/remove apps and categories without resending the whole lists; returns the new version"""
+    if not (patch.add_apps or patch.remove_apps or patch.add_categories or patch.remove_categories):
+        raise HTTPException(status_code=400, detail="No changes requested")
+    
+    version = patch_profile_lists(db, profile_id, current_user.id, patch)
+    if version is None:
+        exists = db.query(UserProfile.id).filter(
+            UserProfile.id == profile_id,
+            UserProfile.user_id == current_user.id
+        ).first()
+        if not exists:
+            raise HTTPException(status_code=404, detail="Profile not found")
+        raise HTTPException(status_code=409, detail="Profile was modified by another request")
+    db.commit()
+    audit_log.record("profile.patch", f"user:{current_user.id}", user_id=current_user.id, profile_id=profile_id,
+                     details=json.dumps(patch.model_dump(exclude_defaults=True)))
+    
+    return ProfileVersion(id=profile_id, version=version)
 
 @app.delete("/profiles/{profile_id}")
 async def delete_profile(
     profile_id: str,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_user_db)
 ):
     profile = db.query(UserProfile).filter(
         UserProfile.id == profile_id,
@@ -374,11 +2001,23 @@ async def delete_profile(
         raise HTTPException(status_code=400, detail="Cannot delete default profile")
     
     db.delete(profile)
-    db.commit()
+    try:
+        db.flush()
+        sync_profile_apps(db.connection(), [profile_id])
+        db.query(EffectiveBlocklist).filter(
+            EffectiveBlocklist.user_id == current_user.id,
+            EffectiveBlocklist.profile_id == profile_id
+        ).delete()
+        db.commit()
+    except StaleDataError:
+        # Another request changed (or deleted) the profile between our read and this delete
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Profile was modified by another request")
+    audit_log.record("profile.delete", f"user:{current_user.id}", user_id=current_user.id, profile_id=profile_id)
     return {"message": "Profile deleted successfully"}
 
 @app.post("/blocking/toggle")
-async def toggle_blocking(request: BlockingToggleRequest, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def toggle_blocking(request: BlockingToggleRequest, current_user: User = Depends(get_current_user), db: Session = Depends(get_user_db)):
     """Toggle blocking state for a profile - users can only start, server controls stopping"""
     # Get the profile
     profile = db.query(UserProfile).filter(
@@ -389,32 +2028,18 @@ async def toggle_blocking(request: BlockingToggleRequest, current_user: User = D
     if not profile:
         raise HTTPException(status_code=404, detail="Profile not found")
     
-    # Check if there's an active blocking session
-    active_session = db.query(BlockingSession).filter(
-        BlockingSession.user_id == current_user.id,
-        BlockingSession.profile_id == request.profile_id,
-        BlockingSession.is_active == True
-    ).first()
-    
     if request.action == "start":
-        if active_session:
+        # Start a session unless one is already active for this profile (single statement)
+        user_id = current_user.id
+        session_id, created = await commit_write(db, lambda s: insert_active_session(s, user_id, request.profile_id))
+        if not created:
             return BlockingResponse(
                 is_blocking=True,
                 profile_id=request.profile_id,
                 message="Already blocking"
             )
-        
-        # Create new blocking session
-        import uuid
-        session = BlockingSession(
-            id=str(uuid.uuid4()),
-            user_id=current_user.id,
-            profile_id=request.profile_id,
-            started_at=datetime.utcnow(),
-            is_active=True
-        )
-        db.add(session)
-        db.commit()
+        audit_log.record("blocking.start", f"user:{user_id}", user_id=user_id, profile_id=request.profile_id,
+                         target=session_id)
         
         return BlockingResponse(
             is_blocking=True,
@@ -425,22 +2050,16 @@ async def toggle_blocking(request: BlockingToggleRequest, current_user: User = D
     else:
         raise HTTPException(status_code=400, detail="Invalid action. Only 'start' is allowed for users")
 
-@app.get("/blocking/status", response_model=BlockingStatusResponse)
-async def get_blocking_status(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    active_session = db.query(BlockingSession).filter(
-        BlockingSession.user_id == current_user.id,
-        BlockingSession.is_active == True
-    ).first()
+def blocking_status(db: Session, user_id: str) -> BlockingStatusResponse:
+    state = blocking_state(db, user_id)
     
-    if active_session:
+    if state["sessions"]:
+        active_session = state["sessions"][0]
         return BlockingStatusResponse(
             is_blocking=True,
-            profile_id=active_session.profile_id,
-            session_id=active_session.id,
-            started_at=active_session.started_at
+            profile_id=active_session["profile_id"],
+            session_id=active_session["id"],
+            started_at=active_session["started_at"]
         )
     else:
         return BlockingStatusResponse(
@@ -450,37 +2069,71 @@ async def get_blocking_status(
             started_at=None
         )
 
+def user_blocking_status(db: Session, user_id: str) -> BlockingStatusResponse:
+    """blocking_status with get_current_user's check, so one coalesced read covers both lookups"""
+    if load_user(db, user_id) is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return blocking_status(db, user_id)
+
+@app.get("/blocking/status", response_model=BlockingStatusResponse)
+async def get_blocking_status(user_id: str = Depends(verify_token)):
+    # Keyed on the token's user id, so concurrent polls share the user lookup as well as the status read
+    return await coalesced_read(("blocking-status", user_id), lambda s: user_blocking_status(s, user_id),
+                                shards.sessionmaker_for(user_id))
+
+@app.get("/blocking/sessions", response_model=SessionPage)
+async def get_blocking_sessions(
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_user_db)
+):
+    """Keyset-paginated blocking session history, newest first"""
+    query = db.query(BlockingSession).filter(BlockingSession.user_id == current_user.id)
+    sessions, next_cursor = keyset_page(
+        query, BlockingSession.started_at, BlockingSession.id, cursor, limit, descending=True
+    )
+    return SessionPage(items=[session_to_response(s) for s in sessions], next_cursor=next_cursor)
+
+@app.get("/stats/blocking", response_model=BlockingStats)
+async def get_blocking_stats(
+    period: str = "day",
+    since: Optional[date] = None,
+    until: Optional[date] = None,
+    profile_id: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_user_db)
+):
+    """Time spent blocking per day or week (ended sessions, UTC days), overall and per profile"""
+    return blocking_stats(db, current_user.id, period, since, until, profile_id)
+
 @app.get("/profiles/{profile_id}/restricted-apps")
-async def get_restricted_apps(profile_id: str, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def get_restricted_apps(
+    profile_id: str,
+    if_none_match: Optional[str] = Header(None),
+    if_modified_since: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_user_db)
+):
     """Get restricted apps for a profile - only returns apps when user is actively blocking"""
-    # Check if user has an active blocking session for this profile
-    active_session = db.query(BlockingSession).filter(
-        BlockingSession.user_id == current_user.id,
-        BlockingSession.profile_id == profile_id,
-        BlockingSession.is_active == True
-    ).first()
-    
-    if not active_session:
-        # Return empty list if not actively blocking
-        return {"restricted_apps": [], "restricted_categories": []}
-    
-    # Get the profile
-    profile = db.query(UserProfile).filter(
-        UserProfile.id == profile_id,
-        UserProfile.user_id == current_user.id
-    ).first()
-    
-    if not profile:
-        raise HTTPException(status_code=404, detail="Profile not found")
-    
-    return {
-        "restricted_apps": json.loads(profile.restricted_apps),
-        "restricted_categories": json.loads(profile.restricted_categories)
-    }
+    # Precomputed when the session started; empty lists when not actively blocking
+    version, payload, updated_at = effective_blocklist(db, current_user.id, profile_id)
+    headers = validator_headers(f'"{profile_id}.{version}"', updated_at)
+    headers["X-Blocklist-Version"] = str(version)
+    if is_not_modified(headers["ETag"], updated_at, if_none_match, if_modified_since):
+        return not_modified_response(headers)
+    return Response(content=payload, media_type="application/json", headers=headers)
 
 # Server-only endpoint to unblock individual apps
 @app.post("/admin/unblock-app")
-async def unblock_app(app_bundle_id: str, user_id: str, profile_id: str, db: Session = Depends(get_db)):
+async def unblock_app(
+    app_bundle_id: str,
+    user_id: str,
+    profile_id: str,
+    reason: Optional[str] = None,
+    actor: str = Depends(admin_actor),
+    db: Session = Depends(get_shard_db)
+):
     """Server endpoint to unblock individual apps - no authentication required for server use"""
     # Find active blocking session
     active_session = db.query(BlockingSession).filter(
@@ -492,7 +2145,14 @@ async def unblock_app(app_bundle_id: str, user_id: str, profile_id: str, db: Ses
     if not active_session:
         raise HTTPException(status_code=404, detail="No active blocking session found")
     
-    # Get the profile and remove the app from restricted list
+    # Remove app from restricted apps list atomically in the database
+    remaining_apps = remove_restricted_app(db, profile_id, user_id, app_bundle_id)
+    if remaining_apps is not None:
+        db.commit()
+        audit_log.record("app.unblock", actor, user_id=user_id, profile_id=profile_id, target=app_bundle_id,
+                         reason=reason)
+        return {"message": f"App {app_bundle_id} unblocked", "remaining_apps": remaining_apps}
+    
     profile = db.query(UserProfile).filter(
         UserProfile.id == profile_id,
         UserProfile.user_id == user_id
@@ -501,59 +2161,202 @@ async def unblock_app(app_bundle_id: str, user_id: str, profile_id: str, db: Ses
     if not profile:
         raise HTTPException(status_code=404, detail="Profile not found")
     
-    # Remove app from restricted apps list
-    restricted_apps = json.loads(profile.restricted_apps)
-    if app_bundle_id in restricted_apps:
-        restricted_apps.remove(app_bundle_id)
-        profile.restricted_apps = json.dumps(restricted_apps)
-        db.commit()
-        
-        return {"message": f"App {app_bundle_id} unblocked", "remaining_apps": restricted_apps}
-    
-    return {"message": "App was not in restricted list", "remaining_apps": restricted_apps}
+    return {"message": "App was not in restricted list", "remaining_apps": json.loads(profile.restricted_apps)}
 
 @app.post("/admin/end-blocking")
-async def end_blocking_session(user_id: str, profile_id: str, db: Session = Depends(get_db)):
+async def end_blocking_session(
+    user_id: str,
+    profile_id: str,
+    reason: Optional[str] = None,
+    actor: str = Depends(admin_actor),
+    db: Session = Depends(get_shard_db)
+):
     """Server endpoint to completely end a blocking session"""
-    # Find active blocking session
-    active_session = db.query(BlockingSession).filter(
-        BlockingSession.user_id == user_id,
-        BlockingSession.profile_id == profile_id,
-        BlockingSession.is_active == True
-    ).first()
-    
-    if not active_session:
+    # End the active blocking session
+    ended = await commit_write(db, lambda s: end_sessions(
+        s, BlockingSession.user_id == user_id, BlockingSession.profile_id == profile_id
+    ))
+    if not ended:
         raise HTTPException(status_code=404, detail="No active blocking session found")
+    audit_log.record("blocking.end", actor, user_id=user_id, profile_id=profile_id, target=ended[0].id, reason=reason)
     
-    # End the blocking session
-    active_session.ended_at = datetime.utcnow()
-    active_session.is_active = False
-    db.commit()
-    
-    return {"message": "Blocking session ended", "session_id": active_session.id}
+    return {"message": "Blocking session ended", "session_id": ended[0].id}
+
+def shard_app_id(app_ids: set) -> Optional[int]:
+    """Catalog id of an app across shards: the id when every shard that knows it agrees, else None"""
+    return next(iter(app_ids)) if len(app_ids) == 1 else None
+
+@app.get("/admin/apps/blockers", dependencies=[Depends(require_admin_key)])
+async def admin_app_blockers(bundle_id: str, active_only: bool = True, limit: int = 100):
+    """Profiles restricting an app (only those in an active blocking session by default), from every shard"""
+    limit = max(1, min(limit, 1000))
+
+    def blockers(name, bind):
+        with shards.sessionmakers[name]() as db:
+            app_id = app_catalog.ids(db, [bundle_id]).get(bundle_id)
+            if app_id is None:
+                return None, []
+            session_join = (BlockingSession.profile_id == ProfileApp.profile_id) & (BlockingSession.is_active == True)
+            query = db.query(UserProfile.user_id, ProfileApp.profile_id, BlockingSession.id).select_from(ProfileApp).join(
+                UserProfile, UserProfile.id == ProfileApp.profile_id
+            )
+            query = query.join(BlockingSession, session_join) if active_only else query.outerjoin(BlockingSession, session_join)
+            return app_id, query.filter(ProfileApp.app_id == app_id).limit(limit).all()
+
+    results = shards.scatter(blockers).values()
+    rows = [row for _, shard_rows in results for row in shard_rows][:limit]
+    return {
+        "bundle_id": bundle_id,
+        "app_id": shard_app_id({app_id for app_id, _ in results if app_id is not None}),
+        "blockers": [{"user_id": u, "profile_id": p, "session_id": s} for u, p, s in rows]
+    }
+
+@app.get("/admin/apps/top", dependencies=[Depends(require_admin_key)])
+async def admin_top_apps(limit: int = 20):
+    """Most restricted apps across all profiles, summed over shards by bundle ID"""
+    limit = max(1, min(limit, 1000))
+
+    def counts(name, bind):
+        with shards.sessionmakers[name]() as db:
+            query = db.query(ProfileApp.app_id, func.count().label("profiles")).group_by(ProfileApp.app_id).order_by(
+                func.count().desc(), ProfileApp.app_id
+            )
+            # With several shards every app's count is needed: one shard's top N can miss the overall top N
+            rows = (query.limit(limit) if len(shards.names) == 1 else query).all()
+            names = app_catalog.bundle_ids(db, [app_id for app_id, _ in rows])
+            return [(names.get(app_id), app_id, n) for app_id, n in rows]
+
+    totals = {}
+    for rows in shards.scatter(counts).values():
+        for bundle_id, app_id, n in rows:
+            total = totals.setdefault(bundle_id, [0, set()])
+            total[0] += n
+            total[1].add(app_id)
+    ranked = sorted(totals.items(), key=lambda item: (-item[1][0], min(item[1][1])))[:limit]
+    return [{"bundle_id": bundle_id, "app_id": shard_app_id(app_ids), "profiles": n}
+            for bundle_id, (n, app_ids) in ranked]
+
+@app.get("/admin/workers", dependencies=[Depends(require_admin_key)])
+async def admin_workers():
+    """Health of every worker process from their heartbeat files (serve.py sets WORKER_STATE_DIR)"""
+    state_dir = os.getenv("WORKER_STATE_DIR")
+    if not state_dir or not os.path.isdir(state_dir):
+        raise HTTPException(status_code=404, detail="Not running under serve.py")
+    return {
+        "served_by": os.getpid(),
+        "master": read_state(os.path.join(state_dir, MASTER_FILE)),
+        "workers": read_heartbeats(state_dir),
+    }
+
+@app.get("/admin/traces", dependencies=[Depends(require_admin_key)])
+async def admin_traces(trace_id: Optional[str] = None, limit: int = 200):
+    """Recent spans from the in-memory trace exporter, optionally for a single trace"""
+    if tracer is None or not isinstance(tracer.exporter, InMemoryExporter):
+        raise HTTPException(status_code=404, detail="In-memory tracing is not enabled")
+    return {"spans": tracer.exporter.find(trace_id, limit)}
+
+@app.get("/admin/audit", dependencies=[Depends(require_admin_key)])
+async def admin_audit(
+    user_id: Optional[str] = None,
+    email: Optional[str] = None,
+    action: Optional[str] = None,
+    limit: int = 50,
+    before: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
+    """Audit events, newest first. Pass `next_before` back as `before` for the next page.
+    Events reach the table within AUDIT_FLUSH_MS of being recorded.
+    """
+    limit = max(1, min(limit, PAGE_LIMIT_MAX))
+    if email is not None:
+        user_id = user_id_for_email(db, email)
+        if user_id is None:
+            raise HTTPException(status_code=404, detail="User not found")
+    query = db.query(AuditEvent)
+    if user_id is not None:
+        query = query.filter(AuditEvent.user_id == user_id)
+    if action is not None:
+        query = query.filter(AuditEvent.action == action)
+    if before is not None:
+        query = query.filter(AuditEvent.id < before)
+    events = query.order_by(AuditEvent.id.desc()).limit(limit + 1).all()
+    return {
+        "events": [
+            {column: getattr(event, column) for column in ("id",) + AUDIT_FIELDS}
+            for event in events[:limit]
+        ],
+        "next_before": events[limit - 1].id if len(events) > limit else None,
+    }
+
+@app.get("/admin/export", dependencies=[Depends(require_configured_admin_key)])
+async def admin_export(
+    tables: str = "users,profiles,sessions",
+    updated_since: Optional[datetime] = None,
+    updated_until: Optional[datetime] = None
+):
+    """Stream users, profiles and sessions as NDJSON; filter on updated_at for incremental exports"""
+    requested = [t.strip() for t in tables.split(",") if t.strip()]
+    unknown = [t for t in requested if t not in EXPORT_TABLES]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown tables: {', '.join(unknown)}")
+    # Timestamps are stored as naive UTC
+    if updated_since is not None and updated_since.tzinfo is not None:
+        updated_since = updated_since.astimezone(timezone.utc).replace(tzinfo=None)
+    if updated_until is not None and updated_until.tzinfo is not None:
+        updated_until = updated_until.astimezone(timezone.utc).replace(tzinfo=None)
+    return StreamingResponse(
+        iter_export_ndjson(requested, updated_since, updated_until),
+        media_type="application/x-ndjson"
+    )
+
+@app.post("/admin/provision", dependencies=[Depends(require_configured_admin_key)])
+async def admin_provision(request: Request, format: str = "ndjson", batch_size: int = 5000,
+                          actor: str = Depends(admin_actor)):
+    """Bulk-create users with their profiles from an NDJSON or CSV request body.
+    The body is parsed as it arrives and loaded in batches (COPY on Postgres, executemany elsewhere).
+    """
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'csv'")
+    batch_size = max(1, min(batch_size, 50000))
+
+    parser = ProvisionParser(format)
+    batch = []
+    pending = b""
+    async for chunk in request.stream():
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            batch.extend(parser.feed(line))
+        if len(batch) >= batch_size:
+            parser.add_batch(await run_in_threadpool(provision_batch, batch))
+            batch = []
+    if pending:
+        batch.extend(parser.feed(pending))
+    batch.extend(parser.finish())
+    if batch:
+        parser.add_batch(await run_in_threadpool(provision_batch, batch))
+    audit_log.record("users.provision", actor, details=json.dumps(parser.counts))
+    return parser.result()
 
 # -----------------------------
 # Admin convenience endpoints for MCP by email
 # -----------------------------
 
-@app.get("/admin/status-by-email")
-async def admin_status_by_email(email: str, db: Session = Depends(get_db)):
-    """Lookup a user's blocking status and active profile by email (no auth, for MCP/demo).
-    Returns: { valid, user_id, is_blocking, profile_id, session_id, started_at, restricted_apps, restricted_categories }
-    """
-    user = db.query(User).filter(User.email == email).first()
-    if not user:
+def status_by_email(db: Session, email: str) -> dict:
+    user_id = user_id_for_email(db, email)
+    if not user_id:
         raise HTTPException(status_code=404, detail="User not found")
 
-    active_session = db.query(BlockingSession).filter(
-        BlockingSession.user_id == user.id,
-        BlockingSession.is_active == True
-    ).first()
+    if shards.engine_for(user_id) is db.bind:
+        state = blocking_state(db, user_id)
+    else:
+        with shards.session_for(user_id) as user_db:
+            state = blocking_state(user_db, user_id)
 
-    if not active_session:
+    if not state["sessions"]:
         return {
             "valid": True,
-            "user_id": user.id,
+            "user_id": user_id,
             "is_blocking": False,
             "profile_id": None,
             "session_id": None,
@@ -562,98 +2365,131 @@ async def admin_status_by_email(email: str, db: Session = Depends(get_db)):
             "restricted_categories": []
         }
 
-    profile = db.query(UserProfile).filter(
-        UserProfile.id == active_session.profile_id,
-        UserProfile.user_id == user.id
-    ).first()
+    active_session = state["sessions"][0]
+    _, payload, _ = state["blocklists"].get(active_session["profile_id"], (0, None, None))
 
-    if not profile:
+    if payload is None:
         # Return status with minimal info if profile record is missing
         return {
             "valid": True,
-            "user_id": user.id,
+            "user_id": user_id,
             "is_blocking": True,
-            "profile_id": active_session.profile_id,
-            "session_id": active_session.id,
-            "started_at": active_session.started_at,
+            "profile_id": active_session["profile_id"],
+            "session_id": active_session["id"],
+            "started_at": active_session["started_at"],
             "restricted_apps": [],
             "restricted_categories": []
         }
 
     return {
         "valid": True,
-        "user_id": user.id,
+        "user_id": user_id,
         "is_blocking": True,
-        "profile_id": profile.id,
-        "session_id": active_session.id,
-        "started_at": active_session.started_at,
-        "restricted_apps": json.loads(profile.restricted_apps),
-        "restricted_categories": json.loads(profile.restricted_categories)
+        "profile_id": active_session["profile_id"],
+        "session_id": active_session["id"],
+        "started_at": active_session["started_at"],
+        **json.loads(payload)
     }
 
+@app.get("/admin/status-by-email")
+async def admin_status_by_email(email: str):
+    """Lookup a user's blocking status and active profile by email (no auth, for MCP/demo).
+    Returns: { valid, user_id, is_blocking, profile_id, session_id, started_at, restricted_apps, restricted_categories }
+    """
+    return await coalesced_read(("status-by-email", email), lambda s: status_by_email(s, email))
+
+
+@app.get("/admin/sessions-by-email", response_model=SessionPage)
+async def admin_sessions_by_email(
+    email: str,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    user_id: str = Depends(email_user_id),
+    db: Session = Depends(get_email_user_db)
+):
+    """Keyset-paginated blocking session history for a user by email (no auth, for MCP/demo)"""
+    query = db.query(BlockingSession).filter(BlockingSession.user_id == user_id)
+    sessions, next_cursor = keyset_page(
+        query, BlockingSession.started_at, BlockingSession.id, cursor, limit, descending=True
+    )
+    return SessionPage(items=[session_to_response(s) for s in sessions], next_cursor=next_cursor)
+
+
+@app.get("/admin/blocking-stats-by-email", response_model=BlockingStats)
+async def admin_blocking_stats_by_email(
+    email: str,
+    period: str = "day",
+    since: Optional[date] = None,
+    until: Optional[date] = None,
+    profile_id: Optional[str] = None,
+    user_id: str = Depends(email_user_id),
+    db: Session = Depends(get_email_user_db)
+):
+    """Time spent blocking for a user by email (no auth, for MCP/demo)"""
+    return blocking_stats(db, user_id, period, since, until, profile_id)
+
 
 @app.post("/admin/unblock-app-by-email")
-async def admin_unblock_app_by_email(email: str, app_bundle_id: str, db: Session = Depends(get_db)):
+async def admin_unblock_app_by_email(
+    email: str,
+    app_bundle_id: str,
+    reason: Optional[str] = None,
+    actor: str = Depends(admin_actor),
+    user_id: str = Depends(email_user_id),
+    db: Session = Depends(get_email_user_db)
+):
     """Unblock a specific app for a user identified by email (no auth, for MCP/demo)."""
-    user = db.query(User).filter(User.email == email).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
     active_session = db.query(BlockingSession).filter(
-        BlockingSession.user_id == user.id,
+        BlockingSession.user_id == user_id,
         BlockingSession.is_active == True
     ).first()
     if not active_session:
         raise HTTPException(status_code=404, detail="No active blocking session found")
 
+    remaining_apps = remove_restricted_app(db, active_session.profile_id, user_id, app_bundle_id)
+    if remaining_apps is not None:
+        db.commit()
+        audit_log.record("app.unblock", actor, user_id=user_id, profile_id=active_session.profile_id,
+                         target=app_bundle_id, reason=reason)
+        return {
+            "message": f"App {app_bundle_id} unblocked",
+            "remaining_apps": remaining_apps,
+            "user_id": user_id,
+            "profile_id": active_session.profile_id
+        }
+
     profile = db.query(UserProfile).filter(
         UserProfile.id == active_session.profile_id,
-        UserProfile.user_id == user.id
+        UserProfile.user_id == user_id
     ).first()
     if not profile:
         raise HTTPException(status_code=404, detail="Profile not found")
-
-    restricted_apps = json.loads(profile.restricted_apps)
-    if app_bundle_id in restricted_apps:
-        restricted_apps.remove(app_bundle_id)
-        profile.restricted_apps = json.dumps(restricted_apps)
-        db.commit()
-        return {
-            "message": f"App {app_bundle_id} unblocked",
-            "remaining_apps": restricted_apps,
-            "user_id": user.id,
-            "profile_id": profile.id
-        }
     return {
         "message": "App was not in restricted list",
-        "remaining_apps": restricted_apps,
-        "user_id": user.id,
+        "remaining_apps": json.loads(profile.restricted_apps),
+        "user_id": user_id,
         "profile_id": profile.id
     }
 
 
 @app.post("/admin/end-blocking-by-email")
-async def admin_end_blocking_by_email(email: str, db: Session = Depends(get_db)):
+async def admin_end_blocking_by_email(
+    email: str,
+    reason: Optional[str] = None,
+    actor: str = Depends(admin_actor),
+    user_id: str = Depends(email_user_id),
+    db: Session = Depends(get_email_user_db)
+):
     """End ALL active blocking sessions for a user by email (no auth, for MCP/demo)."""
-    user = db.query(User).filter(User.email == email).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
-    active_sessions = db.query(BlockingSession).filter(
-        BlockingSession.user_id == user.id,
-        BlockingSession.is_active == True
-    ).all()
-    if not active_sessions:
-        raise HTTPException(status_code=404, detail="No active blocking sessions found")
-
     # End ALL active sessions for this user
-    session_ids = []
-    for session in active_sessions:
-        session.ended_at = datetime.utcnow()
-        session.is_active = False
-        session_ids.append(session.id)
+    ended = await commit_write(db, lambda s: end_sessions(s, BlockingSession.user_id == user_id))
+    if not ended:
+        raise HTTPException(status_code=404, detail="No active blocking sessions found")
 
-    db.commit()
+    session_ids = [row.id for row in ended]
+    for row in ended:
+        audit_log.record("blocking.end", actor, user_id=user_id, profile_id=row.profile_id, target=row.id,
+                         reason=reason)
     return {
         "message": f"All blocking sessions ended ({len(session_ids)} sessions)",
         "session_ids": session_ids,
@@ -665,23 +2501,22 @@ async def admin_start_blocking_by_email(
     email: str,
     profile_id: Optional[str] = None,
     profile_name: Optional[str] = None,
-    db: Session = Depends(get_db)
+    reason: Optional[str] = None,
+    actor: str = Depends(admin_actor),
+    user_id: str = Depends(email_user_id),
+    db: Session = Depends(get_email_user_db)
 ):
     """Start a blocking session for a user by email. If profile_id is not provided,
     use the user's default profile, or fall back to the first available profile.
     """
-    user = db.query(User).filter(User.email == email).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
     # Resolve profile
     profile = None
     if profile_id:
-        profile = db.query(UserProfile).filter(UserProfile.id == profile_id, UserProfile.user_id == user.id).first()
+        profile = db.query(UserProfile).filter(UserProfile.id == profile_id, UserProfile.user_id == user_id).first()
         if not profile:
             raise HTTPException(status_code=404, detail="Profile not found")
     else:
-        q = db.query(UserProfile).filter(UserProfile.user_id == user.id)
+        q = db.query(UserProfile).filter(UserProfile.user_id == user_id)
         if profile_name:
             profile = q.filter(UserProfile.name == profile_name).first()
         if not profile:
@@ -691,34 +2526,21 @@ async def admin_start_blocking_by_email(
         if not profile:
             raise HTTPException(status_code=404, detail="No profiles available for user")
 
-    # Check existing active session
-    active_session = db.query(BlockingSession).filter(
-        BlockingSession.user_id == user.id,
-        BlockingSession.profile_id == profile.id,
-        BlockingSession.is_active == True
-    ).first()
-    if active_session:
+    # Start a session unless one is already active for this profile (single statement)
+    profile_id = profile.id
+    session_id, created = await commit_write(db, lambda s: insert_active_session(s, user_id, profile_id))
+    if not created:
         return {
             "message": "Already blocking",
-            "session_id": active_session.id,
+            "session_id": session_id,
             "profile_id": profile.id,
             "is_blocking": True
         }
+    audit_log.record("blocking.start", actor, user_id=user_id, profile_id=profile_id, target=session_id, reason=reason)
 
-    # Create new session
-    import uuid
-    session = BlockingSession(
-        id=str(uuid.uuid4()),
-        user_id=user.id,
-        profile_id=profile.id,
-        started_at=datetime.utcnow(),
-        is_active=True
-    )
-    db.add(session)
-    db.commit()
     return {
         "message": "Blocking started",
-        "session_id": session.id,
+        "session_id": session_id,
         "profile_id": profile.id,
         "is_blocking": True
     }
@@ -0,0 +1,146 @@
+"""
+On-demand per-request profiling for the PokeDaddy server.
+
+A request is profiled when it carries `X-Profile: <ADMIN_API_KEY>` or wins the
+PROFILE_SAMPLE_RATE coin flip. Profiled requests run under a wall-clock stack
+sampler and are saved as collapsed ("folded") stacks, the input format of
+flamegraph.pl, speedscope and inferno. Unsampled requests pass straight through.
+Saved profiles are logged to the "pokedaddy.profile" logger.
+"""
+
+import hmac
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+PROFILE_HEADER = b"x-profile"
+
+logger = logging.getLogger("pokedaddy.profile")
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Background thread that periodically records the stacks of running threads.
+
+    The request's own thread is always recorded; other threads (e.g. the threadpool
+    running sync dependencies) only while they are executing server code. For an
+    async server the request's thread is the event-loop thread, so "request" stacks
+    also include every other task the loop runs while the request awaits; profile
+    on a quiet worker when that matters.
+    """
+
+    def __init__(self, request_thread_id: int, interval: float = 0.005):
+        self.request_thread_id = request_thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="pokedaddy-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                in_server_code = thread_id == self.request_thread_id
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    if not in_server_code and frame.f_code.co_filename.startswith(SERVER_DIR):
+                        in_server_code = True
+                    frame = frame.f_back
+                if not in_server_code:
+                    continue
+                name = "request" if thread_id == self.request_thread_id else f"thread-{thread_id}"
+                stack.append(name)
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that profiles sampled or admin-requested requests."""
+
+    def __init__(
+        self,
+        app,
+        profile_dir: str = "profiles",
+        sample_rate: float = 0.0,
+        admin_key: str = None,
+        max_profiles: int = 20,
+        interval: float = 0.005,
+    ):
+        self.app = app
+        self.profile_dir = profile_dir
+        self.sample_rate = sample_rate
+        self.admin_key = admin_key.encode() if admin_key else None
+        self.max_profiles = max_profiles
+        self.interval = interval
+        self._lock = threading.Lock()
+
+    def _should_profile(self, scope) -> bool:
+        if self.admin_key:
+            for name, value in scope.get("headers", ()):
+                if name == PROFILE_HEADER:
+                    return hmac.compare_digest(value, self.admin_key)
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        slug = scope["path"].strip("/").replace("/", "_") or "root"
+        filename = f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')}-{scope['method']}-{slug}.folded"
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", filename.encode())]
+            await send(message)
+
+        sampler = StackSampler(threading.get_ident(), self.interval)
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            sampler.stop()
+            self._save(filename, sampler, time.perf_counter() - started)
+
+    def _save(self, filename: str, sampler: StackSampler, elapsed: float):
+        try:
+            with self._lock:
+                os.makedirs(self.profile_dir, exist_ok=True)
+                path = os.path.join(self.profile_dir, filename)
+                with open(path, "w") as f:
+                    f.write(sampler.folded())
+                logger.info("profile %s: %.1f ms, %d samples", filename, elapsed * 1000, sampler.samples)
+                self._prune()
+        except OSError as e:
+            logger.warning("profile %s could not be saved: %s", filename, e)
+
+    def _prune(self):
+        # Filenames start with a UTC timestamp, so name order is age order.
+        profiles = sorted(name for name in os.listdir(self.profile_dir) if name.endswith(".folded"))
+        for name in profiles[:max(0, len(profiles) - self.max_profiles)]:
+            os.remove(os.path.join(self.profile_dir, name))
@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""
+Rebuild the blocking_rollups table from blocking_sessions history.
+
+New sessions are rolled up as they end; run this once after upgrading to fill in
+sessions that ended before the rollup table existed. The rebuild runs in a single
+transaction and can be re-run safely.
+
+Run: POSTGRES_URL=... python scripts/backfill_rollups.py
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute PokeDaddy blocking-time rollups")
+    parser.add_argument("--batch-size", type=int, default=5000, help="sessions read and upserted per round trip")
+    args = parser.parse_args()
+
+    from main import rebuild_rollups
+
+    result = rebuild_rollups(args.batch_size)
+    print(f"[backfill] rolled up {result['sessions_rolled_up']} sessions", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
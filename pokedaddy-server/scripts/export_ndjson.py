@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Export users, profiles and blocking sessions as NDJSON straight from the database.
+
+Rows are streamed through server-side cursors, so memory stays flat no matter
+how large the tables are. Use --since/--until (UTC, ISO 8601) on updated_at for
+incremental exports.
+
+Run: POSTGRES_URL=... python scripts/export_ndjson.py --output export.ndjson
+     python scripts/export_ndjson.py --tables sessions --since 2025-01-01T00:00:00
+"""
+
+import argparse
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream PokeDaddy tables as NDJSON")
+    parser.add_argument("--tables", default="users,profiles,sessions", help="comma-separated: users,profiles,sessions")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="only rows updated at or after this UTC time")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="only rows updated before this UTC time")
+    parser.add_argument("--batch-size", type=int, default=1000, help="rows fetched per cursor round trip")
+    parser.add_argument("--output", help="file to write (default: stdout)")
+    args = parser.parse_args()
+
+    from main import EXPORT_TABLES, iter_export_ndjson
+
+    tables = [t.strip() for t in args.tables.split(",") if t.strip()]
+    unknown = [t for t in tables if t not in EXPORT_TABLES]
+    if unknown:
+        parser.error(f"unknown tables: {', '.join(unknown)}")
+
+    out = open(args.output, "w") if args.output else sys.stdout
+    count = 0
+    try:
+        for line in iter_export_ndjson(tables, args.since, args.until, args.batch_size):
+            out.write(line)
+            count += 1
+    finally:
+        if args.output:
+            out.close()
+    print(f"[export] wrote {count} rows", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
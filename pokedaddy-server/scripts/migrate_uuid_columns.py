@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Convert id columns created before time-ordered ids from varchar to native uuid (Postgres).
+
+Existing rows keep their ids: access tokens, the iOS app and exports already refer
+to them. Rows created from now on get UUIDv7 ids whether or not this has run,
+and the server works against either column type. Converting shrinks every id from
+37 bytes to 16 in the tables and their indexes.
+
+Each table is rewritten once under an exclusive lock, so run it in a maintenance
+window. It aborts without changing anything if a column holds values that are not
+UUIDs. Use --dry-run to list the columns it would convert. On SQLite there is
+nothing to do.
+
+Run: POSTGRES_URL=... python scripts/migrate_uuid_columns.py [--dry-run]
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert PokeDaddy id columns to native uuid")
+    parser.add_argument("--dry-run", action="store_true", help="check and list the columns without converting them")
+    args = parser.parse_args()
+
+    from main import migrate_guid_columns
+
+    converted = migrate_guid_columns(dry_run=args.dry_run)["converted"]
+    verb = "would convert" if args.dry_run else "converted"
+    for table, columns in converted.items():
+        print(f"[migrate] {verb} {table}: {', '.join(columns)}", file=sys.stderr)
+    if not converted:
+        print("[migrate] nothing to convert", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Bulk-provision users with their profiles and restricted apps from a file.
+
+Input is NDJSON (one {"apple_user_id", "email", "name", "profiles": [...]} object
+per line) or CSV (header: apple_user_id,email,name,profile_name,profile_icon,
+restricted_apps,restricted_categories,is_default; one row per user/profile,
+';'-separated lists). Users whose apple_user_id or email already exist are
+skipped. Every new user gets a default profile, as with /auth/register.
+
+Run: POSTGRES_URL=... python scripts/provision_users.py cohort.ndjson
+     python scripts/provision_users.py cohort.csv --format csv --batch-size 10000
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-provision PokeDaddy users")
+    parser.add_argument("input", help="NDJSON or CSV file ('-' for stdin)")
+    parser.add_argument("--format", choices=["ndjson", "csv"], help="input format (default: from file extension)")
+    parser.add_argument("--batch-size", type=int, default=5000, help="users per transaction")
+    args = parser.parse_args()
+
+    input_format = args.format or ("csv" if args.input.endswith(".csv") else "ndjson")
+
+    from main import provision_lines
+
+    started = time.perf_counter()
+    # Read bytes: lines that aren't valid UTF-8 are reported as errors instead of aborting the run
+    source = sys.stdin.buffer if args.input == "-" else open(args.input, "rb")
+    try:
+        result = provision_lines(source, input_format, args.batch_size)
+    finally:
+        if source is not sys.stdin.buffer:
+            source.close()
+    elapsed = time.perf_counter() - started
+
+    print(json.dumps(result, indent=2))
+    print(f"[provision] {result['users_created']} users in {elapsed:.2f}s", file=sys.stderr)
+    sys.exit(1 if result["errors"] else 0)
+
+
+if __name__ == "__main__":
+    main()
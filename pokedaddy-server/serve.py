@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Production entry point: several uvicorn worker processes sharing one preloaded app.
+
+The master imports main once. Schema creation and backfills therefore run a single
+time, before any worker starts. The master binds the listening socket, closes its own
+database connections, and forks --workers children that all accept on that socket.
+Each child starts with empty database pools and its own background threads (audit
+flusher, group committers, WAL checkpointer), and otherwise shares the master's memory
+copy-on-write.
+
+Workers report health through heartbeat files in --state-dir (see worker_health.py),
+which GET /admin/workers also reads. The master replaces a worker that exits, and kills
+and replaces one whose heartbeat is older than --timeout (its event loop is stuck).
+
+Signals to the master:
+
+- HUP: rolling restart. Workers are replaced one at a time. Each old worker is stopped
+  only after its replacement has reported ready, then drains its in-flight requests for
+  up to --graceful-timeout seconds. No capacity is lost along the way. New workers are
+  forked from the master, so they run the code it imported: restart the master to deploy
+  new code.
+- TERM / INT: stop every worker gracefully, then exit.
+
+Run:  python serve.py --workers 4 --port 8000
+"""
+
+import argparse
+import asyncio
+import os
+import signal
+import sys
+import tempfile
+import time
+import traceback
+
+import uvicorn
+
+from worker_health import MASTER_FILE, Heartbeat, heartbeat_path, read_state, write_state
+
+# Seconds between respawns of a worker slot whose process keeps exiting
+RESPAWN_DELAY = 1.0
+# Seconds a stopping worker waits, no longer accepting, for requests on connections it has just accepted
+SHUTDOWN_SETTLE = 0.5
+
+
+def log(message: str):
+    print(f"[serve] {message}", file=sys.stderr, flush=True)
+
+
+class WorkerServer(uvicorn.Server):
+    """uvicorn server that writes a heartbeat from its event loop every `interval` seconds"""
+
+    def __init__(self, config: uvicorn.Config, heartbeat: Heartbeat, interval: float):
+        super().__init__(config)
+        self.heartbeat = heartbeat
+        self.ticks = max(1, round(interval / 0.1))  # uvicorn ticks every 100ms
+
+    async def on_tick(self, counter: int) -> bool:
+        should_exit = await super().on_tick(counter)
+        if counter % self.ticks == 0 or should_exit:
+            self.heartbeat.write(
+                "draining" if should_exit else "ready",
+                requests=self.server_state.total_requests,
+                connections=len(self.server_state.connections),
+                tasks=len(self.server_state.tasks),
+            )
+        return should_exit
+
+    async def shutdown(self, sockets=None):
+        # uvicorn closes every connection without a request in progress, including ones just
+        # accepted whose request hasn't been read yet (the client gets a reset). Stop accepting
+        # first and give those requests a moment to arrive, so they are answered.
+        for server in self.servers:
+            server.close()
+        for sock in sockets or []:
+            sock.close()
+        await asyncio.sleep(SHUTDOWN_SETTLE)
+        await super().shutdown(sockets)
+
+
+class Worker:
+    def __init__(self, pid: int, slot: int):
+        self.pid = pid
+        self.slot = slot
+        self.started_at = time.time()
+        self.stopping_at = None
+
+
+class Master:
+    def __init__(self, config: uvicorn.Config, workers: int, state_dir: str, heartbeat: float,
+                 timeout: float, graceful_timeout: float):
+        self.config = config
+        self.size = workers
+        self.state_dir = state_dir
+        self.heartbeat = heartbeat
+        self.timeout = timeout
+        self.graceful_timeout = graceful_timeout
+        self.workers = {}
+        self.last_exit = {}
+        self.restarts = 0
+        self.signals = []
+        self.sock = None
+
+    def run(self):
+        self.config.load()  # imports main: schema setup runs here, once
+        import main
+
+        self.sock = self.config.bind_socket()
+        # Workers open their own connections; don't hand them (or the database) the master's
+        for bind in main.database_engines().values():
+            bind.dispose()
+        for sig in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, lambda signum, frame: self.signals.append(signum))
+        log(f"master {os.getpid()} serving on {self.config.host}:{self.config.port} "
+            f"with {self.size} workers (state in {self.state_dir})")
+
+        while True:
+            self.reap()
+            if self.signals:
+                signum = self.signals.pop(0)
+                if signum == signal.SIGHUP:
+                    self.rolling_restart()
+                else:
+                    break
+            self.check_health()
+            self.spawn_missing()
+            self.write_master_state()
+            time.sleep(0.2)
+        self.stop()
+
+    def spawn(self, slot: int) -> Worker:
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                signal.signal(signal.SIGHUP, signal.SIG_IGN)
+                for sig in (signal.SIGTERM, signal.SIGINT):
+                    signal.signal(sig, signal.SIG_DFL)
+                server = WorkerServer(self.config, Heartbeat(self.state_dir, slot), self.heartbeat)
+                server.run(sockets=[self.sock])
+            except SystemExit as e:
+                code = e.code if isinstance(e.code, int) else 1
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        worker = self.workers[pid] = Worker(pid, slot)
+        log(f"worker {pid} started in slot {slot}")
+        return worker
+
+    def active(self):
+        return [w for w in self.workers.values() if w.stopping_at is None]
+
+    def spawn_missing(self):
+        taken = {w.slot for w in self.active()}
+        for slot in range(self.size):
+            if slot not in taken and time.time() - self.last_exit.get(slot, 0) >= RESPAWN_DELAY:
+                self.spawn(slot)
+
+    def reap(self):
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            worker = self.workers.pop(pid, None)
+            if worker is None:
+                continue
+            self.remove_heartbeat(pid)
+            if worker.stopping_at is None:
+                self.last_exit[worker.slot] = time.time()
+                log(f"worker {pid} in slot {worker.slot} exited unexpectedly ({self.describe(status)})")
+
+    def stop_worker(self, worker: Worker):
+        if worker.stopping_at is None:
+            worker.stopping_at = time.time()
+            self.signal(worker.pid, signal.SIGTERM)
+
+    def check_health(self):
+        now = time.time()
+        for worker in list(self.workers.values()):
+            if worker.stopping_at is not None:
+                # uvicorn cancels what is left after graceful_timeout; allow a little extra
+                if now - worker.stopping_at > self.graceful_timeout + 5:
+                    log(f"worker {worker.pid} did not stop in time, killing it")
+                    self.signal(worker.pid, signal.SIGKILL)
+                continue
+            state = read_state(heartbeat_path(self.state_dir, worker.pid))
+            last_seen = state["heartbeat_at"] if state else worker.started_at
+            if now - last_seen > self.timeout:
+                log(f"worker {worker.pid} in slot {worker.slot} sent no heartbeat for {now - last_seen:.0f}s, replacing it")
+                worker.stopping_at = now
+                self.signal(worker.pid, signal.SIGKILL)
+
+    def wait_ready(self, worker: Worker) -> bool:
+        """Wait until `worker` has written its first heartbeat (it is then accepting requests)"""
+        deadline = time.time() + self.timeout
+        while time.time() < deadline:
+            self.reap()
+            if worker.pid not in self.workers:
+                return False
+            if read_state(heartbeat_path(self.state_dir, worker.pid)) is not None:
+                return True
+            time.sleep(0.05)
+        return False
+
+    def rolling_restart(self):
+        log("rolling restart")
+        for old in sorted(self.active(), key=lambda w: w.slot):
+            new = self.spawn(old.slot)
+            if not self.wait_ready(new):
+                log(f"replacement worker {new.pid} did not become ready; keeping worker {old.pid}")
+                self.stop_worker(new)
+                return
+            self.stop_worker(old)
+        self.restarts += 1
+
+    def stop(self):
+        log("shutting down")
+        for worker in list(self.workers.values()):
+            self.stop_worker(worker)
+        deadline = time.time() + self.graceful_timeout + 5
+        while self.workers and time.time() < deadline:
+            self.reap()
+            time.sleep(0.05)
+        for worker in list(self.workers.values()):
+            self.signal(worker.pid, signal.SIGKILL)
+        self.reap()
+        self.sock.close()
+        for name in os.listdir(self.state_dir):
+            if name == MASTER_FILE or name.startswith("worker-"):
+                os.unlink(os.path.join(self.state_dir, name))
+
+    def write_master_state(self):
+        write_state(os.path.join(self.state_dir, MASTER_FILE), {
+            "pid": os.getpid(), "workers": self.size, "restarts": self.restarts,
+            "worker_pids": sorted(w.pid for w in self.active()), "updated_at": time.time(),
+        })
+
+    def remove_heartbeat(self, pid: int):
+        try:
+            os.unlink(heartbeat_path(self.state_dir, pid))
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def signal(pid: int, signum: int):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    @staticmethod
+    def describe(status: int) -> str:
+        if os.WIFSIGNALED(status):
+            return f"signal {signal.Signals(os.WTERMSIG(status)).name}"
+        return f"exit code {os.waitstatus_to_exitcode(status)}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve PokeDaddy with several worker processes")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "0")) or os.cpu_count(),
+                        help="worker processes (default: WEB_CONCURRENCY, else one per CPU)")
+    parser.add_argument("--state-dir", default=os.getenv("WORKER_STATE_DIR"),
+                        help="directory for heartbeat files (default: a new temporary directory)")
+    parser.add_argument("--heartbeat", type=float, default=2.0, help="seconds between worker heartbeats")
+    parser.add_argument("--timeout", type=float, default=30.0,
+                        help="replace a worker whose heartbeat is older than this many seconds")
+    parser.add_argument("--graceful-timeout", type=float, default=30.0,
+                        help="seconds a stopping worker gets to finish in-flight requests")
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--no-access-log", action="store_true")
+    args = parser.parse_args()
+
+    state_dir = args.state_dir or tempfile.mkdtemp(prefix="pokedaddy-workers-")
+    os.makedirs(state_dir, exist_ok=True)
+    # Read by main (GET /admin/workers), so set it before the app is imported
+    os.environ["WORKER_STATE_DIR"] = state_dir
+
+    config = uvicorn.Config(
+        "main:app", host=args.host, port=args.port, log_level=args.log_level,
+        access_log=not args.no_access_log, timeout_graceful_shutdown=args.graceful_timeout,
+    )
+    Master(config, args.workers, state_dir, args.heartbeat, args.timeout, args.graceful_timeout).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Hash sharding of per-user rows across several databases.
+
+Each user lives on exactly one shard. A user's users, user_profiles and
+blocking_sessions rows are stored there, along with everything derived from them.
+The shard is picked by hashing the user_id onto a consistent hash ring. Every shard
+name gets `replicas` points on the ring, and a key belongs to the first point at or
+after its own hash. All processes compute the same shard for a user without a
+lookup, and adding an Nth shard moves only about 1/N of the users (the ones whose
+keys now land on the new shard's points) instead of reshuffling everyone.
+
+Shard names, not URLs, are hashed, so a shard can move to another host by changing
+its URL. Renaming a shard moves its users.
+
+Queries that span users (admin reports, exports, backfills) run on every shard at
+once with ShardMap.scatter and merge the results in the caller.
+"""
+
+import bisect
+import contextvars
+import hashlib
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional
+
+from sqlalchemy.orm import Session, sessionmaker
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    def __init__(self, nodes: Iterable[str], replicas: int = 100):
+        points = sorted((_hash(f"{node}#{i}"), node) for node in nodes for i in range(replicas))
+        if not points:
+            raise ValueError("a hash ring needs at least one node")
+        self._hashes = [h for h, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def node_for(self, key: str) -> str:
+        index = bisect.bisect_left(self._hashes, _hash(key))
+        return self._nodes[index % len(self._nodes)]
+
+
+def parse_shard_urls(spec: str) -> Dict[str, str]:
+    """Parse "s0=postgresql://db0/app, s1=postgresql://db1/app" into {name: url}"""
+    shards = {}
+    for item in filter(None, re.split(r"[\s,]+", spec)):
+        name, separator, url = item.partition("=")
+        if not separator or not name or "://" in name:
+            raise ValueError(f"shard entries look like name=url, got {item!r}")
+        if name in shards:
+            raise ValueError(f"duplicate shard name {name!r}")
+        shards[name] = url
+    return shards
+
+
+class ShardMap:
+    """Engines and session factories per shard, and the ring that assigns users to them.
+    Sessions carry their shard name in `session.info["shard"]` and the shard's read-only
+    engine (`readers`, by default the shard's engine itself) in `session.info["reader"]`.
+    """
+
+    def __init__(self, engines: Dict[str, object], replicas: int = 100,
+                 readers: Optional[Dict[str, object]] = None, session_class=Session):
+        self.engines = dict(engines)
+        self.names = list(self.engines)
+        self.readers = {name: (readers or {}).get(name, engine) for name, engine in self.engines.items()}
+        self.sessionmakers = {
+            name: sessionmaker(autocommit=False, autoflush=False, bind=engine, class_=session_class,
+                               info={"shard": name, "reader": self.readers[name]})
+            for name, engine in self.engines.items()
+        }
+        self.ring = HashRing(self.names, replicas)
+
+    def name_for(self, user_id: str) -> str:
+        if len(self.names) == 1:
+            return self.names[0]
+        return self.ring.node_for(str(user_id).lower())
+
+    def engine_for(self, user_id: str):
+        return self.engines[self.name_for(user_id)]
+
+    def sessionmaker_for(self, user_id: str) -> sessionmaker:
+        return self.sessionmakers[self.name_for(user_id)]
+
+    def session_for(self, user_id: str) -> Session:
+        return self.sessionmaker_for(user_id)()
+
+    def scatter(self, fn: Callable, names: Optional[List[str]] = None) -> Dict[str, object]:
+        """Run fn(name, engine) on each shard (all by default) in parallel; {name: result} in shard order.
+        The first exception is re-raised once every call has finished. Calls run in a copy of
+        the caller's context, so trace spans still nest under the request.
+        """
+        names = self.names if names is None else names
+        if len(names) <= 1:
+            return {name: fn(name, self.engines[name]) for name in names}
+        with ThreadPoolExecutor(max_workers=len(names), thread_name_prefix="shard-scatter") as pool:
+            futures = {name: pool.submit(contextvars.copy_context().run, fn, name, self.engines[name]) for name in names}
+        return {name: future.result() for name, future in futures.items()}
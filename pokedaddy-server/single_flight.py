@@ -0,0 +1,64 @@
+"""
+Request coalescing ("single flight") for identical concurrent reads.
+
+SingleFlight.do(key, fn) runs `fn()` on a small worker pool. Callers that ask for
+the same key while that call is still running don't start their own: they wait on
+the same future and get the same result, or the same exception. Once the call
+finishes the key is forgotten, so the next request reads fresh data. Nothing is
+cached beyond the lifetime of the call.
+
+Every caller waits at most `timeout` seconds and then gets asyncio.TimeoutError. The call
+itself keeps running, and later callers keep joining it instead of piling more
+queries onto a slow database. Results are shared between callers, so treat them
+as read-only.
+"""
+
+import asyncio
+import contextvars
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Hashable
+
+
+class SingleFlight:
+    def __init__(self, timeout: float = 5.0, max_workers: int = 8):
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.calls = 0
+        self.shared = 0
+        self._lock = threading.Lock()
+        self._pid = None
+        self._executor = None
+        self._in_flight: Dict[Hashable, Future] = {}
+
+    async def do(self, key: Hashable, fn: Callable):
+        """Return `fn()`, sharing one call among all concurrent callers with the same key."""
+        with self._lock:
+            self._ensure_executor()
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                self.calls += 1
+                # Runs in the first caller's context, so e.g. its trace span parents the queries
+                future = self._executor.submit(contextvars.copy_context().run, fn)
+                self._in_flight[key] = future
+            else:
+                self.shared += 1
+        if leader:
+            # Outside the lock: the callback runs right here if the call has already finished
+            future.add_done_callback(lambda done: self._forget(key, done))
+        # shield: one caller timing out must not cancel the call for everyone else
+        return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), self.timeout)
+
+    def _forget(self, key: Hashable, future: Future):
+        with self._lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+    def _ensure_executor(self):
+        # Created lazily and per process, so forked workers don't inherit the parent's threads
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._in_flight = {}
+            self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix="pokedaddy-single-flight")
@@ -0,0 +1,65 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, inspect, text
+
+
+def test_concurrent_starts_create_one_active_session():
+    from main import app, SessionLocal, BlockingSession, insert_active_session
+
+    client = TestClient(app)
+    r = client.post("/auth/register", json={"apple_user_id": "single_session_user", "email": "single@example.com"})
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+    user_id = client.get("/users/me", headers=headers).json()["id"]
+    profile_id = client.get("/profiles", headers=headers).json()[0]["id"]
+
+    def start(_):
+        db = SessionLocal()
+        try:
+            result = insert_active_session(db, user_id, profile_id)
+            db.commit()
+            return result
+        finally:
+            db.close()
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(start, range(16)))
+
+    assert sum(created for _, created in results) == 1
+    assert len({session_id for session_id, _ in results}) == 1
+
+    db = SessionLocal()
+    try:
+        assert db.query(BlockingSession).filter(
+            BlockingSession.user_id == user_id, BlockingSession.is_active == True
+        ).count() == 1
+    finally:
+        db.close()
+
+    r = client.post("/blocking/toggle", headers=headers, json={"profile_id": profile_id, "action": "start"})
+    assert r.json()["message"] == "Already blocking"
+    r = client.post("/admin/start-blocking-by-email", params={"email": "single@example.com"})
+    assert r.json()["message"] == "Already blocking"
+    assert r.json()["session_id"] == results[0][0]
+
+
+def test_upgrade_schema_ends_duplicate_sessions_before_indexing(tmp_path):
+    from main import upgrade_schema
+
+    legacy = create_engine(f"sqlite:///{tmp_path}/legacy.db")
+    now = datetime.utcnow()
+    with legacy.begin() as conn:
+        conn.execute(text("""CREATE TABLE blocking_sessions (
+            id VARCHAR PRIMARY KEY, user_id VARCHAR, profile_id VARCHAR,
+            is_active BOOLEAN, started_at DATETIME, ended_at DATETIME)"""))
+        for session_id, started_at in (("s1", now - timedelta(hours=1)), ("s2", now), ("s3", now)):
+            conn.execute(text("INSERT INTO blocking_sessions VALUES (:id, 'u1', 'p1', 1, :started_at, NULL)"),
+                         {"id": session_id, "started_at": started_at})
+
+    upgrade_schema(legacy)
+
+    assert "uq_blocking_sessions_active" in {i["name"] for i in inspect(legacy).get_indexes("blocking_sessions")}
+    with legacy.connect() as conn:
+        active = conn.execute(text("SELECT id FROM blocking_sessions WHERE is_active = 1")).scalars().all()
+    assert active == ["s1"]
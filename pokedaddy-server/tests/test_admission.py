@@ -0,0 +1,91 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from admission import CRITICAL, LOW, AdmissionMiddleware, RouteClass, parse_rates
+
+
+def build_app(release: threading.Event, max_concurrency: int, rates=(100, 100)):
+    app = FastAPI()
+
+    @app.get("/blocking/status")
+    def status():
+        release.wait(5)
+        return {"ok": True}
+
+    @app.post("/admin/slow")
+    def slow():
+        release.wait(5)
+        return {"ok": True}
+
+    @app.post("/auth/register")
+    def register():
+        return {"ok": True}
+
+    admission = AdmissionMiddleware(app, [
+        RouteClass("status", r"^/blocking/status$", CRITICAL, *rates),
+        RouteClass("register", r"^/auth/register$", LOW, *rates, by_user=False),
+        RouteClass("admin", r"^/admin/", LOW, 100, 100, by_user=False),
+    ], max_concurrency=max_concurrency, trust_forwarded=True,
+        authenticate=lambda token: token.removeprefix("valid-") if token.startswith("valid-") else None)
+    return admission, TestClient(admission)
+
+
+def test_token_bucket_per_client_and_route():
+    assert parse_rates("register=1/2, admin=5") == {"register": (1.0, 2.0), "admin": (5.0, 5.0)}
+    released = threading.Event()
+    released.set()
+    admission, client = build_app(released, max_concurrency=10, rates=parse_rates("register=1/2")["register"])
+
+    assert [client.post("/auth/register").status_code for _ in range(3)] == [200, 200, 429]
+    r = client.post("/auth/register")
+    assert r.status_code == 429 and r.headers["retry-after"] == "1"
+    # Another client (here: another forwarded address) has its own bucket, and other routes are unaffected
+    assert client.post("/auth/register", headers={"X-Forwarded-For": "10.0.0.2"}).status_code == 200
+    assert client.post("/admin/slow").status_code == 200
+    time.sleep(1.05)
+    assert client.post("/auth/register").status_code == 200
+    assert admission.throttled["register"] == 2
+
+
+def test_unverified_tokens_do_not_get_their_own_bucket():
+    released = threading.Event()
+    released.set()
+    admission, client = build_app(released, max_concurrency=10, rates=(1, 2))
+
+    # Made-up tokens are all the same client: its address
+    statuses = [client.get("/blocking/status", headers={"Authorization": f"Bearer bogus-{i}"}).status_code
+                for i in range(4)]
+    assert statuses == [200, 200, 429, 429]
+    assert client.get("/blocking/status").status_code == 429
+    # A verified token is keyed by its user, wherever it comes from
+    valid = {"Authorization": "Bearer valid-alice"}
+    assert [client.get("/blocking/status", headers=valid).status_code for _ in range(3)] == [200, 200, 429]
+    # Register stays keyed by address even with a valid token
+    assert [client.post("/auth/register", headers=valid).status_code for _ in range(3)] == [200, 200, 429]
+    assert admission.throttled == {"status": 4, "register": 1, "admin": 0}
+
+
+def test_low_priority_is_shed_before_critical_polls():
+    release = threading.Event()
+    admission, client = build_app(release, max_concurrency=4)  # LOW may use 2 slots, CRITICAL all 4
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        held = [pool.submit(client.post, "/admin/slow") for _ in range(2)]
+        while admission.in_flight < 2:
+            time.sleep(0.01)
+        shed = client.post("/admin/slow")
+        assert shed.status_code == 503 and shed.headers["retry-after"] == "1"
+
+        polls = [pool.submit(client.get, "/blocking/status") for _ in range(2)]
+        while admission.in_flight < 4:
+            time.sleep(0.01)
+        assert client.get("/blocking/status").status_code == 503  # the whole budget is in use
+        release.set()
+        assert [f.result().status_code for f in held + polls] == [200] * 4
+
+    assert admission.in_flight == 0
+    assert admission.shed == {"status": 1, "register": 0, "admin": 1}
@@ -0,0 +1,64 @@
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+
+def register(client, name):
+    r = client.post("/auth/register", json={"apple_user_id": f"catalog_{name}", "email": f"catalog_{name}@example.com"})
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+    return headers, client.get("/profiles", headers=headers).json()[0]["id"]
+
+
+def test_profile_apps_track_restricted_apps_and_answer_who_blocks():
+    from main import app, SessionLocal, ProfileApp, app_catalog
+
+    client = TestClient(app)
+    alice, alice_profile = register(client, "alice")
+    bob, bob_profile = register(client, "bob")
+    client.put(f"/profiles/{alice_profile}", headers=alice, json={"restricted_apps": ["cat.insta", "cat.tiktok"]})
+    client.put(f"/profiles/{bob_profile}", headers=bob, json={"restricted_apps": ["cat.insta"]})
+    client.post("/blocking/toggle", headers=alice, json={"profile_id": alice_profile, "action": "start"})
+
+    active = client.get("/admin/apps/blockers", params={"bundle_id": "cat.insta"}).json()
+    assert [b["profile_id"] for b in active["blockers"]] == [alice_profile]
+    assert active["blockers"][0]["session_id"] is not None
+    everyone = client.get("/admin/apps/blockers", params={"bundle_id": "cat.insta", "active_only": False}).json()
+    assert {b["profile_id"] for b in everyone["blockers"]} == {alice_profile, bob_profile}
+    assert client.get("/admin/apps/blockers", params={"bundle_id": "cat.unknown"}).json()["blockers"] == []
+
+    # Every write path keeps the join table in line with the JSON column
+    client.patch(f"/profiles/{bob_profile}", headers=bob, json={"add_apps": ["cat.tiktok"], "remove_apps": ["cat.insta"]})
+    client.post("/admin/unblock-app-by-email", params={"email": "catalog_alice@example.com", "app_bundle_id": "cat.insta"})
+    r = client.post("/profiles", headers=bob, json={"name": "Extra", "restricted_apps": ["cat.insta"]})
+    extra_profile = r.json()["id"]
+    everyone = client.get("/admin/apps/blockers", params={"bundle_id": "cat.insta", "active_only": False}).json()
+    assert [b["profile_id"] for b in everyone["blockers"]] == [extra_profile]
+    client.delete(f"/profiles/{extra_profile}", headers=bob)
+
+    ids = app_catalog.ids(SessionLocal(), ["cat.insta", "cat.tiktok"])
+    db = SessionLocal()
+    try:
+        pairs = {(p.app_id, p.profile_id) for p in db.query(ProfileApp).filter(ProfileApp.app_id.in_(ids.values()))}
+    finally:
+        db.close()
+    assert pairs == {(ids["cat.tiktok"], alice_profile), (ids["cat.tiktok"], bob_profile)}
+
+    top = client.get("/admin/apps/top", params={"limit": 1000}).json()
+    assert {"bundle_id": "cat.tiktok", "app_id": ids["cat.tiktok"], "profiles": 2} in top
+
+
+def test_sync_fills_existing_profiles_without_burning_ids(tmp_path):
+    from main import Base, sync_profile_apps
+
+    legacy = create_engine(f"sqlite:///{tmp_path}/legacy.db")
+    Base.metadata.create_all(legacy)
+    with legacy.begin() as conn:
+        conn.execute(text("""INSERT INTO user_profiles (id, user_id, restricted_apps, version, updated_at)
+                             VALUES ('p1', 'u1', '["a", "b", "a"]', 1, CURRENT_TIMESTAMP),
+                                    ('p2', 'u2', '["b"]', 1, CURRENT_TIMESTAMP), ('p3', 'u3', NULL, 1, CURRENT_TIMESTAMP)"""))
+        sync_profile_apps(conn)
+        sync_profile_apps(conn, ["p1", "p2"])
+        catalog = dict(conn.execute(text("SELECT bundle_id, id FROM app_catalog")).all())
+        pairs = set(conn.execute(text("SELECT app_id, profile_id FROM profile_apps")).all())
+
+    assert sorted(catalog.values()) == [1, 2]
+    assert pairs == {(catalog["a"], "p1"), (catalog["b"], "p1"), (catalog["b"], "p2")}
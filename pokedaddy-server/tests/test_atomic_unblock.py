@@ -0,0 +1,113 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event, inspect, text, update
+
+
+def register(client, apple_user_id):
+    r = client.post("/auth/register", json={"apple_user_id": apple_user_id, "email": f"{apple_user_id}@example.com"})
+    assert r.status_code == 200, r.text
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+    return headers, client.get("/users/me", headers=headers).json()["id"]
+
+
+def test_concurrent_unblocks_do_not_lose_updates():
+    from main import app, SessionLocal, remove_restricted_app
+
+    client = TestClient(app)
+    headers, user_id = register(client, "atomic_unblock_user")
+    apps = [f"com.example.app{i}" for i in range(12)]
+    profile = client.post("/profiles", headers=headers, json={"name": "Focus", "restricted_apps": apps}).json()
+    assert profile["version"] == 1
+
+    def unblock(app_bundle_id):
+        db = SessionLocal()
+        try:
+            remaining = remove_restricted_app(db, profile["id"], user_id, app_bundle_id)
+            db.commit()
+            return remaining
+        finally:
+            db.close()
+
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        results = list(pool.map(unblock, apps[:10]))
+    assert all(r is not None for r in results)
+
+    # Unblocking an app that is no longer listed is a no-op
+    assert unblock(apps[0]) is None
+
+    db = SessionLocal()
+    try:
+        row = db.execute(text("SELECT restricted_apps, version FROM user_profiles WHERE id = :id"),
+                         {"id": profile["id"]}).first()
+    finally:
+        db.close()
+    assert json.loads(row[0]) == apps[10:]
+    assert row[1] == 11
+
+
+def test_admin_unblock_returns_remaining_and_stale_update_conflicts():
+    from main import app
+
+    client = TestClient(app)
+    headers, user_id = register(client, "atomic_unblock_admin")
+    profile = client.post("/profiles", headers=headers,
+                          json={"name": "Work", "restricted_apps": ["a.app", "b.app", "c.app"]}).json()
+    r = client.post("/blocking/toggle", headers=headers, json={"profile_id": profile["id"], "action": "start"})
+    assert r.status_code == 200
+
+    r = client.post("/admin/unblock-app-by-email",
+                    params={"email": "atomic_unblock_admin@example.com", "app_bundle_id": "b.app"})
+    assert r.status_code == 200, r.text
+    assert r.json()["remaining_apps"] == ["a.app", "c.app"]
+
+    r = client.post("/admin/unblock-app",
+                    params={"user_id": user_id, "profile_id": profile["id"], "app_bundle_id": "zzz.app"})
+    assert r.json() == {"message": "App was not in restricted list", "remaining_apps": ["a.app", "c.app"]}
+
+    # The client still holds version 1; the unblock bumped it
+    r = client.put(f"/profiles/{profile['id']}", headers=headers, json={"name": "Renamed", "version": 1})
+    assert r.status_code == 409
+    r = client.put(f"/profiles/{profile['id']}", headers=headers, json={"name": "Renamed", "version": 2})
+    assert r.status_code == 200, r.text
+    assert r.json()["version"] == 3
+    assert r.json()["restricted_apps"] == ["a.app", "c.app"]
+
+
+def test_delete_of_a_concurrently_modified_profile_is_409():
+    import main
+
+    client = TestClient(main.app)
+    headers, _ = register(client, "stale_delete")
+    profile_id = client.post("/profiles", headers=headers, json={"name": "Gone"}).json()["id"]
+
+    # Another request bumps the version after this one has loaded the profile
+    def concurrent_edit(mapper, connection, target):
+        connection.execute(update(main.UserProfile.__table__)
+                           .where(main.UserProfile.__table__.c.id == target.id)
+                           .values(version=target.version + 1))
+
+    event.listen(main.UserProfile, "before_delete", concurrent_edit)
+    try:
+        r = client.delete(f"/profiles/{profile_id}", headers=headers)
+    finally:
+        event.remove(main.UserProfile, "before_delete", concurrent_edit)
+    assert r.status_code == 409
+    assert profile_id in [p["id"] for p in client.get("/profiles", headers=headers).json()]
+    assert client.delete(f"/profiles/{profile_id}", headers=headers).status_code == 200
+
+def test_upgrade_schema_adds_missing_columns(tmp_path):
+    from main import upgrade_schema
+
+    legacy = create_engine(f"sqlite:///{tmp_path}/legacy.db")
+    with legacy.begin() as conn:
+        conn.execute(text("CREATE TABLE user_profiles (id VARCHAR PRIMARY KEY, restricted_apps TEXT)"))
+        conn.execute(text("INSERT INTO user_profiles VALUES ('p1', '[]')"))
+
+    upgrade_schema(legacy)
+    upgrade_schema(legacy)  # idempotent
+
+    assert "version" in {c["name"] for c in inspect(legacy).get_columns("user_profiles")}
+    with legacy.connect() as conn:
+        assert conn.execute(text("SELECT version FROM user_profiles")).scalar() == 1
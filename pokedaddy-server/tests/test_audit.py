@@ -0,0 +1,67 @@
+from fastapi.testclient import TestClient
+
+from audit import AuditLog
+
+
+class FailingBind:
+    def begin(self):
+        raise ConnectionError("database is down")
+
+
+def test_audit_log_buffers_and_bulk_inserts(caplog):
+    from main import engine, AuditEvent
+
+    log = AuditLog(engine, AuditEvent.__table__, max_batch=1000, flush_interval=60, max_buffer=3)
+    log.bind = FailingBind()
+    for i in range(5):
+        log.record("test.buffer", "admin", target=f"event-{i}")
+    # A failed flush keeps the events (capped at max_buffer, oldest dropped) for the next attempt
+    with caplog.at_level("ERROR", logger="pokedaddy.audit"):
+        assert log.flush() == 0
+    assert log.dropped == 2
+    [failure] = caplog.records
+    assert failure.getMessage() == "audit flush of 3 events failed"
+    assert failure.exc_info[0] is ConnectionError
+
+    log.bind = engine
+    assert log.flush() == 3
+    assert log.flushes == 1
+    with engine.connect() as conn:
+        targets = conn.execute(
+            AuditEvent.__table__.select().where(AuditEvent.action == "test.buffer").order_by(AuditEvent.id)
+        ).all()
+    assert [row.target for row in targets] == ["event-2", "event-3", "event-4"]
+
+
+def test_admin_and_user_changes_are_audited():
+    import main
+
+    client = TestClient(main.app)
+    r = client.post("/auth/register", json={"apple_user_id": "audit_user", "email": "audit@example.com"})
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+    user_id = client.get("/users/me", headers=headers).json()["id"]
+    profile_id = client.get("/profiles", headers=headers).json()[0]["id"]
+    client.put(f"/profiles/{profile_id}", headers=headers, json={"restricted_apps": ["com.a", "com.b"]})
+    client.post("/blocking/toggle", headers=headers, json={"profile_id": profile_id, "action": "start"})
+    client.post("/admin/unblock-app-by-email", headers={"X-Actor": "mcp"},
+                params={"email": "audit@example.com", "app_bundle_id": "com.a", "reason": "homework done"})
+    client.post("/admin/unblock-app-by-email",  # not restricted: nothing changes, nothing is recorded
+                params={"email": "audit@example.com", "app_bundle_id": "com.missing"})
+    ended = client.post("/admin/end-blocking-by-email", params={"email": "audit@example.com", "reason": "bedtime"})
+    main.audit_log.flush()
+
+    page = client.get("/admin/audit", params={"email": "audit@example.com", "limit": 4}).json()
+    rest = client.get("/admin/audit", params={"user_id": user_id, "before": page["next_before"]}).json()
+    events = [(e["action"], e["actor"], e["target"], e["reason"]) for e in page["events"] + rest["events"]]
+    assert events == [
+        ("blocking.end", "admin", ended.json()["session_ids"][0], "bedtime"),
+        ("app.unblock", "admin:mcp", "com.a", "homework done"),
+        ("blocking.start", f"user:{user_id}", events[2][2], None),
+        ("profile.update", f"user:{user_id}", None, None),
+        ("user.register", f"user:{user_id}", None, None),
+    ]
+    assert rest["next_before"] is None
+    assert all(e["profile_id"] == profile_id for e in page["events"])
+
+    only_unblocks = client.get("/admin/audit", params={"user_id": user_id, "action": "app.unblock"}).json()
+    assert [e["target"] for e in only_unblocks["events"]] == ["com.a"]
@@ -0,0 +1,175 @@
+import socketserver
+import threading
+import time
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from cache import MemoryCache, RedisCache
+
+
+class FakeRespHandler(socketserver.StreamRequestHandler):
+    """Just enough of the Redis protocol for RedisCache: GET, MGET, SET ... PX, DEL, INCR, PEXPIRE, SELECT, PING."""
+
+    def read_command(self):
+        header = self.rfile.readline()
+        if not header:
+            return None
+        args = []
+        for _ in range(int(header[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def handle(self):
+        data = self.server.data
+        while True:
+            args = self.read_command()
+            if args is None:
+                return
+            command = args[0].upper()
+            self.server.commands.append(command)
+            if command in (b"GET", b"MGET"):
+                values = []
+                for key in args[1:]:
+                    value, expires_at = data.get(key, (None, None))
+                    live = value is not None and not (expires_at and expires_at <= time.monotonic())
+                    values.append(b"$%d\r\n%s\r\n" % (len(value), value) if live else b"$-1\r\n")
+                self.wfile.write(values[0] if command == b"GET" else b"*%d\r\n" % len(values) + b"".join(values))
+            elif command == b"INCR":
+                value = int(data.get(args[1], (b"0", None))[0]) + 1
+                data[args[1]] = (str(value).encode(), data.get(args[1], (None, None))[1])
+                self.wfile.write(b":%d\r\n" % value)
+            elif command == b"PEXPIRE":
+                value, _ = data.get(args[1], (None, None))
+                if value is not None:
+                    data[args[1]] = (value, time.monotonic() + int(args[2]) / 1000)
+                self.wfile.write(b":%d\r\n" % (value is not None))
+            elif command == b"SET":
+                expires_at = time.monotonic() + int(args[4]) / 1000 if len(args) > 4 else None
+                data[args[1]] = (args[2], expires_at)
+                self.wfile.write(b"+OK\r\n")
+            elif command == b"DEL":
+                self.wfile.write(b":%d\r\n" % sum(data.pop(key, None) is not None for key in args[1:]))
+            elif command in (b"SELECT", b"PING"):
+                self.wfile.write(b"+OK\r\n")
+            else:
+                self.wfile.write(b"-ERR unknown command\r\n")
+
+
+def start_fake_redis():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), FakeRespHandler)
+    server.daemon_threads = True
+    server.data, server.commands = {}, []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def test_cache_backends_round_trip_and_expire(caplog):
+    server = start_fake_redis()
+    redis_cache = RedisCache(f"redis://127.0.0.1:{server.server_address[1]}/1")
+    try:
+        for cache in (MemoryCache(max_entries=2), redis_cache):
+            cache.set("a", {"x": [1, 2]}, ttl=60)
+            assert cache.get("a") == {"x": [1, 2]}
+            cache.set("short", "v", ttl=0.01)
+            time.sleep(0.05)
+            assert cache.get("short") is None
+            cache.delete("a", "missing")
+            assert cache.get("a") is None
+
+            # A load that started before a commit can't store its outdated result
+            assert cache.get_current("state:u") == (None, 0)
+            cache.invalidate("state:u", ttl=60)  # the commit
+            cache.set_current("state:u", "loaded before the commit", 0, ttl=60)
+            assert cache.get_current("state:u") == (None, 1)
+            cache.set_current("state:u", "loaded after the commit", 1, ttl=60)
+            assert cache.get_current("state:u") == ("loaded after the commit", 1)
+        assert len(redis_cache._idle) == 1  # one pooled connection reused for every command
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    # A dead cache server degrades to misses instead of failing requests, reported once in a while
+    redis_cache._idle.clear()
+    with caplog.at_level("WARNING", logger="pokedaddy.cache"):
+        assert redis_cache.get("a") is None
+        redis_cache.set("a", 1, ttl=60)
+        redis_cache.invalidate("a", ttl=60)
+    assert [r.getMessage().split(":")[0] for r in caplog.records] == ["cache get a failed"]
+    redis_cache._failure_logged_at -= 60
+    with caplog.at_level("WARNING", logger="pokedaddy.cache"):
+        redis_cache.delete("a")
+    assert caplog.records[-1].getMessage().endswith("(2 more failures since the last report)")
+
+
+def test_status_polls_served_from_shared_cache(monkeypatch):
+    import main
+
+    server = start_fake_redis()
+    monkeypatch.setattr(main, "cache", RedisCache(f"redis://127.0.0.1:{server.server_address[1]}"))
+    try:
+        client = TestClient(main.app)
+        r = client.post("/auth/register", json={"apple_user_id": "cache_user", "email": "cache@example.com"})
+        headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+        user_id = client.get("/users/me", headers=headers).json()["id"]
+        profile_id = client.get("/profiles", headers=headers).json()[0]["id"]
+        client.put(f"/profiles/{profile_id}", headers=headers, json={"restricted_apps": ["com.a", "com.b"]})
+        client.post("/blocking/toggle", headers=headers, json={"profile_id": profile_id, "action": "start"})
+        client.get("/blocking/status", headers=headers)
+        client.get("/admin/status-by-email", params={"email": "cache@example.com"})
+
+        main.audit_log.flush()  # so a background audit flush can't land in the window below
+        statements = []
+        record = lambda *args: statements.append(args[2])
+        event.listen(main.engine, "before_cursor_execute", record)
+        try:
+            status = client.get("/blocking/status", headers=headers).json()
+            apps = client.get(f"/profiles/{profile_id}/restricted-apps", headers=headers).json()
+            by_email = client.get("/admin/status-by-email", params={"email": "cache@example.com"}).json()
+        finally:
+            event.remove(main.engine, "before_cursor_execute", record)
+        assert statements == []
+        assert status["is_blocking"] and status["profile_id"] == profile_id
+        assert apps["restricted_apps"] == ["com.a", "com.b"]
+        assert by_email["restricted_apps"] == ["com.a", "com.b"]
+
+        # Every write invalidates the user's cached state
+        client.post("/admin/unblock-app", params={"app_bundle_id": "com.a", "user_id": user_id, "profile_id": profile_id})
+        assert client.get(f"/profiles/{profile_id}/restricted-apps", headers=headers).json()["restricted_apps"] == ["com.b"]
+        client.post("/admin/end-blocking-by-email", params={"email": "cache@example.com"})
+        assert client.get("/blocking/status", headers=headers).json()["is_blocking"] is False
+        assert client.get("/admin/status-by-email", params={"email": "cache@example.com"}).json()["is_blocking"] is False
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_status_load_racing_a_commit_is_not_cached(monkeypatch):
+    import main
+
+    monkeypatch.setattr(main, "cache", MemoryCache())
+    client = TestClient(main.app)
+    r = client.post("/auth/register", json={"apple_user_id": "cache_race", "email": "cache-race@example.com"})
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+    user_id = client.get("/users/me", headers=headers).json()["id"]
+    profile_id = client.get("/profiles", headers=headers).json()[0]["id"]
+    client.post("/blocking/toggle", headers=headers, json={"profile_id": profile_id, "action": "start"})
+
+    # The session ends (and commits) after the status read has loaded it as active
+    bind = main.shards.readers[main.shards.name_for(user_id)]
+    ended = []
+    def end_session_mid_load(conn, cursor, statement, *args):
+        if "FROM effective_blocklists" in statement and not ended:
+            ended.append(True)
+            with main.shards.session_for(user_id) as db:
+                db.query(main.BlockingSession).filter(main.BlockingSession.user_id == user_id).one().is_active = False
+                db.commit()
+
+    event.listen(bind, "before_cursor_execute", end_session_mid_load)
+    try:
+        assert client.get("/blocking/status", headers=headers).json()["is_blocking"] is True
+    finally:
+        event.remove(bind, "before_cursor_execute", end_session_mid_load)
+    assert ended
+    assert client.get("/blocking/status", headers=headers).json()["is_blocking"] is False
@@ -0,0 +1,52 @@
+import email.utils
+from datetime import datetime, timezone
+
+from fastapi.testclient import TestClient
+
+
+def test_profiles_and_restricted_apps_revalidate_with_304():
+    from main import app
+
+    client = TestClient(app)
+    r = client.post("/auth/register", json={"apple_user_id": "etag_user", "email": "etag@example.com"})
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+    user_id = client.get("/users/me", headers=headers).json()["id"]
+
+    r = client.get("/profiles", headers=headers)
+    assert r.headers["cache-control"] == "private, no-cache"
+    etag = r.headers["etag"]
+    profile_id = r.json()[0]["id"]
+
+    r = client.get("/profiles", headers={**headers, "If-None-Match": etag})
+    assert r.status_code == 304 and r.content == b"" and r.headers["etag"] == etag
+    assert client.get("/profiles", headers={**headers, "If-None-Match": '"stale"'}).status_code == 200
+
+    # Deleting a profile changes the list, whichever validator the client sends
+    extra = client.post("/profiles", headers=headers, json={"name": "Extra"}).json()["id"]
+    r = client.get("/profiles", headers=headers)
+    with_extra = r.headers["etag"]
+    assert "last-modified" not in r.headers
+    client.delete(f"/profiles/{extra}", headers=headers)
+    assert client.get("/profiles", headers={**headers, "If-None-Match": with_extra}).status_code == 200
+    since = email.utils.format_datetime(datetime.now(timezone.utc), usegmt=True)
+    r = client.get("/profiles", headers={**headers, "If-Modified-Since": since})
+    assert r.status_code == 200 and extra not in [p["id"] for p in r.json()]
+    assert client.get("/profiles", headers={**headers, "If-None-Match": etag}).status_code == 304
+
+    client.put(f"/profiles/{profile_id}", headers=headers, json={"restricted_apps": ["com.a", "com.b"]})
+    r = client.get("/profiles", headers={**headers, "If-None-Match": etag})
+    assert r.status_code == 200 and r.headers["etag"] != etag
+    etag = r.headers["etag"]
+
+    client.post("/blocking/toggle", headers=headers, json={"profile_id": profile_id, "action": "start"})
+    url = f"/profiles/{profile_id}/restricted-apps"
+    r = client.get(url, headers=headers)
+    apps_etag = r.headers["etag"]
+    assert r.json()["restricted_apps"] == ["com.a", "com.b"]
+    assert client.get(url, headers={**headers, "If-None-Match": f"W/{apps_etag}"}).status_code == 304
+
+    # Unblocking changes the block list and the profile validators
+    client.post("/admin/unblock-app", params={"app_bundle_id": "com.a", "user_id": user_id, "profile_id": profile_id})
+    r = client.get(url, headers={**headers, "If-None-Match": apps_etag})
+    assert r.status_code == 200 and r.json()["restricted_apps"] == ["com.b"]
+    assert client.get("/profiles", headers={**headers, "If-None-Match": etag}).status_code == 200
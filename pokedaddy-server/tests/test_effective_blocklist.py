@@ -0,0 +1,90 @@
+import pytest
+from fastapi.testclient import TestClient
+
+
+def test_effective_blocklist_follows_session_lifecycle():
+    from main import app
+
+    client = TestClient(app)
+    r = client.post("/auth/register", json={"apple_user_id": "blocklist_user", "email": "blocklist@example.com"})
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+    user_id = client.get("/users/me", headers=headers).json()["id"]
+    profile_id = client.get("/profiles", headers=headers).json()[0]["id"]
+    client.put(f"/profiles/{profile_id}", headers=headers,
+               json={"restricted_apps": ["com.a", "com.b"], "restricted_categories": ["games"]})
+
+    def restricted():
+        r = client.get(f"/profiles/{profile_id}/restricted-apps", headers=headers)
+        return int(r.headers["x-blocklist-version"]), r.json()
+
+    assert restricted() == (0, {"restricted_apps": [], "restricted_categories": []})
+
+    client.post("/blocking/toggle", headers=headers, json={"profile_id": profile_id, "action": "start"})
+    assert restricted() == (1, {"restricted_apps": ["com.a", "com.b"], "restricted_categories": ["games"]})
+
+    client.post("/admin/unblock-app", params={"app_bundle_id": "com.a", "user_id": user_id, "profile_id": profile_id})
+    assert restricted() == (2, {"restricted_apps": ["com.b"], "restricted_categories": ["games"]})
+
+    client.put(f"/profiles/{profile_id}", headers=headers, json={"restricted_apps": ["com.b", "com.c"]})
+    assert restricted() == (3, {"restricted_apps": ["com.b", "com.c"], "restricted_categories": ["games"]})
+    status = client.get("/admin/status-by-email", params={"email": "blocklist@example.com"}).json()
+    assert status["restricted_apps"] == ["com.b", "com.c"]
+
+    client.post("/admin/end-blocking", params={"user_id": user_id, "profile_id": profile_id})
+    assert restricted() == (4, {"restricted_apps": [], "restricted_categories": []})
+
+    # Editing an inactive profile doesn't touch the blocklist until the next session starts
+    client.put(f"/profiles/{profile_id}", headers=headers, json={"restricted_apps": ["com.d"]})
+    assert restricted()[0] == 4
+    client.post("/admin/start-blocking-by-email", params={"email": "blocklist@example.com", "profile_id": profile_id})
+    assert restricted() == (5, {"restricted_apps": ["com.d"], "restricted_categories": ["games"]})
+
+
+def test_existing_active_sessions_get_materialized(tmp_path):
+    from sqlalchemy import create_engine, text
+    from main import Base, EffectiveBlocklist, materialize_active_blocklists
+
+    legacy = create_engine(f"sqlite:///{tmp_path}/legacy.db")
+    Base.metadata.create_all(legacy)
+    with legacy.begin() as conn:
+        conn.execute(text("""INSERT INTO user_profiles (id, user_id, restricted_apps, restricted_categories, version, updated_at)
+                             VALUES ('p1', 'u1', '["com.a"]', '[]', 1, CURRENT_TIMESTAMP),
+                                    ('p2', 'u1', '["com.b"]', '[]', 1, CURRENT_TIMESTAMP)"""))
+        conn.execute(text("""INSERT INTO blocking_sessions (id, user_id, profile_id, is_active, updated_at)
+                             VALUES ('s1', 'u1', 'p1', 1, CURRENT_TIMESTAMP), ('s2', 'u1', 'p2', 0, CURRENT_TIMESTAMP)"""))
+        materialize_active_blocklists(conn)
+        materialize_active_blocklists(conn)  # idempotent
+        rows = conn.execute(EffectiveBlocklist.__table__.select()).mappings().all()
+
+    assert [(r["profile_id"], r["session_id"], r["version"]) for r in rows] == [("p1", "s1", 1)]
+    assert rows[0]["payload"] == '{"restricted_apps": ["com.a"], "restricted_categories": []}'
+
+
+def test_interrupted_fill_runs_again_at_next_startup(tmp_path, monkeypatch):
+    from sqlalchemy import create_engine, text
+    import main
+
+    legacy = create_engine(f"sqlite:///{tmp_path}/legacy.db")
+    main.Base.metadata.create_all(legacy, tables=[main.UserProfile.__table__, main.BlockingSession.__table__])
+    with legacy.begin() as conn:
+        conn.execute(text("""INSERT INTO user_profiles (id, user_id, restricted_apps, restricted_categories, version, updated_at)
+                             VALUES ('p1', 'u1', '["com.a"]', '[]', 1, CURRENT_TIMESTAMP)"""))
+        conn.execute(text("""INSERT INTO blocking_sessions (id, user_id, profile_id, is_active, updated_at)
+                             VALUES ('s1', 'u1', 'p1', 1, CURRENT_TIMESTAMP)"""))
+
+    def interrupted(conn):
+        main.materialize_active_blocklists(conn)
+        raise RuntimeError("connection lost")
+
+    monkeypatch.setattr(main, "DERIVED_TABLES", [(main.EffectiveBlocklist.__table__, interrupted)])
+    with pytest.raises(RuntimeError):
+        main.create_schema(legacy, main.SHARDED_TABLES)
+    with legacy.connect() as conn:
+        assert conn.execute(text("SELECT count(*) FROM effective_blocklists")).scalar() == 0
+
+    monkeypatch.setattr(main, "DERIVED_TABLES", [(main.EffectiveBlocklist.__table__, main.materialize_active_blocklists)])
+    main.create_schema(legacy, main.SHARDED_TABLES)
+    main.create_schema(legacy, main.SHARDED_TABLES)  # filled once
+    with legacy.connect() as conn:
+        assert conn.execute(text("SELECT session_id FROM effective_blocklists")).scalars().all() == ["s1"]
+        assert conn.execute(text("SELECT name FROM schema_fills")).scalars().all() == ["effective_blocklists"]
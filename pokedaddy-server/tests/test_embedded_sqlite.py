@@ -0,0 +1,104 @@
+import os
+
+import pytest
+from sqlalchemy import Column, Integer, String, select, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import declarative_base, sessionmaker
+
+from embedded_sqlite import EmbeddedDatabase, ReadWriteSession, is_busy_error, parse_pragmas
+
+Base = declarative_base()
+
+
+class Note(Base):
+    __tablename__ = "notes"
+    id = Column(Integer, primary_key=True)
+    body = Column(String, nullable=False)
+
+
+@pytest.fixture
+def database(tmp_path):
+    database = EmbeddedDatabase(f"sqlite:///{tmp_path}/embedded.db", pragmas={"cache_size": "-2000"}, readers=2)
+    Base.metadata.create_all(database.writer)
+    yield database
+    database.dispose()
+
+
+def test_connections_are_tuned_and_readers_cannot_write(database):
+    with database.writer.connect() as conn:
+        pragma = lambda name: conn.exec_driver_sql(f"PRAGMA {name}").scalar()
+        assert (pragma("journal_mode"), pragma("synchronous"), pragma("cache_size")) == ("wal", 1, -2000)
+        assert (pragma("busy_timeout"), pragma("wal_autocheckpoint"), pragma("query_only")) == (5000, 0, 0)
+    assert database.writer.pool.size() == 1
+
+    with database.reader.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA query_only").scalar() == 1
+        with pytest.raises(OperationalError, match="readonly"):
+            conn.execute(text("INSERT INTO notes (body) VALUES ('x')"))
+
+    with pytest.raises(ValueError):
+        EmbeddedDatabase("sqlite:///:memory:")
+
+
+def test_parse_pragmas():
+    assert parse_pragmas("synchronous=FULL, cache_size=-20000") == {"synchronous": "FULL", "cache_size": "-20000"}
+    assert parse_pragmas("") == {}
+    for bad in ("synchronous", "x=1; DROP TABLE notes", "cache size=1"):
+        with pytest.raises(ValueError):
+            parse_pragmas(bad)
+
+
+def test_session_reads_from_readers_until_it_writes(database):
+    factory = sessionmaker(bind=database.writer, class_=ReadWriteSession, info={"reader": database.reader})
+    with factory() as db:
+        assert db.get_bind() is database.reader
+        assert db.scalars(select(Note)).all() == []
+        db.add(Note(body="first"))
+        db.flush()
+        # The rest of the transaction stays on the writer and sees its own insert
+        assert db.get_bind() is database.writer
+        assert db.scalars(select(Note.body)).all() == ["first"]
+        db.commit()
+
+        assert db.get_bind() is database.reader
+        assert db.scalars(select(Note.body)).all() == ["first"]
+        db.execute(text("UPDATE notes SET body = 'second'"))
+        assert db.get_bind() is database.writer
+        db.rollback()
+        assert db.scalars(select(Note.body)).all() == ["first"]
+
+    plain = sessionmaker(bind=database.writer, class_=ReadWriteSession)()
+    assert plain.get_bind() is database.writer
+    plain.close()
+
+
+def test_checkpoints_move_the_wal_into_the_database(database):
+    with database.writer.begin() as conn:
+        conn.execute(Note.__table__.insert(), [{"body": "x" * 500} for _ in range(500)])
+    wal_path = database.checkpointer.wal_path
+    assert os.path.getsize(wal_path) > 0
+
+    result = database.checkpointer.checkpoint()
+    assert result["mode"] == "PASSIVE" and not result["busy"]
+    assert result["checkpointed_frames"] == result["wal_frames"] > 0
+
+    database.checkpointer.truncate_bytes = 0
+    assert database.checkpointer.checkpoint()["mode"] == "TRUNCATE"
+    assert os.path.getsize(wal_path) == 0
+    assert (database.checkpointer.checkpoints, database.checkpointer.truncations) == (2, 1)
+
+
+def test_writer_in_another_process_is_waited_for_then_reported_busy(database, tmp_path):
+    other = EmbeddedDatabase(f"sqlite:///{tmp_path}/embedded.db", busy_timeout=0.1, checkpoint_interval=0)
+    try:
+        with database.writer.begin() as conn:
+            conn.execute(Note.__table__.insert(), {"body": "held"})
+            with pytest.raises(OperationalError) as raised:
+                with other.writer.begin() as other_conn:
+                    other_conn.execute(Note.__table__.insert(), {"body": "blocked"})
+            assert is_busy_error(raised.value)
+            # Readers are not blocked by the open write transaction
+            with other.reader.connect() as reader:
+                assert reader.execute(select(Note.body)).scalars().all() == []
+    finally:
+        other.dispose()
@@ -0,0 +1,56 @@
+import json
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, inspect, text
+
+
+def test_admin_export_streams_ndjson_with_updated_at_filter(monkeypatch):
+    import main
+
+    client = TestClient(main.app)
+    # Refused outright until an admin key is configured, then only with that key
+    assert client.get("/admin/export").status_code == 403
+    monkeypatch.setattr(main, "ADMIN_API_KEY", "export-key")
+    assert client.get("/admin/export", headers={"X-Admin-Key": "wrong"}).status_code == 403
+    client.headers["X-Admin-Key"] = "export-key"
+    started = datetime.utcnow() - timedelta(seconds=1)
+    r = client.post("/auth/register", json={"apple_user_id": "export_user", "email": "export@example.com"})
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+    user_id = client.get("/users/me", headers=headers).json()["id"]
+    profile = client.post("/profiles", headers=headers,
+                          json={"name": "Export", "restricted_apps": ["com.example.export"]}).json()
+    client.post("/blocking/toggle", headers=headers, json={"profile_id": profile["id"], "action": "start"})
+
+    r = client.get("/admin/export", params={"updated_since": started.isoformat()})
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    records = [json.loads(line) for line in r.text.splitlines()]
+    mine = [rec for rec in records if rec.get("user_id") == user_id or rec.get("id") == user_id]
+    assert {rec["type"] for rec in mine} == {"user", "profile", "session"}
+    exported_profile = next(rec for rec in mine if rec["id"] == profile["id"])
+    assert exported_profile["restricted_apps"] == ["com.example.export"]
+
+    r = client.get("/admin/export", params={"tables": "sessions", "updated_since": datetime.utcnow().isoformat() + "Z"})
+    assert r.status_code == 200 and r.text == ""
+
+    r = client.get("/admin/export", params={"tables": "users,secrets"})
+    assert r.status_code == 400
+
+
+def test_upgrade_schema_backfills_and_indexes_updated_at(tmp_path):
+    from main import iter_export_ndjson, upgrade_schema
+
+    legacy = create_engine(f"sqlite:///{tmp_path}/legacy.db")
+    created = datetime(2024, 1, 1)
+    with legacy.begin() as conn:
+        conn.execute(text("""CREATE TABLE users (id VARCHAR PRIMARY KEY, email VARCHAR, name VARCHAR,
+                             apple_user_id VARCHAR, created_at DATETIME, is_active BOOLEAN)"""))
+        conn.execute(text("INSERT INTO users VALUES ('u1', 'old@example.com', NULL, 'old', :created, 1)"),
+                     {"created": created})
+
+    upgrade_schema(legacy)
+
+    assert "ix_users_updated" in {i["name"] for i in inspect(legacy).get_indexes("users")}
+    [record] = [json.loads(line) for line in iter_export_ndjson(["users"], updated_since=created - timedelta(days=1), bind=legacy)]
+    assert (record["id"], record["updated_at"]) == ("u1", created.isoformat())
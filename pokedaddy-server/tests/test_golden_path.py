@@ -17,7 +17,7 @@ def setup_module(module):
 
 def test_golden_path_end_to_end():
     # Import after env vars are set so the engine binds to SQLite
-    from pokedaddy-server.main import app, SessionLocal, UserProfile
+    from main import app, SessionLocal, UserProfile
 
     client = TestClient(app)
 
@@ -0,0 +1,65 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi.testclient import TestClient
+
+from group_commit import GroupCommitter
+from ids import new_id
+
+
+def test_group_commit_batches_writes_and_isolates_failures():
+    from main import SessionLocal, BlockingSession, insert_active_session
+
+    committer = GroupCommitter(SessionLocal, max_items=50, max_delay=0.05)
+    user_id, profile_ids = new_id(), [new_id() for _ in range(40)]
+
+    def failing(session):
+        insert_active_session(session, user_id, new_id())
+        raise RuntimeError("boom")
+
+    futures = [committer.submit(lambda s, profile_id=profile_id: insert_active_session(s, user_id, profile_id))
+               for profile_id in profile_ids]
+    bad = committer.submit(failing)
+    results = [f.result(timeout=10) for f in futures]
+
+    assert all(created for _, created in results)
+    assert committer.batches < 40
+    try:
+        bad.result(timeout=10)
+        assert False, "failing write should raise"
+    except RuntimeError:
+        pass
+
+    db = SessionLocal()
+    try:
+        profiles = {s.profile_id for s in db.query(BlockingSession).filter(BlockingSession.user_id == user_id)}
+    finally:
+        db.close()
+    assert profiles == set(profile_ids)
+
+
+def test_session_endpoints_use_group_commit(monkeypatch):
+    import main
+
+    committers = {
+        name: GroupCommitter(factory, max_items=20, max_delay=0.02)
+        for name, factory in main.shards.sessionmakers.items()
+    }
+    monkeypatch.setattr(main, "group_committers", committers)
+    client = TestClient(main.app)
+
+    def start(i):
+        email = f"gc{i}@example.com"
+        client.post("/auth/register", json={"apple_user_id": f"gc_user_{i}", "email": email})
+        return client.post("/admin/start-blocking-by-email", params={"email": email}).json()
+
+    with ThreadPoolExecutor(max_workers=10) as pool:
+        started = list(pool.map(start, range(10)))
+    assert all(r["message"] == "Blocking started" for r in started)
+
+    with ThreadPoolExecutor(max_workers=10) as pool:
+        ended = list(pool.map(
+            lambda i: client.post("/admin/end-blocking-by-email", params={"email": f"gc{i}@example.com"}).json(),
+            range(10)
+        ))
+    assert [r["session_ids"] for r in ended] == [[r["session_id"]] for r in started]
+    assert sum(c.batches for c in committers.values()) < 20
@@ -0,0 +1,89 @@
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from idempotency import IdempotencyMiddleware, MemoryIdempotencyStore
+
+
+def test_memory_store_evicts_oldest_and_expired():
+    store = MemoryIdempotencyStore(max_entries=2, ttl=0.05)
+    store.set("a", {"v": 1})
+    store.set("b", {"v": 2})
+    assert store.get("a") == {"v": 1}  # a is now most recently used
+    store.set("c", {"v": 3})
+    assert store.get("b") is None
+    assert store.get("a") == {"v": 1}
+    time.sleep(0.06)
+    assert store.get("a") is None and store.get("c") is None
+
+
+def test_retried_create_profile_is_replayed_without_duplicates():
+    from main import app
+
+    client = TestClient(app)
+    r = client.post("/auth/register", json={"apple_user_id": "idempotent_user", "email": "idem@example.com"})
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+    body = {"name": "Evenings", "restricted_apps": ["com.instagram.app"]}
+
+    first = client.post("/profiles", headers={**headers, "Idempotency-Key": "create-1"}, json=body)
+    retry = client.post("/profiles", headers={**headers, "Idempotency-Key": "create-1"}, json=body)
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json()
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert "idempotent-replayed" not in first.headers
+
+    names = [p["name"] for p in client.get("/profiles", headers=headers).json()]
+    assert names.count("Evenings") == 1
+
+    r = client.post("/profiles", headers={**headers, "Idempotency-Key": "create-1"}, json={"name": "Other"})
+    assert r.status_code == 422
+
+    # Same key from another caller is a separate request
+    r = client.post("/auth/register", json={"apple_user_id": "idempotent_user_2", "email": "idem2@example.com"})
+    other = {"Authorization": f"Bearer {r.json()['access_token']}"}
+    r = client.post("/profiles", headers={**other, "Idempotency-Key": "create-1"}, json=body)
+    assert r.status_code == 200 and r.json()["id"] != first.json()["id"]
+
+
+def test_admin_start_replay_uses_query_params():
+    from main import app
+
+    client = TestClient(app)
+    client.post("/auth/register", json={"apple_user_id": "idempotent_admin", "email": "idem-admin@example.com"})
+
+    first = client.post("/admin/start-blocking-by-email", params={"email": "idem-admin@example.com"},
+                        headers={"Idempotency-Key": "start-1"})
+    retry = client.post("/admin/start-blocking-by-email", params={"email": "idem-admin@example.com"},
+                        headers={"Idempotency-Key": "start-1"})
+    assert first.json()["message"] == "Blocking started"
+    assert retry.json() == first.json()
+
+
+def test_admin_key_is_part_of_the_scope_and_streaming_routes_are_excluded():
+    app = FastAPI()
+    calls = []
+
+    @app.post("/act")
+    async def act():
+        calls.append("act")
+        return {"call": len(calls)}
+
+    @app.post("/upload")
+    async def upload(request: Request):
+        calls.append("upload")
+        return {"bytes": sum([len(chunk) async for chunk in request.stream()])}
+
+    app.add_middleware(IdempotencyMiddleware, store=MemoryIdempotencyStore(), exclude_paths={"/upload"})
+    client = TestClient(app)
+
+    admin = client.post("/act", headers={"X-Admin-Key": "secret", "Idempotency-Key": "k"})
+    anonymous = client.post("/act", headers={"Idempotency-Key": "k"})
+    assert admin.json() == {"call": 1} and anonymous.json() == {"call": 2}
+    assert "idempotent-replayed" not in anonymous.headers
+    assert client.post("/act", headers={"X-Admin-Key": "secret", "Idempotency-Key": "k"}).json() == {"call": 1}
+
+    for _ in range(2):
+        r = client.post("/upload", headers={"Idempotency-Key": "u"}, content=b"x" * 1000)
+        assert r.json() == {"bytes": 1000} and "idempotent-replayed" not in r.headers
+    assert calls.count("upload") == 2
@@ -0,0 +1,115 @@
+import json
+import os
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+from ids import new_id, uuid7
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+
+
+def test_uuid7_is_time_ordered():
+    before = int(time.time() * 1000)
+    ids = [uuid7() for _ in range(10000)]
+    after = int(time.time() * 1000)
+
+    assert ids == sorted(ids) and len(set(ids)) == len(ids)
+    assert [str(i) for i in ids] == sorted(str(i) for i in ids)  # text order matches too
+    assert all(i.version == 7 and i.variant == uuid.RFC_4122 for i in ids)
+    assert before <= ids[0].int >> 80 <= ids[-1].int >> 80 <= after + 1
+    assert uuid.UUID(new_id()).version == 7
+
+
+def test_new_rows_get_time_ordered_ids_and_malformed_ids_are_not_found():
+    import main
+
+    client = TestClient(main.app)
+    r = client.post("/auth/register", json={"apple_user_id": "uuid7_user", "email": "uuid7@example.com"})
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+    user_id = client.get("/users/me", headers=headers).json()["id"]
+    default_id = client.get("/profiles", headers=headers).json()[0]["id"]
+    profile_id = client.post("/profiles", headers=headers, json={"name": "Later", "restricted_apps": []}).json()["id"]
+    assert uuid.UUID(user_id).version == uuid.UUID(profile_id).version == 7
+    assert user_id < default_id < profile_id
+
+    for bad in ("not-a-uuid", "1234"):
+        assert client.put(f"/profiles/{bad}", headers=headers, json={"name": "x"}).status_code == 404
+        assert client.patch(f"/profiles/{bad}", headers=headers, json={"add_apps": ["a"]}).status_code == 404
+        assert client.delete(f"/profiles/{bad}", headers=headers).status_code == 404
+        assert client.post("/blocking/toggle", headers=headers,
+                           json={"profile_id": bad, "action": "start"}).status_code == 404
+        assert client.post("/admin/end-blocking", params={"user_id": bad, "profile_id": bad}).status_code == 404
+        assert client.post("/admin/unblock-app",
+                           params={"app_bundle_id": "a", "user_id": bad, "profile_id": bad}).status_code == 404
+        r = client.get(f"/profiles/{bad}/restricted-apps", headers=headers)
+        assert r.status_code == 200 and r.json()["restricted_apps"] == []
+
+
+LEGACY_SCHEMA = [
+    """CREATE TABLE users (id VARCHAR PRIMARY KEY, email VARCHAR UNIQUE, name VARCHAR,
+       apple_user_id VARCHAR UNIQUE, created_at TIMESTAMP, is_active BOOLEAN)""",
+    """CREATE TABLE user_profiles (id VARCHAR PRIMARY KEY, user_id VARCHAR, name VARCHAR, icon VARCHAR,
+       restricted_apps TEXT, restricted_categories TEXT, is_default BOOLEAN, created_at TIMESTAMP, updated_at TIMESTAMP)""",
+    """CREATE TABLE blocking_sessions (id VARCHAR PRIMARY KEY, user_id VARCHAR, profile_id VARCHAR,
+       is_active BOOLEAN, started_at TIMESTAMP, ended_at TIMESTAMP)""",
+]
+
+CHECK_LEGACY_APP = """
+import json, main
+from fastapi.testclient import TestClient
+from sqlalchemy import inspect
+client = TestClient(main.app)
+print(json.dumps({
+    "blockers": client.get("/admin/apps/blockers", params={"bundle_id": "com.legacy.app"}).json()["blockers"],
+    "restricted_apps": client.get("/admin/status-by-email", params={"email": "legacy@example.com"}).json()["restricted_apps"],
+    "blocklist_ids": str(next(c["type"] for c in inspect(main.engine).get_columns("effective_blocklists") if c["name"] == "user_id")),
+}))
+"""
+
+
+def test_app_starts_on_a_database_with_varchar_ids(tmp_path):
+    import main
+
+    # A database created by the schema before native uuid ids, with a user blocking right now
+    if main.engine.dialect.name == "postgresql":
+        with main.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("DROP DATABASE IF EXISTS pokedaddy_legacy_ids"))
+            conn.execute(text("CREATE DATABASE pokedaddy_legacy_ids"))
+        url = main.engine.url.set(database="pokedaddy_legacy_ids").render_as_string(hide_password=False)
+    else:
+        url = f"sqlite:///{tmp_path}/legacy.db"
+    legacy = create_engine(url)
+    user_id, profile_id, session_id = (str(uuid.uuid4()) for _ in range(3))
+    with legacy.begin() as conn:
+        for ddl in LEGACY_SCHEMA:
+            conn.execute(text(ddl))
+        conn.execute(text("INSERT INTO users VALUES (:u, 'legacy@example.com', 'Legacy', 'legacy_apple', :now, :yes)"),
+                     {"u": user_id, "now": datetime.utcnow(), "yes": True})
+        conn.execute(text("""INSERT INTO user_profiles VALUES (:p, :u, 'Default', 'bell.slash', '["com.legacy.app"]', '[]',
+                             :yes, :now, :now)"""), {"u": user_id, "p": profile_id, "now": datetime.utcnow(), "yes": True})
+        conn.execute(text("INSERT INTO blocking_sessions VALUES (:s, :u, :p, :yes, :now, NULL)"),
+                     {"u": user_id, "p": profile_id, "s": session_id, "now": datetime.utcnow(), "yes": True})
+    legacy.dispose()
+
+    env = {**os.environ, "POSTGRES_URL": url}
+    env.pop("SHARD_URLS", None)
+    try:
+        result = subprocess.run([sys.executable, "-c", CHECK_LEGACY_APP], cwd=SERVER_DIR, env=env,
+                                capture_output=True, text=True, timeout=60)
+    finally:
+        if main.engine.dialect.name == "postgresql":
+            with main.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                conn.execute(text("DROP DATABASE IF EXISTS pokedaddy_legacy_ids"))
+    assert result.returncode == 0, result.stderr
+    body = json.loads(result.stdout.splitlines()[-1])
+    # Active sessions were materialized and the new tables join with the old ones
+    assert body["blockers"] == [{"user_id": user_id, "profile_id": profile_id, "session_id": session_id}]
+    assert body["restricted_apps"] == ["com.legacy.app"]
+    assert body["blocklist_ids"] == "VARCHAR(36)"
@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+
+from ids import new_id
+
+
+def test_keyset_pages_cover_profiles_and_sessions_once():
+    from main import app, SessionLocal, BlockingSession
+
+    client = TestClient(app)
+    r = client.post("/auth/register", json={"apple_user_id": "pagination_user", "email": "pages@example.com"})
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+    for i in range(6):
+        client.post("/profiles", headers=headers, json={"name": f"Profile {i}", "restricted_apps": []})
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 3, **({"cursor": cursor} if cursor else {})}
+        page = client.get("/profiles/page", headers=headers, params=params).json()
+        seen += [(p["created_at"], p["id"]) for p in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == sorted(seen)
+    assert {i for _, i in seen} == {p["id"] for p in client.get("/profiles", headers=headers).json()}
+    assert len(seen) == 7
+
+    user_id = client.get("/users/me", headers=headers).json()["id"]
+    profile_id = seen[0][1]
+    base = datetime.utcnow() - timedelta(days=1)
+    session_ids = [new_id() for _ in range(5)]  # increasing
+    db = SessionLocal()
+    try:
+        # Two sessions share a start time so the id tiebreaker is exercised
+        for i, offset in enumerate([0, 1, 1, 2, 3]):
+            db.add(BlockingSession(id=session_ids[i], user_id=user_id, profile_id=profile_id,
+                                   is_active=False, started_at=base + timedelta(minutes=offset),
+                                   ended_at=base + timedelta(minutes=offset + 1)))
+        db.commit()
+    finally:
+        db.close()
+
+    first = client.get("/blocking/sessions", headers=headers, params={"limit": 2}).json()
+    assert [s["id"] for s in first["items"]] == [session_ids[4], session_ids[3]]
+    second = client.get("/admin/sessions-by-email",
+                        params={"email": "pages@example.com", "limit": 2, "cursor": first["next_cursor"]}).json()
+    assert [s["id"] for s in second["items"]] == [session_ids[2], session_ids[1]]
+    third = client.get("/blocking/sessions", headers=headers,
+                       params={"limit": 2, "cursor": second["next_cursor"]}).json()
+    assert [s["id"] for s in third["items"]] == [session_ids[0]]
+    assert third["next_cursor"] is None
+
+    assert client.get("/blocking/sessions", headers=headers, params={"cursor": "not-a-cursor"}).status_code == 400
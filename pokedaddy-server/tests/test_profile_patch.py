@@ -0,0 +1,34 @@
+from fastapi.testclient import TestClient
+
+
+def test_patch_applies_list_deltas_atomically():
+    from main import app
+
+    client = TestClient(app)
+    r = client.post("/auth/register", json={"apple_user_id": "patch_user", "email": "patch@example.com"})
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+    profile = client.get("/profiles", headers=headers).json()[0]
+    url = f"/profiles/{profile['id']}"
+    client.put(url, headers=headers, json={"restricted_apps": ["com.a", "com.b"], "restricted_categories": ["games"]})
+
+    r = client.patch(url, headers=headers, json={"add_apps": ["com.c", "com.a", "com.d"], "remove_apps": ["com.b", "com.d"]})
+    assert r.status_code == 200
+    version = r.json()["version"]
+    assert r.json() == {"id": profile["id"], "version": version}
+
+    r = client.patch(url, headers=headers, json={"add_categories": ["social"], "version": version})
+    assert r.json()["version"] == version + 1
+
+    current = client.get("/profiles", headers=headers).json()[0]
+    assert current["restricted_apps"] == ["com.a", "com.c"]
+    assert current["restricted_categories"] == ["games", "social"]
+    assert current["version"] == version + 1
+
+    assert client.patch(url, headers=headers, json={"add_apps": ["com.x"], "version": version}).status_code == 409
+    assert client.patch(url, headers=headers, json={}).status_code == 400
+    assert client.patch("/profiles/missing", headers=headers, json={"add_apps": ["com.x"]}).status_code == 404
+
+    # Deltas reach the effective blocklist of an active session
+    client.post("/blocking/toggle", headers=headers, json={"profile_id": profile["id"], "action": "start"})
+    client.patch(url, headers=headers, json={"remove_apps": ["com.a"]})
+    assert client.get(f"{url}/restricted-apps", headers=headers).json()["restricted_apps"] == ["com.c"]
@@ -0,0 +1,59 @@
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from profiling import ProfilingMiddleware
+
+
+def busy_handler():
+    deadline = time.perf_counter() + 0.05
+    while time.perf_counter() < deadline:
+        pass
+    return {"ok": True}
+
+
+def make_client(tmp_path, **kwargs):
+    app = FastAPI()
+
+    @app.get("/slow")
+    async def slow():
+        return busy_handler()
+
+    app.add_middleware(ProfilingMiddleware, profile_dir=str(tmp_path), max_profiles=2, interval=0.002, **kwargs)
+    return TestClient(app)
+
+
+def test_admin_header_profiles_request_and_retention_is_bounded(tmp_path):
+    client = make_client(tmp_path, admin_key="secret")
+
+    for _ in range(3):
+        r = client.get("/slow", headers={"X-Profile": "secret"})
+        assert r.status_code == 200
+        assert r.headers["x-profile-id"].endswith(".folded")
+
+    profiles = sorted(tmp_path.glob("*.folded"))
+    assert len(profiles) == 2
+    folded = [line.rsplit(" ", 1) for line in profiles[-1].read_text().splitlines()]
+    request_stacks = [(stack, int(count)) for stack, count in folded if stack.startswith("request;")]
+    assert request_stacks
+    assert any("busy_handler" in stack and count > 0 for stack, count in request_stacks)
+
+
+def test_unsampled_requests_are_not_profiled(tmp_path):
+    client = make_client(tmp_path, admin_key="secret", sample_rate=0.0)
+
+    r = client.get("/slow")
+    assert r.status_code == 200
+    assert "x-profile-id" not in r.headers
+    r = client.get("/slow", headers={"X-Profile": "wrong"})
+    assert "x-profile-id" not in r.headers
+    assert list(tmp_path.glob("*.folded")) == []
+
+
+def test_sample_rate_profiles_without_header(tmp_path):
+    client = make_client(tmp_path, sample_rate=1.0)
+
+    r = client.get("/slow")
+    assert r.status_code == 200
+    assert len(list(tmp_path.glob("*.folded"))) == 1
@@ -0,0 +1,107 @@
+import json
+
+from fastapi.testclient import TestClient
+
+
+def test_provision_ndjson_creates_users_with_default_profiles(monkeypatch):
+    import main
+    from main import app, SessionLocal, User, UserProfile
+
+    client = TestClient(app)
+    assert client.post("/admin/provision", content="").status_code == 403
+    monkeypatch.setattr(main, "ADMIN_API_KEY", "provision-key")
+    client.post("/auth/register", json={"apple_user_id": "prov_existing", "email": "prov-existing@example.com"})
+
+    lines = [
+        {"apple_user_id": "prov_1", "email": "prov1@example.com", "name": "One"},
+        {"apple_user_id": "prov_2", "email": "prov2@example.com",
+         "profiles": [{"name": "School", "restricted_apps": ["com.tiktok.app"], "is_default": True}]},
+        {"apple_user_id": "prov_3", "profiles": [{"name": "Night", "restricted_apps": ["com.netflix.app"]}]},
+        {"apple_user_id": "prov_existing"},
+        {"apple_user_id": "prov_1_dup", "email": "prov1@example.com"},
+    ]
+    body = "\n".join(json.dumps(line) for line in lines) + "\nnot json\n{\"email\": \"missing-id\"}\n"
+    r = client.post("/admin/provision", params={"batch_size": 2}, content=body,
+                    headers={"X-Admin-Key": "provision-key"})
+    assert r.status_code == 200, r.text
+    result = r.json()
+    assert result["users_created"] == 3
+    assert result["users_skipped"] == 2
+    assert result["profiles_created"] == 4
+    assert result["errors"] == 2
+    assert [e["line"] for e in result["error_details"]] == [6, 7]
+
+    db = SessionLocal()
+    try:
+        users = {u.apple_user_id: u for u in db.query(User).filter(User.apple_user_id.like("prov_%")).all()}
+        profiles = db.query(UserProfile).filter(UserProfile.user_id.in_([u.id for u in users.values()])).all()
+        by_user = {}
+        for profile in profiles:
+            by_user.setdefault(profile.user_id, []).append(profile)
+    finally:
+        db.close()
+
+    assert [(p.name, p.is_default) for p in by_user[users["prov_1"].id]] == [("Default", True)]
+    assert [(p.name, p.is_default, json.loads(p.restricted_apps)) for p in by_user[users["prov_2"].id]] == [
+        ("School", True, ["com.tiktok.app"])
+    ]
+    assert sorted((p.name, p.is_default) for p in by_user[users["prov_3"].id]) == [("Default", True), ("Night", False)]
+
+    # Provisioned users can sign in through the normal flow
+    r = client.post("/auth/register", json={"apple_user_id": "prov_2"})
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+    assert [p["name"] for p in client.get("/profiles", headers=headers).json()] == ["School"]
+
+
+def test_provision_csv_groups_rows_per_user():
+    from main import provision_lines, SessionLocal, User, UserProfile
+
+    csv_lines = [
+        "apple_user_id,email,name,profile_name,profile_icon,restricted_apps,restricted_categories,is_default\n",
+        "csv_1,csv1@example.com,Csv One,Focus,moon,com.a;com.b,social,true\n",
+        "csv_1,csv1@example.com,Csv One,Weekend,,com.c,,\n",
+        "csv_2,,,,,,,\n",
+    ]
+    result = provision_lines(csv_lines, "csv", batch_size=1)
+    assert result["users_created"] == 2
+    assert result["profiles_created"] == 3
+
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.apple_user_id == "csv_1").one()
+        profiles = {p.name: p for p in db.query(UserProfile).filter(UserProfile.user_id == user.id)}
+    finally:
+        db.close()
+    assert set(profiles) == {"Focus", "Weekend"}
+    assert json.loads(profiles["Focus"].restricted_apps) == ["com.a", "com.b"]
+    assert json.loads(profiles["Focus"].restricted_categories) == ["social"]
+    assert profiles["Focus"].is_default and profiles["Focus"].icon == "moon"
+    assert profiles["Weekend"].icon == "bell.slash"
+
+
+def test_provision_reports_undecodable_lines_and_keeps_empty_strings(monkeypatch):
+    import main
+    from main import app, SessionLocal, User
+
+    monkeypatch.setattr(main, "ADMIN_API_KEY", "provision-key")
+    lines = [
+        json.dumps({"apple_user_id": "prov_empty", "name": ""}).encode(),
+        b'{"apple_user_id": "prov_bad", "name": "\xff"}',
+        json.dumps({"apple_user_id": "prov_marker", "name": "\\N"}).encode(),
+    ]
+    r = TestClient(app).post("/admin/provision", content=b"\n".join(lines), headers={"X-Admin-Key": "provision-key"})
+    assert r.status_code == 200, r.text
+    result = r.json()
+    assert result["users_created"] == 2
+    assert [e["line"] for e in result["error_details"]] == [2]
+    assert "can't decode byte 0xff" in result["error_details"][0]["error"]
+
+    db = SessionLocal()
+    try:
+        query = db.query(User).filter(User.apple_user_id.in_(["prov_empty", "prov_marker"]))
+        users = {u.apple_user_id: u for u in query}
+    finally:
+        db.close()
+    # COPY on Postgres must not turn these into NULL
+    assert (users["prov_empty"].name, users["prov_empty"].email) == ("", None)
+    assert users["prov_marker"].name == "\\N"
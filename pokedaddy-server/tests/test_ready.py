@@ -0,0 +1,66 @@
+import threading
+import time
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+
+
+def test_ready_warms_up_pools_and_statement_cache(monkeypatch):
+    import main
+
+    monkeypatch.setattr(main, "warmup_state", {"done": False, "seconds": None, "connections": 0, "error": None})
+    client = TestClient(main.app)
+    r = client.get("/ready")
+    assert r.status_code == 200
+    body = r.json()
+    assert body["ready"] and body["warmup"]["done"] and body["warmup"]["connections"] >= 1
+    primary = body["databases"]["primary"]
+    assert primary["reachable"] and primary["latency_ms"] >= 0
+    assert primary["pool"]["open"] >= min(main.WARMUP_CONNECTIONS, main.engine.pool.size())
+
+    # The hot reads for a real user reuse the statements compiled during warmup
+    token = client.post("/auth/register", json={"apple_user_id": "ready_user"}).json()["access_token"]
+    user_id = client.get("/users/me", headers={"Authorization": f"Bearer {token}"}).json()["id"]
+    compiled = {bind: len(bind._compiled_cache) for bind in main.database_engines().values()}
+    with main.shards.session_for(user_id) as db:
+        main.load_user(db, user_id)
+        main.blocking_status(db, user_id)
+        main.effective_blocklist(db, user_id, user_id)
+    with main.SessionLocal() as db:
+        main.user_id_for_email(db, "ready@example.com")
+    assert {bind: len(bind._compiled_cache) for bind in main.database_engines().values()} == compiled
+
+
+def test_ready_is_503_when_a_database_is_unreachable(tmp_path, monkeypatch):
+    import main
+
+    broken = create_engine(f"sqlite:///{tmp_path}/missing/dir/broken.db")
+    engines = main.database_engines()
+    monkeypatch.setattr(main, "database_engines", lambda: {**engines, "shard:broken": broken})
+    r = TestClient(main.app).get("/ready")
+    assert r.status_code == 503
+    body = r.json()
+    assert not body["ready"] and body["databases"]["primary"]["reachable"]
+    assert body["databases"]["shard:broken"] == {"reachable": False, "error": "OperationalError",
+                                                 "pool": {"size": 5, "open": 0, "idle": 0, "checked_out": 0, "overflow": 0}}
+
+
+def test_startup_does_not_wait_for_a_stalled_warmup(monkeypatch):
+    import main
+
+    release = threading.Event()
+    monkeypatch.setattr(main, "warmup_state", {"done": False, "seconds": None, "connections": 0, "error": None})
+    monkeypatch.setattr(main, "open_pool_connections", lambda bind, count: release.wait(10) and 1)
+    monkeypatch.setattr(main, "WARMUP_TIMEOUT_SECONDS", 0.1)
+
+    started = time.monotonic()
+    with TestClient(main.app) as client:
+        assert time.monotonic() - started < 2
+        r = client.get("/ready")
+        assert r.status_code == 503 and not r.json()["warmup"]["done"]
+        # The warmup started at startup finishes in the background
+        release.set()
+        deadline = time.monotonic() + 5
+        while not main.warmup_state["done"] and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert client.get("/ready").status_code == 200
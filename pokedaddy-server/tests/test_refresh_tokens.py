@@ -0,0 +1,37 @@
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+
+def test_refresh_rotates_tokens_without_touching_users():
+    import main
+
+    client = TestClient(main.app)
+    tokens = client.post("/auth/register", json={"apple_user_id": "refresh_user", "email": "refresh@example.com"}).json()
+    assert tokens["refresh_token"]
+
+    # A refresh token is not an access token
+    r = client.get("/users/me", headers={"Authorization": f"Bearer {tokens['refresh_token']}"})
+    assert r.status_code == 401
+
+    statements = []
+    record = lambda *args: statements.append(args[2])
+    event.listen(main.engine, "before_cursor_execute", record)
+    try:
+        rotated = client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]}).json()
+    finally:
+        event.remove(main.engine, "before_cursor_execute", record)
+    assert not any("users" in statement for statement in statements)
+    assert rotated["refresh_token"] != tokens["refresh_token"]
+    r = client.get("/users/me", headers={"Authorization": f"Bearer {rotated['access_token']}"})
+    assert r.json()["email"] == "refresh@example.com"
+
+    # Replaying a used refresh token revokes the whole family, including the rotated token
+    r = client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert r.status_code == 401 and r.json()["detail"] == "Refresh token reuse detected"
+    assert client.post("/auth/refresh", json={"refresh_token": rotated["refresh_token"]}).status_code == 401
+
+    # Logging in again starts a new family; logout ends it
+    fresh = client.post("/auth/register", json={"apple_user_id": "refresh_user"}).json()
+    assert client.post("/auth/logout", json={"refresh_token": fresh["refresh_token"]}).status_code == 200
+    assert client.post("/auth/refresh", json={"refresh_token": fresh["refresh_token"]}).status_code == 401
+    assert client.post("/auth/refresh", json={"refresh_token": "garbage"}).status_code == 401
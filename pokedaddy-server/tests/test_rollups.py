@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+
+from ids import new_id
+
+
+def test_ending_sessions_updates_rollups_and_backfill_matches():
+    from main import app, SessionLocal, BlockingSession, BlockingRollup, rebuild_rollups
+
+    client = TestClient(app)
+    r = client.post("/auth/register", json={"apple_user_id": "rollup_user", "email": "rollup@example.com"})
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+    user_id = client.get("/users/me", headers=headers).json()["id"]
+    profile_id = client.get("/profiles", headers=headers).json()[0]["id"]
+
+    # A session that started 2h before midnight two days ago and is still running
+    midnight = datetime.combine(datetime.utcnow().date() - timedelta(days=1), datetime.min.time())
+    session_id = new_id()
+    db = SessionLocal()
+    try:
+        db.add(BlockingSession(id=session_id, user_id=user_id, profile_id=profile_id,
+                               is_active=True, started_at=midnight - timedelta(hours=2)))
+        db.commit()
+    finally:
+        db.close()
+
+    r = client.post("/admin/end-blocking", params={"user_id": user_id, "profile_id": profile_id})
+    assert r.json()["session_id"] == session_id
+    # Ending again finds nothing, so the session is not counted twice
+    assert client.post("/admin/end-blocking-by-email", params={"email": "rollup@example.com"}).status_code == 404
+
+    stats = client.get("/stats/blocking", headers=headers, params={"since": str(midnight.date() - timedelta(days=1))}).json()
+    assert [b["start"] for b in stats["buckets"]][:2] == [str(midnight.date() - timedelta(days=1)), str(midnight.date())]
+    first, second = stats["buckets"][0], stats["buckets"][1]
+    assert first["seconds"] == 2 * 3600 and first["sessions"] == 1
+    assert second["seconds"] >= 86400 and second["sessions"] == 0
+    assert first["profiles"] == {profile_id: 2 * 3600}
+
+    weekly = client.get("/admin/blocking-stats-by-email", params={
+        "email": "rollup@example.com", "period": "week", "since": str(midnight.date() - timedelta(days=1))
+    }).json()
+    assert weekly["total_seconds"] == stats["total_seconds"]
+    assert all(datetime.fromisoformat(b["start"]).weekday() == 0 for b in weekly["buckets"])
+    assert client.get("/stats/blocking", headers=headers, params={"period": "month"}).status_code == 400
+
+    def snapshot():
+        db = SessionLocal()
+        try:
+            return sorted((r.day, r.seconds, r.sessions) for r in db.query(BlockingRollup).filter(
+                BlockingRollup.user_id == user_id))
+        finally:
+            db.close()
+
+    before = snapshot()
+    rebuild_rollups(batch_size=2)
+    assert snapshot() == before
@@ -0,0 +1,87 @@
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from pathlib import Path
+
+from worker_health import Heartbeat, read_heartbeats
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+
+
+def wait_for(condition, timeout: float = 15.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        result = condition()
+        if result:
+            return result
+        time.sleep(0.1)
+    raise AssertionError("timed out")
+
+
+def test_heartbeats_are_read_back_by_slot(tmp_path):
+    Heartbeat(str(tmp_path), slot=1).write("ready", requests=3)
+    (tmp_path / "worker-1.json.tmp").write_text("{")
+    [heartbeat] = read_heartbeats(str(tmp_path))
+    assert (heartbeat["pid"], heartbeat["slot"], heartbeat["state"], heartbeat["requests"]) == (os.getpid(), 1, "ready", 3)
+    assert 0 <= heartbeat["age_seconds"] < 5
+
+
+def test_workers_restart_one_at_a_time_without_dropping_requests(tmp_path):
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    state_dir = tmp_path / "state"
+    env = {**os.environ, "POSTGRES_URL": f"sqlite:///{tmp_path}/serve.db"}
+    env.pop("WORKER_STATE_DIR", None)
+    master = subprocess.Popen(
+        [sys.executable, "serve.py", "--workers", "2", "--host", "127.0.0.1", "--port", str(port),
+         "--state-dir", str(state_dir), "--heartbeat", "0.2", "--timeout", "3", "--graceful-timeout", "5",
+         "--no-access-log", "--log-level", "warning"],
+        cwd=SERVER_DIR, env=env,
+    )
+    url = f"http://127.0.0.1:{port}"
+
+    def workers():
+        try:
+            with urllib.request.urlopen(f"{url}/admin/workers", timeout=2) as response:
+                body = json.load(response)
+        except OSError:
+            return None
+        ready = [w["pid"] for w in body["workers"] if w["state"] == "ready"]
+        return sorted(ready) if len(ready) == 2 and sorted(ready) == body["master"]["worker_pids"] else None
+
+    try:
+        first = wait_for(workers)
+
+        statuses, stop = [], threading.Event()
+
+        def poll():
+            while not stop.is_set():
+                try:
+                    with urllib.request.urlopen(f"{url}/", timeout=5) as response:
+                        statuses.append(response.status)
+                except OSError as e:
+                    statuses.append(repr(e))
+
+        poller = threading.Thread(target=poll)
+        poller.start()
+        master.send_signal(signal.SIGHUP)
+        second = wait_for(lambda: (pids := workers()) and not set(pids) & set(first) and pids)
+        stop.set()
+        poller.join()
+        assert statuses and set(statuses) == {200}, [s for s in statuses if s != 200]
+
+        # A worker whose event loop stops is replaced once its heartbeat is --timeout old
+        os.kill(second[0], signal.SIGSTOP)
+        third = wait_for(lambda: (pids := workers()) and second[0] not in pids and pids)
+        assert second[1] in third
+    finally:
+        master.send_signal(signal.SIGTERM)
+        assert master.wait(timeout=20) == 0
+    assert list(state_dir.iterdir()) == []
@@ -0,0 +1,110 @@
+import json
+from collections import Counter
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, select
+
+from ids import new_id
+from sharding import HashRing, parse_shard_urls
+
+
+def test_ring_is_balanced_and_moves_few_keys_when_a_shard_is_added():
+    keys = [new_id() for _ in range(20000)]
+    three = HashRing(["s0", "s1", "s2"])
+    four = HashRing(["s0", "s1", "s2", "s3"])
+
+    counts = Counter(three.node_for(k) for k in keys)
+    assert set(counts) == {"s0", "s1", "s2"}
+    assert min(counts.values()) > len(keys) / 3 * 0.75
+
+    moved = [k for k in keys if three.node_for(k) != four.node_for(k)]
+    assert all(four.node_for(k) == "s3" for k in moved)
+    assert len(moved) < len(keys) / 4 * 1.3
+    assert HashRing(["s2", "s0", "s1"]).node_for(keys[0]) == three.node_for(keys[0])
+
+
+def test_parse_shard_urls():
+    assert parse_shard_urls("a=sqlite:///a.db, b=postgresql://h/db?sslmode=require") == {
+        "a": "sqlite:///a.db", "b": "postgresql://h/db?sslmode=require"
+    }
+    assert parse_shard_urls("") == {}
+    with pytest.raises(ValueError):
+        parse_shard_urls("sqlite:///a.db")
+
+
+@pytest.fixture
+def sharded(tmp_path, monkeypatch):
+    import main
+
+    monkeypatch.setattr(main, "shards", main.shards)
+    monkeypatch.setattr(main, "group_committers", main.group_committers)
+    engines = {f"t{i}": create_engine(f"sqlite:///{tmp_path}/shard{i}.db") for i in range(3)}
+    yield main.configure_shards(engines)
+    for engine in engines.values():
+        engine.dispose()
+
+
+def test_users_live_on_their_shard_and_admin_queries_span_shards(sharded, monkeypatch):
+    import main
+
+    monkeypatch.setattr(main, "ADMIN_API_KEY", "shard-key")
+    client = TestClient(main.app, headers={"X-Admin-Key": "shard-key"})
+    emails = [f"shard{i}@example.com" for i in range(12)]
+    user_ids = {}
+    for i, email in enumerate(emails):
+        r = client.post("/auth/register", json={"apple_user_id": f"shard_user_{i}", "email": email})
+        headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+        user_ids[email] = client.get("/users/me", headers=headers).json()["id"]
+        client.post("/profiles", headers=headers, json={"name": "Focus", "restricted_apps": ["com.shard.app"]})
+    # Registering again finds the user through the directory
+    r = client.post("/auth/register", json={"apple_user_id": "shard_user_0"})
+    assert client.get("/users/me", headers={"Authorization": f"Bearer {r.json()['access_token']}"}).json()["id"] \
+        == user_ids[emails[0]]
+
+    placed = {}
+    for name, engine in sharded.engines.items():
+        with engine.connect() as conn:
+            for user_id in conn.execute(select(main.User.id)).scalars():
+                placed[user_id] = name
+    assert placed == {user_id: sharded.name_for(user_id) for user_id in user_ids.values()}
+    assert len(set(placed.values())) > 1
+
+    # *-by-email endpoints resolve the shard through the directory
+    for email in emails[:4]:
+        started = client.post("/admin/start-blocking-by-email", params={"email": email, "profile_name": "Focus"})
+        assert started.json()["message"] == "Blocking started"
+        status = client.get("/admin/status-by-email", params={"email": email}).json()
+        assert status["user_id"] == user_ids[email] and status["restricted_apps"] == ["com.shard.app"]
+    ended = client.post("/admin/end-blocking-by-email", params={"email": emails[0]})
+    assert ended.json()["sessions_ended"] == 1
+    assert client.get("/admin/status-by-email", params={"email": "nobody@example.com"}).status_code == 404
+
+    # Scatter-gather: counts are summed and rows collected from every shard
+    top = client.get("/admin/apps/top").json()
+    assert {"bundle_id": "com.shard.app", "profiles": 12} == {k: top[0][k] for k in ("bundle_id", "profiles")}
+    blockers = client.get("/admin/apps/blockers", params={"bundle_id": "com.shard.app"}).json()["blockers"]
+    assert {b["user_id"] for b in blockers} == {user_ids[e] for e in emails[1:4]}
+
+    exported = [json.loads(line) for line in client.get("/admin/export", params={"tables": "users"}).text.splitlines()]
+    assert {rec["id"] for rec in exported} == set(user_ids.values())
+    changed = [rec["updated_at"] for rec in exported]
+    assert changed == sorted(changed)
+    assert main.rebuild_rollups()["sessions_rolled_up"] == 1
+
+
+def test_provisioning_spreads_users_over_shards(sharded):
+    import main
+
+    lines = [json.dumps({"apple_user_id": f"shard_prov_{i}", "email": f"shard-prov{i}@example.com"}) for i in range(9)]
+    result = main.provision_lines(lines + [json.dumps({"apple_user_id": "shard_prov_0"})], batch_size=4)
+    assert result["users_created"] == 9 and result["users_skipped"] == 1
+
+    for name, engine in sharded.engines.items():
+        with engine.connect() as conn:
+            for user_id in conn.execute(select(main.User.id).where(main.User.apple_user_id.like("shard_prov_%"))).scalars():
+                assert sharded.name_for(user_id) == name
+
+    client = TestClient(main.app)
+    r = client.get("/admin/sessions-by-email", params={"email": "shard-prov3@example.com"})
+    assert r.status_code == 200 and r.json()["items"] == []
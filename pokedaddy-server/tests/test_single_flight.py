@@ -0,0 +1,99 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi.testclient import TestClient
+
+from single_flight import SingleFlight
+
+
+def test_concurrent_callers_share_one_call_and_its_errors():
+    flight = SingleFlight(timeout=1)
+    calls = []
+
+    def slow(value, delay=0.1):
+        def run():
+            calls.append(value)
+            time.sleep(delay)
+            if isinstance(value, Exception):
+                raise value
+            return {"value": value}
+        return run
+
+    async def scenario():
+        results = await asyncio.gather(*[flight.do("a", slow("a")) for _ in range(10)], flight.do("b", slow("b")))
+        assert results[:10] == [{"value": "a"}] * 10 and all(r is results[0] for r in results[:10])
+        assert results[10] == {"value": "b"}
+
+        errors = await asyncio.gather(*[flight.do("bad", slow(ValueError("boom"))) for _ in range(5)],
+                                      return_exceptions=True)
+        assert all(isinstance(e, ValueError) and str(e) == "boom" for e in errors)
+
+        # Waiters give up after the timeout; the call keeps running and later callers join it
+        flight.timeout = 0.05
+        timed_out = await asyncio.gather(*[flight.do("slow", slow("slow", delay=0.3)) for _ in range(3)],
+                                         return_exceptions=True)
+        assert all(isinstance(e, asyncio.TimeoutError) for e in timed_out)
+        flight.timeout = 1
+        assert await flight.do("slow", slow("unused")) == {"value": "slow"}
+        assert await flight.do("slow", slow("fresh", delay=0)) == {"value": "fresh"}
+
+    asyncio.run(scenario())
+    assert calls == ["a", "b", calls[2], "slow", "fresh"]
+    assert flight.shared == 9 + 4 + 2 + 1
+
+
+def test_status_by_email_coalesces_across_requests(monkeypatch):
+    import main
+
+    client = TestClient(main.app)
+    client.post("/auth/register", json={"apple_user_id": "flight_user", "email": "flight@example.com"})
+
+    lookups = []
+    barrier = threading.Event()
+    status_by_email = main.status_by_email
+
+    def slow_status(db, email):
+        lookups.append(email)
+        barrier.wait(2)
+        return status_by_email(db, email)
+
+    monkeypatch.setattr(main, "status_by_email", slow_status)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        responses = [pool.submit(client.get, "/admin/status-by-email", params={"email": email})
+                     for email in ["flight@example.com"] * 6 + ["nobody@example.com"] * 2]
+        time.sleep(0.3)
+        barrier.set()
+        responses = [r.result() for r in responses]
+
+    assert sorted(lookups) == ["flight@example.com", "nobody@example.com"]
+    assert all(r.status_code == 200 and r.json()["is_blocking"] is False for r in responses[:6])
+    assert all(r.status_code == 404 and r.json()["detail"] == "User not found" for r in responses[6:])
+
+
+def test_blocking_status_coalesces_the_user_lookup(monkeypatch):
+    import main
+
+    client = TestClient(main.app)
+    r = client.post("/auth/register", json={"apple_user_id": "flight_status_user"})
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+    lookups = []
+    barrier = threading.Event()
+    load_user = main.load_user
+
+    def slow_load_user(db, user_id):
+        lookups.append(user_id)
+        barrier.wait(2)
+        return load_user(db, user_id)
+
+    monkeypatch.setattr(main, "load_user", slow_load_user)
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        responses = [pool.submit(client.get, "/blocking/status", headers=headers) for _ in range(6)]
+        time.sleep(0.3)
+        barrier.set()
+        responses = [r.result() for r in responses]
+
+    assert len(lookups) == 1
+    assert all(r.status_code == 200 and r.json()["is_blocking"] is False for r in responses)
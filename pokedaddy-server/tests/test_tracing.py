@@ -0,0 +1,96 @@
+import importlib.util
+import io
+import json
+import pathlib
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+from tracing import InMemoryExporter, Tracer, TracingMiddleware, instrument_engine, parse_traceparent
+
+MCP_PATH = pathlib.Path(__file__).resolve().parents[2] / "pokedaddy-mcp-vercel" / "api" / "mcp.py"
+
+
+def test_parse_traceparent():
+    trace_id, span_id = "4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7"
+    assert parse_traceparent(f"00-{trace_id}-{span_id}-01") == (trace_id, span_id)
+    assert parse_traceparent("00-" + "0" * 32 + f"-{span_id}-01") is None
+    assert parse_traceparent("garbage") is None
+    assert parse_traceparent(None) is None
+
+
+def test_server_span_continues_incoming_trace_and_records_sql(tmp_path):
+    exporter = InMemoryExporter()
+    tracer = Tracer(exporter)
+    engine = create_engine(f"sqlite:///{tmp_path}/trace.db")
+    instrument_engine(engine, tracer)
+
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    def read_item(item_id: int):
+        with engine.connect() as conn:
+            return {"value": conn.execute(text("SELECT :v"), {"v": item_id}).scalar()}
+
+    app.add_middleware(TracingMiddleware, tracer=tracer)
+    client = TestClient(app)
+
+    trace_id, parent_id = "4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7"
+    r = client.get("/items/7", headers={"traceparent": f"00-{trace_id}-{parent_id}-01"})
+    assert r.status_code == 200
+    assert r.headers["traceparent"].startswith(f"00-{trace_id}-")
+
+    spans = exporter.find(trace_id)
+    server = next(s for s in spans if s["kind"] == "server")
+    assert server["parent_id"] == parent_id
+    assert server["name"] == "GET /items/{item_id}"
+    assert server["attributes"]["http.status_code"] == 200
+    sql = [s for s in spans if s["kind"] == "client"]
+    assert sql and all(s["parent_id"] == server["span_id"] for s in sql)
+    assert sql[0]["attributes"]["db.statement"].startswith("SELECT")
+
+
+def test_mcp_bridge_propagates_traceparent(monkeypatch):
+    spec = importlib.util.spec_from_file_location("pokedaddy_mcp_trace", MCP_PATH)
+    mcp = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mcp)
+    monkeypatch.setattr(mcp, "MCP_TRACE_EXPORTER", "memory")
+
+    sent = {}
+
+    class FakeResponse:
+        status_code = 200
+        url = "http://api/admin/status-by-email"
+
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return {"valid": True}
+
+    def fake_request(method, url, headers=None, **kwargs):
+        sent["headers"] = headers
+        return FakeResponse()
+
+    monkeypatch.setattr(mcp.requests, "request", fake_request)
+
+    body = json.dumps({
+        "jsonrpc": "2.0", "id": 1, "method": "tools/call",
+        "params": {"name": "get_user_blocking_status", "arguments": {"email": "a@example.com"}},
+    }).encode()
+    h = mcp.handler.__new__(mcp.handler)
+    h.rfile, h.wfile = io.BytesIO(body), io.BytesIO()
+    h.headers = {"Content-Length": str(len(body))}
+    h.request_version, h.requestline, h.command, h.path = "HTTP/1.1", "POST /mcp HTTP/1.1", "POST", "/mcp"
+    h.client_address = ("127.0.0.1", 0)
+    h.log_message = lambda *args: None
+    h.do_POST()
+
+    trace_id, span_id = parse_traceparent(sent["headers"]["traceparent"])
+    client_span, server_span = list(mcp.RECENT_SPANS)
+    assert client_span["span_id"] == span_id
+    assert client_span["parent_id"] == server_span["span_id"]
+    assert server_span["trace_id"] == trace_id
+    assert server_span["name"] == "mcp tools/call"
+    assert server_span["attributes"]["mcp.tool"] == "get_user_blocking_status"
@@ -0,0 +1,224 @@
+"""
+Lightweight request tracing for the PokeDaddy server.
+
+Spans follow the W3C trace-context model: an incoming `traceparent` header
+(e.g. from the MCP bridge) is continued, otherwise a new trace is started.
+Each HTTP request gets a server span and every SQL statement a child span.
+Finished spans go to a local exporter (in-memory ring buffer or JSON-lines
+file) so traces can be inspected without an external collector.
+"""
+
+import contextvars
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Optional
+
+from sqlalchemy import event
+
+logger = logging.getLogger("pokedaddy.trace")
+
+TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+_current_span = contextvars.ContextVar("pokedaddy_current_span", default=None)
+
+
+def new_trace_id() -> str:
+    return os.urandom(16).hex()
+
+
+def new_span_id() -> str:
+    return os.urandom(8).hex()
+
+
+def parse_traceparent(header: Optional[str]):
+    """Return (trace_id, parent_span_id) from a W3C traceparent header, or None."""
+    if not header:
+        return None
+    match = TRACEPARENT_RE.match(header.strip().lower())
+    if not match or match.group(1) == "0" * 32 or match.group(2) == "0" * 16:
+        return None
+    return match.group(1), match.group(2)
+
+
+def format_traceparent(trace_id: str, span_id: str) -> str:
+    return f"00-{trace_id}-{span_id}-01"
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "attributes",
+                 "start_time", "end_time", "status", "_start_perf")
+
+    def __init__(self, name: str, kind: str, trace_id: str, parent_id: Optional[str], attributes: dict = None):
+        self.trace_id = trace_id
+        self.span_id = new_span_id()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.start_time = time.time()
+        self.end_time = None
+        self.status = "ok"
+        self._start_perf = time.perf_counter()
+
+    @property
+    def traceparent(self) -> str:
+        return format_traceparent(self.trace_id, self.span_id)
+
+    def finish(self):
+        self.end_time = self.start_time + (time.perf_counter() - self._start_perf)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start": self.start_time,
+            "end": self.end_time,
+            "duration_ms": round((self.end_time - self.start_time) * 1000, 3) if self.end_time else None,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class InMemoryExporter:
+    """Keeps the most recent finished spans in a bounded ring buffer."""
+
+    def __init__(self, max_spans: int = 10000):
+        self.spans = deque(maxlen=max_spans)
+
+    def export(self, span: Span):
+        self.spans.append(span.to_dict())
+
+    def find(self, trace_id: Optional[str] = None, limit: int = 200) -> list:
+        spans = [s for s in list(self.spans) if trace_id is None or s["trace_id"] == trace_id]
+        return spans[-limit:]
+
+
+class FileExporter:
+    """Appends finished spans to a JSON-lines file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), default=str) + "\n"
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(line)
+
+
+class Tracer:
+    def __init__(self, exporter):
+        self.exporter = exporter
+
+    def current_span(self) -> Optional[Span]:
+        return _current_span.get()
+
+    def start_span(self, name: str, kind: str = "internal", attributes: dict = None,
+                   parent: Optional[tuple] = None) -> Span:
+        """Create a span under `parent` (trace_id, span_id) or the current span."""
+        if parent is None:
+            current = _current_span.get()
+            parent = (current.trace_id, current.span_id) if current else (new_trace_id(), None)
+        return Span(name, kind, parent[0], parent[1], attributes)
+
+    def end_span(self, span: Span):
+        span.finish()
+        try:
+            self.exporter.export(span)
+        except Exception as e:
+            logger.warning("trace export of span %s failed: %s", span.name, e)
+
+    @contextmanager
+    def span(self, name: str, kind: str = "internal", attributes: dict = None, parent: Optional[tuple] = None):
+        span = self.start_span(name, kind, attributes, parent)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.status = "error"
+            span.attributes["error"] = repr(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            self.end_span(span)
+
+
+class TracingMiddleware:
+    """ASGI middleware that opens a server span per HTTP request."""
+
+    def __init__(self, app, tracer: Tracer):
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = None
+        for name, value in scope.get("headers", ()):
+            if name == b"traceparent":
+                incoming = parse_traceparent(value.decode("latin-1"))
+                break
+
+        attributes = {"http.method": scope["method"], "http.target": scope["path"]}
+        with self.tracer.span(f"{scope['method']} {scope['path']}", "server", attributes, incoming) as span:
+            async def send_with_traceparent(message):
+                if message["type"] == "http.response.start":
+                    span.attributes["http.status_code"] = message["status"]
+                    if message["status"] >= 500:
+                        span.status = "error"
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"traceparent", span.traceparent.encode())
+                    ]
+                await send(message)
+
+            await self.app(scope, receive, send_with_traceparent)
+            route = scope.get("route")
+            if route is not None and hasattr(route, "path"):
+                span.attributes["http.route"] = route.path
+                span.name = f"{scope['method']} {route.path}"
+
+
+def instrument_engine(engine, tracer: Tracer):
+    """Record a client span for every SQL statement executed on `engine`."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if tracer.current_span() is None:
+            return
+        span = tracer.start_span(
+            statement.split(None, 1)[0].upper() if statement else "SQL",
+            "client",
+            {"db.system": engine.dialect.name, "db.statement": statement[:1000], "db.executemany": executemany},
+        )
+        conn.info.setdefault("pokedaddy_spans", []).append(span)
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        spans = conn.info.get("pokedaddy_spans")
+        if spans:
+            span = spans.pop()
+            if cursor.rowcount is not None and cursor.rowcount >= 0:
+                span.attributes["db.rowcount"] = cursor.rowcount
+            tracer.end_span(span)
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(exception_context):
+        conn = exception_context.connection
+        spans = conn.info.get("pokedaddy_spans") if conn is not None else None
+        if spans:
+            span = spans.pop()
+            span.status = "error"
+            span.attributes["error"] = repr(exception_context.original_exception)
+            tracer.end_span(span)
@@ -0,0 +1,66 @@
+"""
+Heartbeat files for multi-process serving (serve.py).
+
+Each worker process rewrites `<state dir>/worker-<pid>.json` from its event loop every few
+seconds. The file records its slot, state ("ready" or "draining"), start time, requests
+served, and open connections and tasks. The write happens on the event loop, so a
+heartbeat that stops advancing means the loop is blocked even though the process is
+alive. The master replaces such workers and removes the files of workers that exit.
+The master keeps its own summary in `master.json`.
+
+Files are replaced atomically (write to a temporary name, then rename), so readers never
+see a partial file.
+"""
+
+import json
+import os
+import time
+from typing import List, Optional
+
+MASTER_FILE = "master.json"
+
+
+def write_state(path: str, state: dict):
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "w") as f:
+        json.dump(state, f)
+    os.replace(temporary, path)
+
+
+def heartbeat_path(directory: str, pid: int) -> str:
+    return os.path.join(directory, f"worker-{pid}.json")
+
+
+class Heartbeat:
+    """Writes one worker's heartbeat file"""
+
+    def __init__(self, directory: str, slot: int):
+        self.path = heartbeat_path(directory, os.getpid())
+        self.slot = slot
+        self.started_at = time.time()
+
+    def write(self, state: str, **stats):
+        write_state(self.path, {
+            "pid": os.getpid(), "slot": self.slot, "state": state,
+            "started_at": self.started_at, "heartbeat_at": time.time(), **stats,
+        })
+
+
+def read_state(path: str) -> Optional[dict]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def read_heartbeats(directory: str) -> List[dict]:
+    """Every worker's last heartbeat, by slot, with `age_seconds` since it was written"""
+    now = time.time()
+    heartbeats = []
+    for name in os.listdir(directory):
+        if name.startswith("worker-") and name.endswith(".json"):
+            state = read_state(os.path.join(directory, name))
+            if state is not None:
+                heartbeats.append({**state, "age_seconds": round(now - state["heartbeat_at"], 3)})
+    return sorted(heartbeats, key=lambda h: (h["slot"], h["started_at"]))